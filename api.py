@@ -0,0 +1,663 @@
+import gzip
+import hashlib
+import json
+from datetime import datetime
+
+import dateutil.parser
+from flask import Blueprint, Response, current_app, request, url_for
+from sqlalchemy import or_
+from sqlalchemy.orm.exc import NoResultFound
+from werkzeug.datastructures import MultiDict
+
+from artists import artist_cache_tags
+from dates import date_formatter
+from extensions import csrf, db, page_cache
+from jobs import queue
+from models import Artist, City, Show, State, Venue, artist_genre_association, genre_names, venue_genre_association
+from pagination import InvalidCursor, keyset_paginate, page_args, page_url
+from search import search
+from typeahead import typeahead
+from venues import venue_cache_tags
+from writes import artist_writer, venue_writer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+bp = Blueprint("api", __name__, url_prefix="/api/v1")
+csrf.exempt(bp)
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, message, **details):
+        super(ApiError, self).__init__(message)
+        self.status = status
+        self.message = message
+        self.details = details
+
+
+# ----------------------------------------------------------------------------#
+# Resources.
+# ----------------------------------------------------------------------------#
+
+
+class Resource(object):
+    """Column-level reads of one model.
+
+    `columns()` maps each public field to a SQL expression. Queries select
+    only the requested fields plus the paging key and return plain rows,
+    never ORM objects.
+    """
+
+    order = ()
+    list_fields = ()
+
+    def columns(self):
+        raise NotImplementedError
+
+    def fields(self, default):
+        """Validated `?fields=` selection, or `default`."""
+
+        columns = self.columns()
+        requested = request.args.get("fields")
+        if not requested:
+            return [f for f in (default or columns) if f in columns]
+
+        fields = list(dict.fromkeys(f.strip() for f in requested.split(",") if f.strip()))
+        unknown = [f for f in fields if f not in columns]
+        if unknown:
+            raise ApiError(400, "unknown fields", unknown=unknown, allowed=list(columns))
+
+        return fields
+
+    def select(self, fields):
+        columns = self.columns()
+        selected = fields + [c.key for c in self.order if c.key not in fields]
+
+        return self.joins(db.session.query(*[columns[f].label(f) for f in selected]), selected)
+
+    def joins(self, query, fields):
+        return query
+
+    def serialize(self, row, fields):
+        item = {f: getattr(row, f) for f in fields}
+        if "genres" in item:
+            item["genres"] = item["genres"].split(";") if item["genres"] else []
+
+        return item
+
+
+class EntityResource(Resource):
+
+    def __init__(self, model, assoc, fk, extra):
+        self.model = model
+        self.assoc = assoc
+        self.fk = fk
+        self.extra = extra
+        self.order = (model.name, model.id)
+        self.list_fields = ("id", "name", "city", "state", "genres")
+
+    def columns(self):
+        model = self.model
+        columns = {
+            "id": model.id,
+            "name": model.name,
+            "city": City.name,
+            "state": State.name,
+        }
+        columns.update((field, getattr(model, field)) for field in self.extra)
+        columns.update({
+            "genres": genre_names(model, self.assoc, self.fk),
+            "upcoming_shows_count": model.num_upcoming_shows,
+            "past_shows_count": model.num_past_shows,
+        })
+
+        return columns
+
+    def joins(self, query, fields):
+        query = query.select_from(self.model)
+        if "city" in fields or "state" in fields:
+            query = query.join(City, self.model.city_id == City.id)
+        if "state" in fields:
+            query = query.join(State, City.state_id == State.id)
+
+        return query
+
+
+class ShowResource(Resource):
+
+    def __init__(self):
+        self.order = (Show.start_time, Show.id)
+
+    def columns(self):
+        return {
+            "id": Show.id,
+            "start_time": Show.start_time,
+            "venue_id": Show.venue_id,
+            "venue_name": Venue.name,
+            "venue_image_link": Venue.image_link,
+            "artist_id": Show.artist_id,
+            "artist_name": Artist.name,
+            "artist_image_link": Artist.image_link,
+        }
+
+    def joins(self, query, fields):
+        query = query.select_from(Show)
+        if any(f.startswith("venue_") and f != "venue_id" for f in fields):
+            query = query.join(Venue, Show.venue_id == Venue.id)
+        if any(f.startswith("artist_") and f != "artist_id" for f in fields):
+            query = query.join(Artist, Show.artist_id == Artist.id)
+
+        return query
+
+
+venue_resource = EntityResource(Venue, venue_genre_association, "venue_id", [
+    "address", "phone", "website", "image_link", "facebook_link", "seeking_talent", "seeking_description",
+])
+artist_resource = EntityResource(Artist, artist_genre_association, "artist_id", [
+    "phone", "website", "image_link", "facebook_link", "seeking_venue", "seeking_description",
+])
+show_resource = ShowResource()
+
+# JSON field -> form field, so API writes go through the same validation as the HTML forms.
+VENUE_FORM_FIELDS = {
+    "name": "name", "city": "city", "state": "states", "address": "address", "phone": "phone",
+    "genres": "genres", "image_link": "image_link", "facebook_link": "facebook_link",
+    "seeking_talent": "seeking_talent", "seeking_description": "seeking_talent_description",
+}
+ARTIST_FORM_FIELDS = {
+    "name": "name", "city": "city", "state": "states", "phone": "phone", "genres": "genres",
+    "image_link": "image_link", "facebook_link": "facebook_link", "website": "website_link",
+    "seeking_venue": "seeking_venue", "seeking_description": "seeking_description",
+}
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def respond(payload, status=200, headers=None):
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=_json_default)
+
+    return Response(body, status=status, headers=headers, mimetype="application/json")
+
+
+def listing(resource, query, fields):
+    page = keyset_paginate(query, list(resource.order), **page_args("API_PER_PAGE", "API_MAX_PER_PAGE"))
+
+    links = []
+    if page.next_cursor:
+        links.append(f'<{page_url(True, after=page.next_cursor)}>; rel="next"')
+    if page.prev_cursor:
+        links.append(f'<{page_url(True, before=page.prev_cursor)}>; rel="prev"')
+
+    return respond({
+        "data": [resource.serialize(row, fields) for row in page.items],
+        "next": page.next_cursor,
+        "prev": page.prev_cursor,
+    }, headers={"Link": ", ".join(links)} if links else None)
+
+
+def searched(resource, kind):
+    term = request.args.get("q", "")
+    limit = min(request.args.get("limit", current_app.config["SEARCH_RESULT_LIMIT"], type=int),
+                current_app.config["SEARCH_RESULT_LIMIT"])
+    fields = resource.fields(resource.list_fields)
+
+    ids = search.match_ids(kind, term, max(1, limit))
+    rows = resource.select(fields).filter(resource.model.id.in_(ids)).all() if ids else []
+    rank = {entity_id: i for i, entity_id in enumerate(ids)}
+    rows.sort(key=lambda row: rank[row.id])
+
+    return respond({"data": [resource.serialize(row, fields) for row in rows], "count": len(rows)})
+
+
+def detail(resource, entity_id, show_fields):
+    fields = resource.fields(None)
+    row = resource.select(fields).filter(resource.model.id == entity_id).first()
+    if row is None:
+        raise ApiError(404, f"{resource.model.__tablename__.lower()} {entity_id} not found")
+
+    item = resource.serialize(row, fields)
+
+    if request.args.get("shows") != "0":
+        # The next and the latest DETAIL_PAST_SHOWS shows, like the pages; the rest are paged from /shows.
+        show_fk = getattr(Show, resource.fk)
+        shows = show_resource.select(show_fields).filter(show_fk == entity_id)
+        limit = current_app.config["DETAIL_PAST_SHOWS"]
+        now = datetime.now()
+        upcoming = shows.filter(Show.start_time > now).order_by(Show.start_time, Show.id).limit(limit).all()
+        past = shows.filter(Show.start_time <= now).order_by(Show.start_time.desc(), Show.id.desc()).limit(limit).all()
+        item["upcoming_shows"] = [show_resource.serialize(s, show_fields) for s in upcoming]
+        item["past_shows"] = [show_resource.serialize(s, show_fields) for s in reversed(past)]
+        item["shows"] = url_for("api.list_shows", _external=True, **{resource.fk: entity_id})
+
+    return respond({"data": item})
+
+
+def json_body():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        raise ApiError(400, "expected a JSON object")
+
+    return payload
+
+
+def bind_form(form_class, payload, mapping):
+    data = MultiDict()
+    for field, form_field in mapping.items():
+        value = payload.get(field)
+        if isinstance(value, list):
+            for v in value:
+                data.add(form_field, str(v))
+        elif isinstance(value, bool):
+            if value:
+                data.add(form_field, "y")
+        elif value is not None:
+            data.add(form_field, str(value))
+
+    return form_class(formdata=data, meta={"csrf": False})
+
+
+def field_errors(form, mapping):
+    names = {form_field: field for field, form_field in mapping.items()}
+
+    return {names.get(k, k): v for k, v in form.errors.items()}
+
+
+def validated_form(form_class, payload, mapping):
+    form = bind_form(form_class, payload, mapping)
+    if not form.validate():
+        raise ApiError(422, "validation failed", fields=field_errors(form, mapping))
+
+    return form
+
+
+def saved(writer, items):
+    """Run `writer` over [(id or None, form)] and commit; a missing id is a 404."""
+
+    try:
+        result = writer.save(items)
+    except NoResultFound as e:
+        db.session.rollback()
+        raise ApiError(404, str(e))
+    db.session.commit()
+
+    return result
+
+
+def bulk_save(writer, form_class, mapping, cache_tags):
+    """Validate every item of a bulk request, then write them all in one transaction.
+
+    Accepts a JSON array, or an object with the array under "data"; items
+    carrying an "id" update that row. Nothing is written unless every item
+    is valid.
+    """
+
+    payload = request.get_json(silent=True)
+    items = payload.get("data") if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ApiError(400, "expected a JSON array of objects")
+    if not items:
+        raise ApiError(400, "nothing to save")
+    if len(items) > current_app.config["API_BULK_MAX_ITEMS"]:
+        raise ApiError(413, f"at most {current_app.config['API_BULK_MAX_ITEMS']} items per request")
+
+    forms, errors = [], []
+    for index, item in enumerate(items):
+        entity_id = item.get("id")
+        if entity_id is not None and (isinstance(entity_id, bool) or not isinstance(entity_id, int)):
+            errors.append({"index": index, "fields": {"id": ["Not an integer."]}})
+            continue
+        form = bind_form(form_class, item, mapping)
+        if form.validate():
+            forms.append((entity_id, form))
+        else:
+            errors.append({"index": index, "fields": field_errors(form, mapping)})
+    if errors:
+        raise ApiError(422, "validation failed", items=errors)
+
+    result = saved(writer, forms)
+    page_cache.invalidate(*cache_tags(*{s.id for s in result}))
+
+    return respond({
+        "data": [{"id": s.id, "created": s.created} for s in result],
+        "created": sum(1 for s in result if s.created),
+        "updated": sum(1 for s in result if not s.created),
+    })
+
+
+def bulk_delete(model, job, writer, cache_tags):
+    """Queue the delete of every id in the request, DELETE_BATCH_SIZE ids per job.
+
+    Accepts a JSON array of ids, or an object with the array under "ids".
+    Ids that do not exist are reported rather than refused, so a cleanup
+    that is retried gets the same answer. The page cache and indexes of
+    this process drop the rows before the response, as the worker's
+    clearing only reaches the worker's own.
+    """
+
+    payload = request.get_json(silent=True)
+    ids = payload.get("ids") if isinstance(payload, dict) else payload
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ApiError(400, "expected a JSON array of ids")
+    if not ids:
+        raise ApiError(400, "nothing to delete")
+    if len(ids) > current_app.config["API_DELETE_MAX_IDS"]:
+        raise ApiError(413, f"at most {current_app.config['API_DELETE_MAX_IDS']} ids per request")
+
+    ids = list(dict.fromkeys(ids))
+    size = current_app.config["DELETE_BATCH_SIZE"]
+    # Looked up a batch at a time, like the jobs delete them: one IN (...)
+    # over every id would pass SQLite's limit on bound parameters.
+    found = set()
+    for start in range(0, len(ids), size):
+        found.update(i for i, in db.session.query(model.id).filter(model.id.in_(ids[start:start + size])))
+    deleted = [i for i in ids if i in found]
+    batches = [deleted[i:i + size] for i in range(0, len(deleted), size)]
+
+    queue.enqueue_many(job, [{"ids": batch} for batch in batches])
+    writer.unlist(deleted)
+    tags = list(dict.fromkeys(tag for batch in batches for tag in cache_tags(*batch)))
+    db.session.commit()
+    page_cache.invalidate(*tags)
+
+    return respond({"data": deleted, "missing": [i for i in ids if i not in found], "jobs": len(batches)},
+                   status=202)
+
+
+def created(resource, entity_id, endpoint, show_fields):
+    response = detail(resource, entity_id, show_fields)
+    response.status_code = 201
+    response.headers["Location"] = url_for(endpoint, _external=True, **{resource.fk: entity_id})
+
+    return response
+
+
+def _datetime_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date_formatter.to_stored(dateutil.parser.parse(value))
+    except (ValueError, OverflowError):
+        raise ApiError(400, f"invalid datetime for '{name}'")
+
+# ----------------------------------------------------------------------------#
+# Venues.
+# ----------------------------------------------------------------------------#
+
+
+VENUE_SHOW_FIELDS = ["id", "start_time", "artist_id", "artist_name", "artist_image_link"]
+ARTIST_SHOW_FIELDS = ["id", "start_time", "venue_id", "venue_name", "venue_image_link"]
+
+
+@bp.route("/venues")
+def list_venues():
+    fields = venue_resource.fields(venue_resource.list_fields)
+
+    return listing(venue_resource, venue_resource.select(fields), fields)
+
+
+@bp.route("/venues/search")
+def search_venues():
+    return searched(venue_resource, "venue")
+
+
+@bp.route("/venues/<int:venue_id>")
+def get_venue(venue_id):
+    return detail(venue_resource, venue_id, VENUE_SHOW_FIELDS)
+
+
+@bp.route("/venues", methods=["POST"])
+def create_venue():
+    from forms import VenueForm
+
+    form = validated_form(VenueForm, json_body(), VENUE_FORM_FIELDS)
+    venue_id, is_new = saved(venue_writer, [(None, form)])[0]
+
+    page_cache.invalidate(*venue_cache_tags(venue_id))
+
+    response = created(venue_resource, venue_id, "api.get_venue", VENUE_SHOW_FIELDS)
+    if not is_new:
+        # A venue of that name already existed and was updated in place.
+        response.status_code = 200
+
+    return response
+
+
+@bp.route("/venues/<int:venue_id>", methods=["PUT"])
+def update_venue(venue_id):
+    from forms import VenueForm
+
+    form = validated_form(VenueForm, json_body(), VENUE_FORM_FIELDS)
+    saved(venue_writer, [(venue_id, form)])
+
+    page_cache.invalidate(*venue_cache_tags(venue_id))
+
+    return detail(venue_resource, venue_id, VENUE_SHOW_FIELDS)
+
+
+@bp.route("/venues/bulk", methods=["POST"])
+def bulk_venues():
+    from forms import VenueForm
+
+    return bulk_save(venue_writer, VenueForm, VENUE_FORM_FIELDS, venue_cache_tags)
+
+
+@bp.route("/venues/delete", methods=["POST"])
+def delete_venues():
+    return bulk_delete(Venue, "delete_venues", venue_writer, venue_cache_tags)
+
+# ----------------------------------------------------------------------------#
+# Artists.
+# ----------------------------------------------------------------------------#
+
+
+@bp.route("/artists")
+def list_artists():
+    fields = artist_resource.fields(artist_resource.list_fields)
+
+    return listing(artist_resource, artist_resource.select(fields), fields)
+
+
+@bp.route("/artists/search")
+def search_artists():
+    return searched(artist_resource, "artist")
+
+
+@bp.route("/artists/<int:artist_id>")
+def get_artist(artist_id):
+    return detail(artist_resource, artist_id, ARTIST_SHOW_FIELDS)
+
+
+@bp.route("/artists", methods=["POST"])
+def create_artist():
+    from forms import ArtistForm
+
+    form = validated_form(ArtistForm, json_body(), ARTIST_FORM_FIELDS)
+    artist_id, is_new = saved(artist_writer, [(None, form)])[0]
+
+    page_cache.invalidate(*artist_cache_tags(artist_id))
+
+    response = created(artist_resource, artist_id, "api.get_artist", ARTIST_SHOW_FIELDS)
+    if not is_new:
+        # An artist of that name already existed and was updated in place.
+        response.status_code = 200
+
+    return response
+
+
+@bp.route("/artists/<int:artist_id>", methods=["PUT"])
+def update_artist(artist_id):
+    from forms import ArtistForm
+
+    form = validated_form(ArtistForm, json_body(), ARTIST_FORM_FIELDS)
+    saved(artist_writer, [(artist_id, form)])
+
+    page_cache.invalidate(*artist_cache_tags(artist_id))
+
+    return detail(artist_resource, artist_id, ARTIST_SHOW_FIELDS)
+
+
+@bp.route("/artists/bulk", methods=["POST"])
+def bulk_artists():
+    from forms import ArtistForm
+
+    return bulk_save(artist_writer, ArtistForm, ARTIST_FORM_FIELDS, artist_cache_tags)
+
+
+@bp.route("/artists/delete", methods=["POST"])
+def delete_artists():
+    return bulk_delete(Artist, "delete_artists", artist_writer, artist_cache_tags)
+
+# ----------------------------------------------------------------------------#
+# Shows.
+# ----------------------------------------------------------------------------#
+
+
+@bp.route("/shows")
+def list_shows():
+    fields = show_resource.fields(None)
+    query = show_resource.select(fields)
+
+    starts, ends = _datetime_arg("from"), _datetime_arg("to")
+    if starts:
+        query = query.filter(Show.start_time >= starts)
+    if ends:
+        query = query.filter(Show.start_time < ends)
+    for arg in ("venue_id", "artist_id"):
+        value = request.args.get(arg, type=int)
+        if value is not None:
+            query = query.filter(getattr(Show, arg) == value)
+
+    return listing(show_resource, query, fields)
+
+
+@bp.route("/shows/search")
+def search_shows():
+    term = request.args.get("q", "")
+    fields = show_resource.fields(None)
+    venue_ids = search.match_ids("venue", term)
+    artist_ids = search.match_ids("artist", term)
+
+    rows = []
+    if venue_ids or artist_ids:
+        rows = show_resource.select(fields) \
+            .filter(or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids))) \
+            .order_by(Show.start_time.desc(), Show.id.desc()) \
+            .limit(current_app.config["SEARCH_RESULT_LIMIT"]).all()
+
+    return respond({"data": [show_resource.serialize(row, fields) for row in rows], "count": len(rows)})
+
+
+@bp.route("/shows", methods=["POST"])
+def create_show():
+    payload = json_body()
+
+    errors = {}
+    ids = {}
+    for field, model in (("artist_id", Artist), ("venue_id", Venue)):
+        try:
+            ids[field] = int(payload.get(field))
+        except (TypeError, ValueError):
+            errors[field] = ["This field is required."]
+            continue
+        if db.session.query(model.id).filter(model.id == ids[field]).scalar() is None:
+            errors[field] = [f"No {model.__tablename__.lower()} with id {ids[field]}."]
+
+    try:
+        start_time = date_formatter.to_stored(dateutil.parser.parse(payload.get("start_time") or ""))
+    except (ValueError, OverflowError, TypeError):
+        errors["start_time"] = ["Not a valid datetime value."]
+
+    if errors:
+        raise ApiError(422, "validation failed", fields=errors)
+
+    show = Show(artist_id=ids["artist_id"], venue_id=ids["venue_id"], start_time=start_time)
+    db.session.add(show)
+    db.session.commit()
+
+    page_cache.invalidate("shows", "venues", f"venue:{show.venue_id}", f"artist:{show.artist_id}")
+
+    fields = list(show_resource.columns())
+    row = show_resource.select(fields).filter(Show.id == show.id).one()
+
+    return respond({"data": show_resource.serialize(row, fields)}, status=201)
+
+# ----------------------------------------------------------------------------#
+# Typeahead.
+# ----------------------------------------------------------------------------#
+
+
+@bp.route("/typeahead")
+def typeahead_search():
+    config = current_app.config
+    limit = max(1, min(request.args.get("limit", config["TYPEAHEAD_LIMIT"], type=int), config["TYPEAHEAD_MAX_LIMIT"]))
+    found = typeahead.search(request.args.get("q", ""), limit)
+
+    response = respond({
+        plural: [{"id": entity_id, "name": name} for entity_id, name in found[kind]]
+        for kind, plural in (("venue", "venues"), ("artist", "artists"), ("city", "cities"), ("genre", "genres"))
+    })
+    # Short, so backspacing over a prefix is answered by the browser.
+    response.cache_control.public = True
+    response.cache_control.max_age = config["TYPEAHEAD_MAX_AGE"]
+
+    return response
+
+# ----------------------------------------------------------------------------#
+# Errors, conditional GET and compression.
+# ----------------------------------------------------------------------------#
+
+
+@bp.errorhandler(ApiError)
+def api_error(error):
+    return respond(dict({"error": error.message}, **error.details), status=error.status)
+
+
+@bp.errorhandler(InvalidCursor)
+def invalid_cursor(error):
+    return respond({"error": "invalid page cursor"}, status=400)
+
+
+@bp.after_request
+def finish_response(response):
+    if response.direct_passthrough or response.mimetype != "application/json":
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    if request.method in ("GET", "HEAD") and response.status_code == 200:
+        # Weak, because the same entity is served under several encodings.
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+        if response.cache_control.max_age is None:
+            response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+    body = response.get_data()
+    if len(body) < current_app.config["API_COMPRESS_MIN_SIZE"]:
+        return response
+
+    encoding = request.accept_encodings.best_match(["br", "gzip"] if brotli is not None else ["gzip"])
+    if encoding == "br":
+        response.set_data(brotli.compress(body, quality=current_app.config["API_BROTLI_QUALITY"]))
+    elif encoding == "gzip":
+        response.set_data(gzip.compress(body, compresslevel=current_app.config["API_GZIP_LEVEL"]))
+    else:
+        return response
+
+    response.headers["Content-Encoding"] = encoding
+
+    return response
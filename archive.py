@@ -0,0 +1,97 @@
+from datetime import datetime
+
+from sqlalchemy import literal, select
+
+from extensions import db, page_cache
+from models import ArchivedShow, Artist, Show, Venue, refresh_show_counters
+from pagination import encode_cursor, keyset_paginate
+
+
+# Past shows move from Show to ShowArchive in batches, a transaction each,
+# so the hot table and its indexes only hold recent history. Detail pages
+# show the latest DETAIL_PAST_SHOWS past shows; older ones are paged from
+# both tables by past_shows().
+
+COLUMNS = ("id", "start_time", "artist_id", "venue_id")
+
+MAX_ID = 2 ** 31 - 1
+
+
+def archive_shows(before, batch_size=1000, session=None, report=None):
+    """Move the shows that started before `before` into ShowArchive; returns how many moved.
+
+    Each batch copies and deletes the oldest `batch_size` shows, recounts
+    the venues and artists they belonged to and commits. A run that stops
+    part way leaves every show in exactly one of the two tables, so it is
+    resumed by running it again.
+    """
+
+    session = session or db.session
+    show = Show.__table__
+    archive = ArchivedShow.__table__
+    moved = 0
+
+    while True:
+        rows = session.query(Show.id, Show.venue_id, Show.artist_id) \
+            .filter(Show.start_time < before) \
+            .order_by(Show.start_time, Show.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        ids = [show_id for show_id, _, _ in rows]
+        venue_ids = {venue_id for _, venue_id, _ in rows}
+        artist_ids = {artist_id for _, _, artist_id in rows}
+
+        # start_time in both statements lets a partitioned Show skip the newer months.
+        batch = select([show.c[c] for c in COLUMNS] + [literal(datetime.now()).label("archived_at")]) \
+            .where(show.c.id.in_(ids)).where(show.c.start_time < before)
+        session.execute(archive.insert().from_select(list(COLUMNS) + ["archived_at"], batch))
+        session.execute(show.delete().where(show.c.id.in_(ids)).where(show.c.start_time < before))
+        refresh_show_counters(venue_ids=venue_ids, artist_ids=artist_ids)
+        session.commit()
+
+        page_cache.invalidate("venues", "shows", *[f"venue:{i}" for i in venue_ids],
+                              *[f"artist:{i}" for i in artist_ids])
+        moved += len(rows)
+        if report:
+            report(f"Archived {moved} shows")
+
+    return moved
+
+
+def past_shows(fk, entity_id, per_page, after=None, before=None, now=None):
+    """One keyset page of a venue's or artist's past shows, live and archived, by start time.
+
+    `fk` is "venue_id" or "artist_id". Rows carry the show columns and the
+    name and image link of its venue and artist. Walking `before` cursors
+    goes back in time, from the detail page's oldest past show on.
+    """
+
+    now = now or datetime.now()
+    newest = after is None and before is None
+    if newest:
+        # No cursor starts at the newest past show.
+        before = encode_cursor([now, MAX_ID])
+
+    live = select([Show.__table__.c[c] for c in COLUMNS]) \
+        .where(Show.__table__.c[fk] == entity_id).where(Show.__table__.c.start_time <= now)
+    archived = select([ArchivedShow.__table__.c[c] for c in COLUMNS]) \
+        .where(ArchivedShow.__table__.c[fk] == entity_id)
+    shows = live.union_all(archived).alias("past")
+
+    query = db.session.query(shows, Venue.name.label("venue_name"), Venue.image_link.label("venue_image_link"),
+                             Artist.name.label("artist_name"), Artist.image_link.label("artist_image_link")) \
+        .join(Venue, shows.c.venue_id == Venue.id) \
+        .join(Artist, shows.c.artist_id == Artist.id)
+
+    page = keyset_paginate(query, [shows.c.start_time, shows.c.id], per_page, after=after, before=before)
+    if newest:
+        page.next_cursor = None
+
+    return page
+
+
+def older_cursor(past):
+    """Cursor for the past shows before the oldest of `past`, the ones a detail page shows."""
+
+    return encode_cursor([past[0].start_time, past[0].id]) if past else None
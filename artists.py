@@ -0,0 +1,188 @@
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, url_for
+from sqlalchemy.orm.exc import NoResultFound
+
+from archive import older_cursor, past_shows
+from extensions import csrf, db, page_cache
+from jobs import queue
+from models import Artist, Show
+from pagination import keyset_paginate, page_args
+from reads import read_pool
+from recommend import recommender
+from search import search
+from writes import artist_writer
+
+
+bp = Blueprint("artists", __name__)
+
+
+def artist_cache_tags(*artist_ids):
+    """Page-cache tags touched by a change to these artists, including venues they played."""
+
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id.in_(artist_ids)).distinct()
+
+    return ["artists", "shows"] + [f"artist:{i}" for i in artist_ids] + [f"venue:{v}" for v, in venue_ids]
+
+
+@bp.route("/artists")
+@page_cache.cached("artists")
+def artists():
+
+    page = keyset_paginate(Artist.query, [Artist.name, Artist.id], **page_args("ARTISTS_PER_PAGE"))
+    read_pool.release()
+
+    return render_template("pages/artists.html", artists=page.items, page=page)
+
+
+@csrf.exempt
+@bp.route("/artists/search", methods=["POST"])
+def search_artists():
+
+    results = search.artists(request.form.get("search_term", ""))
+    read_pool.release()
+
+    response = {
+        "count": len(results),
+        "data": results,
+    }
+
+    return render_template(
+        "pages/search_artists.html",
+        results=response,
+        search_term=request.form.get("search_term", ""),
+    )
+
+
+@bp.route("/artists/<int:artist_id>")
+@page_cache.cached("artist:{artist_id}", timeout="RECOMMEND_PAGE_CACHE_TIMEOUT")
+def show_artist(artist_id):
+
+    try:
+        artist, shows = Artist.get_with_shows(artist_id, current_app.config["DETAIL_PAST_SHOWS"])
+    except NoResultFound:
+        abort(404)
+
+    older = older_cursor(shows["past_shows"]) if shows["has_older"] else None
+
+    recommended = [
+        ("Venues that fit", "venues", recommender.recommend("artist", artist_id, "venue")),
+        ("Similar artists", "artists", recommender.recommend("artist", artist_id, "artist")),
+    ]
+
+    return render_template("pages/show_artist.html", artist=artist, older=older, recommended=recommended, **shows)
+
+
+@bp.route("/artists/<int:artist_id>/shows/past")
+@page_cache.cached("artist:{artist_id}")
+def artist_past_shows(artist_id):
+
+    artist = Artist.query.get_or_404(artist_id)
+    page = past_shows("artist_id", artist_id, **page_args("SHOWS_PER_PAGE"))
+    read_pool.release()
+
+    return render_template("pages/past_shows.html", name=artist.name, kind="artist", page=page,
+                           back=url_for("artists.show_artist", artist_id=artist_id))
+
+
+@bp.route("/artists/create", methods=["GET"])
+def create_artist_form():
+    from forms import ArtistForm
+
+    form = ArtistForm()
+    return render_template("forms/new_artist.html", form=form)
+
+
+@bp.route("/artists/create", methods=["POST"])
+def create_artist_submission():
+    from forms import ArtistForm
+
+    with db.session.no_autoflush:
+
+        form = ArtistForm(request.form)
+
+        if request.method == "POST" and form.validate():
+            try:
+                artist_id, _ = artist_writer.save([(None, form)])[0]
+                db.session.commit()
+
+                page_cache.invalidate(*artist_cache_tags(artist_id))
+            except:
+                flash('An error occurred. Artist '+ form.name.data + ' could not be listed.')
+                db.session.rollback()
+                return redirect(url_for('artists.create_artist_submission'))
+
+        return redirect(url_for('artists.artists'))
+
+
+@csrf.exempt
+@bp.route("/artists/<int:artist_id>", methods=['DELETE'])
+def delete_artist(artist_id):
+
+    if db.session.query(Artist.id).filter(Artist.id == artist_id).scalar() is None:
+        abort(404)
+
+    # The shows go with it, which can be slow; the worker does the delete. The
+    # caches and indexes of this process are cleared now, the worker only reaches its own.
+    try:
+        queue.enqueue("delete_artist", artist_id=artist_id)
+        artist_writer.unlist([artist_id])
+        tags = artist_cache_tags(artist_id)
+        db.session.commit()
+    except Exception as e:
+        print(f'Error ==> {e}')
+        flash('An error occurred. Artist could not be deleted.')
+        db.session.rollback()
+        abort(400)
+
+    page_cache.invalidate(*tags)
+    return "Accepted", 202
+
+
+@bp.route("/artists/<int:artist_id>/edit", methods=["GET"])
+def edit_artist(artist_id):
+    from forms import ArtistForm
+
+    with db.session.no_autoflush:
+
+        a = Artist.query.filter_by(id=artist_id).one()
+        artist = {
+            "id": a.id,
+            "name": a.name,
+            "genres": [g.name for g in a.genres],
+            "city": a.city.name,
+            "states": a.city.state.name,
+            "phone": a.phone,
+            "website_link": a.website,
+            "facebook_link": a.facebook_link,
+            "seeking_venue": a.seeking_venue,
+            "seeking_description": a.seeking_description,
+            "image_link": a.image_link,
+        }
+        form = ArtistForm(data=artist)
+
+        return render_template("forms/edit_artist.html", form=form, artist=artist)
+
+
+@bp.route("/artists/<int:artist_id>/edit", methods=["POST"])
+def edit_artist_submission(artist_id):
+    from forms import ArtistForm
+
+    with db.session.no_autoflush:
+
+        form = ArtistForm(request.form)
+
+        if request.method == "POST" and form.validate():
+            try:
+                artist_writer.save([(artist_id, form)])
+                db.session.commit()
+
+                page_cache.invalidate(*artist_cache_tags(artist_id))
+            except NoResultFound:
+                db.session.rollback()
+                abort(404)
+            except Exception as e:
+                flash('An error occurred. Artist '+ form.name.data + ' could not be updated.')
+                print(e)
+                db.session.rollback()
+                return redirect(url_for('artists.artists'))
+
+        return redirect(url_for("artists.show_artist", artist_id=artist_id))
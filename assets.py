@@ -0,0 +1,231 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+
+bp = Blueprint("assets", __name__)
+
+# Bundles per layout: output name -> files under static/, concatenated in order.
+BUNDLES = {
+    "main.css": [
+        "css/bootstrap.min.css", "css/layout.main.css", "css/main.css", "css/main.responsive.css",
+        "css/main.quickfix.css",
+    ],
+    "main.js": [
+        "js/libs/jquery-1.11.1.min.js", "js/libs/bootstrap-3.1.1.min.js", "js/libs/moment.min.js",
+        "js/plugins.js", "js/script.js",
+    ],
+}
+
+# Served on their own, still fingerprinted.
+FILES = ["js/libs/modernizr-2.8.2.min.js", "js/libs/respond-1.4.2.min.js", "img/front-splash.jpg"]
+
+# Build output, under the static folder.
+OUTPUT = "dist"
+MANIFEST = "manifest.json"
+
+# Formats that gain from gzip/brotli; images and woff are compressed already.
+COMPRESS = (".css", ".js", ".svg", ".eot", ".ttf", ".otf")
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+SOURCE_MAP = re.compile(r"^[ \t]*//[#@] sourceMappingURL=.*$", re.M)
+
+
+def _minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+
+    # Conservative fallback: comments (but not /*! license banners */) and
+    # whitespace only. Space before ':' is kept, since "a :hover" and
+    # "a:hover" are different selectors.
+    text = re.sub(r"/\*(?!!).*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+
+    return text.replace(";}", "}").strip()
+
+
+def _minify_js(text):
+    text = SOURCE_MAP.sub("", text)
+
+    return rjsmin.jsmin(text) if rjsmin is not None else text.strip()
+
+
+class Builder(object):
+    """Writes bundles and fingerprinted copies to static/dist, next to their .gz/.br variants.
+
+    Names get the first 10 hex digits of the content's sha256, so a
+    changed file gets a new URL and every URL can be cached forever.
+    Files that CSS refers to through url() (fonts, images) are
+    fingerprinted as well and the references rewritten.
+    """
+
+    def __init__(self, static_folder):
+        self.static = static_folder
+        self.output = os.path.join(static_folder, OUTPUT)
+        self.manifest = {}
+
+    def build(self):
+        os.makedirs(self.output, exist_ok=True)
+
+        for name in FILES:
+            self.fingerprint(name)
+        for name, sources in BUNDLES.items():
+            self.bundle(name, sources)
+
+        self._write(MANIFEST, json.dumps(self.manifest, indent=2, sort_keys=True).encode("utf-8"), hashed=False)
+
+        return self.manifest
+
+    def clean(self):
+        """Delete build output no longer named in the manifest; returns how many files went."""
+
+        keep = {MANIFEST} | set(self.manifest.values())
+        keep |= {name + ext for name in keep for ext in (".gz", ".br")}
+
+        removed = 0
+        for root, _, names in os.walk(self.output):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.relpath(path, self.output).replace(os.sep, "/") not in keep:
+                    os.unlink(path)
+                    removed += 1
+
+        return removed
+
+    def fingerprint(self, name):
+        if name not in self.manifest:
+            with open(os.path.join(self.static, name), "rb") as f:
+                self.manifest[name] = self._write(name, f.read())
+
+        return self.manifest[name]
+
+    def bundle(self, name, sources):
+        parts = []
+        for source in sources:
+            with open(os.path.join(self.static, source), encoding="utf-8") as f:
+                text = f.read()
+            if name.endswith(".css"):
+                parts.append(_minify_css(self._rewrite_urls(text, source)))
+            else:
+                parts.append(_minify_js(text))
+
+        # ';' keeps a file without a trailing semicolon from running into the next.
+        body = "\n".join(parts) if name.endswith(".css") else ";\n".join(parts)
+        self.manifest[name] = self._write(name, body.encode("utf-8"))
+
+    def _rewrite_urls(self, text, source):
+        def replace(match):
+            url = match.group(2).strip()
+            if re.match(r"^(data:|[a-z]+:|//|/|#)", url, re.I):
+                return match.group(0)
+
+            path, suffix = re.match(r"^([^?#]*)(.*)$", url).groups()
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+            if os.path.isfile(os.path.join(self.static, target)):
+                # Relative to the output directory, where the bundle lives.
+                return f'url("{self.fingerprint(target)}{suffix}")'
+
+            return f'url("../{target}{suffix}")'
+
+        return CSS_URL.sub(replace, text)
+
+    def _write(self, name, data, hashed=True):
+        if hashed:
+            stem, ext = posixpath.splitext(name)
+            name = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+        path = os.path.join(self.output, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+        if name.endswith(COMPRESS):
+            with open(path + ".gz", "wb") as f:
+                # mtime=0 keeps the .gz byte-identical across builds.
+                f.write(gzip.compress(data, 9, mtime=0))
+            if brotli is not None:
+                with open(path + ".br", "wb") as f:
+                    f.write(brotli.compress(data, quality=11))
+
+        return name
+
+
+class Assets(object):
+    """Resolves asset names to fingerprinted URLs from the build manifest.
+
+    Without a manifest (no `flask build-assets` yet, or ASSETS_DEBUG) the
+    source files are linked one by one, so local edits show up on reload.
+    """
+
+    def __init__(self):
+        self.manifest = {}
+
+    def init_app(self, app):
+        self.manifest = {}
+        path = os.path.join(app.static_folder, OUTPUT, MANIFEST)
+        if not app.config.get("ASSETS_DEBUG") and os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+        app.jinja_env.globals.update(asset_url=self.url, asset_urls=self.urls)
+
+    def url(self, name):
+        if name in self.manifest:
+            return url_for("assets.built", filename=self.manifest[name])
+
+        return url_for("static", filename=name)
+
+    def urls(self, bundle):
+        """URLs to include for `bundle`: the built file, or its sources in order."""
+
+        if bundle in self.manifest:
+            return [self.url(bundle)]
+
+        return [url_for("static", filename=source) for source in BUNDLES[bundle]]
+
+
+asset_manifest = Assets()
+
+
+@bp.route(f"/static/{OUTPUT}/<path:filename>")
+def built(filename):
+    directory = os.path.join(current_app.static_folder, OUTPUT)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    # Precompressed variants written at build time; the best one the client takes.
+    for encoding, ext in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(directory, filename + ext)):
+            response = send_from_directory(directory, filename + ext, mimetype=mimetype)
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype)
+
+    # The name changes whenever the content does.
+    response.headers["Cache-Control"] = f"public, max-age={current_app.config['ASSETS_MAX_AGE']}, immutable"
+    response.vary.add("Accept-Encoding")
+
+    return response
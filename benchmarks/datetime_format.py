@@ -0,0 +1,100 @@
+"""Measure the per-call cost of the `datetime` template filter on a large show listing.
+
+    python -m benchmarks.datetime_format --shows 10000 --runs 5
+
+Formats the start time of every show in a synthetic listing, the way
+shows.html does, three ways: Babel's format_datetime with the pattern
+string (the filter before the formatter existed), the formatter on a
+cold cache (every pattern compiled and every string formatted once), and
+the formatter again on the warm cache, as when the listing is rendered a
+second time. Calls are made inside a request context, as from a
+template. Start times are drawn like benchmarks.seed draws them, on the
+quarter hour.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+
+def show_times(count, rng_seed=42):
+    rng = random.Random(rng_seed)
+    now = datetime.now().replace(second=0, microsecond=0)
+
+    return [now.replace(minute=0) + timedelta(minutes=15 * rng.randint(-365 * 24 * 4, 180 * 24 * 4))
+            for _ in range(count)]
+
+
+def per_call_us(fn, values, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(values)
+        timings.append((time.perf_counter() - start) / len(values) * 1e6)
+
+    return {"median": round(statistics.median(timings), 2), "min": round(min(timings), 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--shows", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--format", default="full", help="the filter argument, as in |datetime('full')")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    import babel.dates
+    from flask import Flask
+
+    from dates import PATTERNS, DateFormatter
+
+    values = show_times(args.shows)
+    pattern = PATTERNS.get(args.format, args.format)
+    locale = DateFormatter().locale
+
+    def babel_filter(values):
+        for value in values:
+            babel.dates.format_datetime(value, pattern, locale=locale)
+
+    def cold(values):
+        fresh = DateFormatter()
+        for value in values:
+            fresh.format(value, args.format)
+
+    warm_formatter = DateFormatter()
+
+    def warm(values):
+        for value in values:
+            warm_formatter.format(value, args.format)
+
+    # Templates render inside a request, where the formatter resolves its locale.
+    with Flask(__name__).test_request_context():
+        warm(values)
+        report = {
+            "shows": args.shows,
+            "distinct_times": len(set(values)),
+            "format": args.format,
+            "per_call_us": {
+                "babel": per_call_us(babel_filter, values, args.runs),
+                "formatter_cold": per_call_us(cold, values, args.runs),
+                "formatter_warm": per_call_us(warm, values, args.runs),
+            },
+            "cache": warm_formatter.snapshot(),
+        }
+    calls = report["per_call_us"]
+    report["speedup"] = {name: round(calls["babel"]["median"] / calls[name]["median"], 1)
+                         for name in ("formatter_cold", "formatter_warm")}
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Compare throughput of the listing and search views with the read pool on and off.
+
+    python -m benchmarks.reads --concurrency 32 --pool-size 4 --requests 2000
+
+Seeds a throwaway database, then replays the same mix of /venues,
+/artists, /shows and the three searches at --concurrency, first on the
+plain synchronous path (READS_ASYNC = False) and then with the read pool.
+The engine gets a pool of --pool-size connections and no overflow, so on
+the default SQLite stand-in the connection cap of a server database is
+in play too, and --latency-ms adds the network round trip SQLite lacks
+to every statement. The page cache is off so every request reaches the
+database.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.run import Scenario, run_load, seed_app, summarize
+from benchmarks.seed import DEFAULT_SIZES
+
+
+READ_MIX = {
+    "venues": 10, "artists": 10, "shows": 10, "search_venues": 10, "search_artists": 10, "search_shows": 20,
+}
+
+SETTINGS = """
+from sqlalchemy.pool import QueuePool
+SQLALCHEMY_ENGINE_OPTIONS = {{
+    "poolclass": QueuePool, "pool_size": {pool_size}, "max_overflow": 0, "pool_timeout": 60,
+    "connect_args": {{"check_same_thread": False}},
+}}
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--venues", type=int, default=DEFAULT_SIZES["venues"])
+    parser.add_argument("--artists", type=int, default=DEFAULT_SIZES["artists"])
+    parser.add_argument("--shows", type=int, default=DEFAULT_SIZES["shows"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="simulated round trip per statement")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    fd, database = tempfile.mkstemp(suffix=".db", prefix="fyyur-reads-")
+    os.close(fd)
+    fd, settings = tempfile.mkstemp(suffix=".py", prefix="fyyur-reads-")
+    with os.fdopen(fd, "w") as f:
+        f.write(SETTINGS.format(pool_size=args.pool_size))
+    os.environ.update(DATABASE_URL=f"sqlite:///{database}", FYYUR_SETTINGS=settings)
+
+    from sqlalchemy import event
+
+    from app import create_app
+    from extensions import page_cache, pool, profiler
+    from reads import read_pool
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, PAGE_CACHE_TYPE="null")
+    page_cache.init_app(app)
+    profiler.slow_ms = None
+
+    try:
+        sizes = dict(DEFAULT_SIZES, venues=args.venues, artists=args.artists, shows=args.shows)
+        sizes, _ = seed_app(app, sizes, args.seed)
+
+        if args.latency_ms:
+            # Sleeping releases the GIL, like waiting on a socket would.
+            event.listen(pool.engine, "before_cursor_execute", lambda *_: time.sleep(args.latency_ms / 1000))
+
+        held = []
+
+        def checkout(dbapi_connection, record, proxy):
+            record.info["checked_out"] = time.perf_counter()
+
+        def checkin(dbapi_connection, record):
+            if "checked_out" in record.info:
+                held.append((time.perf_counter() - record.info.pop("checked_out")) * 1000)
+
+        event.listen(pool.engine, "checkout", checkout)
+        event.listen(pool.engine, "checkin", checkin)
+
+        report = {"concurrency": args.concurrency, "pool_size": args.pool_size, "latency_ms": args.latency_ms,
+                  "sizes": sizes}
+        for name, enabled in (("sync", False), ("read_pool", True)):
+            app.config["READS_ASYNC"] = enabled
+            read_pool.init_app(app)
+            # The same request plan for both runs.
+            scenario = Scenario(app, sizes, random.Random(args.seed))
+            held.clear()
+            report[name] = run_load(app, scenario, args.requests, args.concurrency, READ_MIX)
+            # How long each checkout kept a pooled connection from everyone else.
+            report[name]["connection_held_ms"] = {key.replace("_ms", ""): value
+                                                  for key, value in summarize(held).items() if key != "requests"}
+    finally:
+        os.unlink(database)
+        os.unlink(settings)
+
+    report["speedup"] = round(report["read_pool"]["throughput_rps"] / report["sync"]["throughput_rps"], 2)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Measure top-k recommendation queries over a large synthetic catalogue.
+
+    python -m benchmarks.recommend --entities 100000 --genres 20 --queries 200
+
+Fills the genre vectors of one kind directly, without a database, with
+each row drawing one to four genres, a city and a seeking flag. It then
+times the build of the NumPy mirror, a top-k query on each path and a
+single-row update. The Python path is the fallback used when NumPy is
+not installed; without NumPy only that path is timed.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+
+def per_query_ms(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {"median": round(statistics.median(timings), 3), "max": round(max(timings), 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--entities", type=int, default=100000)
+    parser.add_argument("--genres", type=int, default=20)
+    parser.add_argument("--cities", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=6)
+    parser.add_argument("--metric", choices=["jaccard", "cosine"], default="jaccard")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    import recommend
+    from recommend import GenreVectors, Profile
+
+    rng = random.Random(args.seed)
+
+    def profile(i):
+        genres = rng.sample(range(args.genres), rng.randint(1, min(4, args.genres)))
+        return Profile(f"entity {i}", genres, rng.randint(1, args.cities), rng.random() < 0.3)
+
+    vectors = GenreVectors({})
+    start = time.perf_counter()
+    for i in range(args.entities):
+        vectors.set(i, profile(i))
+    report = {"entities": args.entities, "genres": args.genres, "limit": args.limit, "metric": args.metric,
+              "load_s": round(time.perf_counter() - start, 2)}
+
+    queries = [(vectors.encode(rng.sample(range(args.genres), rng.randint(1, 4))), rng.randint(1, args.cities))
+               for _ in range(args.queries)]
+
+    def top(query):
+        bits, city_id = query
+        return vectors.top(bits, city_id, args.limit, args.metric, 0.5, 0.25)
+
+    numpy = recommend.numpy
+    per_query = {}
+    if numpy is not None:
+        start = time.perf_counter()
+        vectors.arrays()
+        report["numpy_build_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        per_query["numpy"] = per_query_ms(top, queries)
+
+    recommend.numpy = None
+    try:
+        # The Python scan is slower; a tenth of the queries is enough for its median.
+        per_query["python"] = per_query_ms(top, queries[:max(1, args.queries // 10)])
+    finally:
+        recommend.numpy = numpy
+    report["top_k_ms"] = per_query
+
+    start = time.perf_counter()
+    for i in range(1000):
+        vectors.set(i, profile(i))
+    report["update_us"] = round((time.perf_counter() - start) / 1000 * 1e6, 1)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+"""Seed a throwaway database and benchmark every Fyyur route.
+
+    python -m benchmarks.run --venues 2000 --shows 50000 --output bench.json
+
+Two phases are run against the same data:
+
+* per-route: every route in app.py is hit --iterations times through the
+  Flask test client; latency percentiles and SQL statements per request
+  (read from the Server-Timing header) are reported per route.
+* load: --concurrency threads replay a weighted read mix for --requests
+  requests; throughput and latency percentiles are reported.
+
+Results are written as JSON so runs can be diffed across changes. The
+database defaults to a temporary SQLite file; pass --database-url to point
+at an empty Postgres database instead.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from benchmarks.seed import DEFAULT_SIZES, form_choices
+
+
+STATEMENTS = re.compile(r'desc="(\d+) statements"')
+
+
+def summarize(latencies_ms, statements=None):
+    from profiling import percentile
+
+    ordered = sorted(latencies_ms)
+    summary = {
+        "requests": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else None,
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "p99_ms": percentile(ordered, 0.99),
+        "max_ms": ordered[-1] if ordered else None,
+    }
+    if statements:
+        summary["statements_mean"] = round(sum(statements) / len(statements), 2)
+        summary["statements_max"] = max(statements)
+
+    return summary
+
+
+class Scenario(object):
+    """Builds concrete requests (method, path, form data) for each named route."""
+
+    def __init__(self, app, sizes, rng):
+        from forms import VenueForm
+
+        self.app = app
+        self.sizes = sizes
+        self.rng = rng
+        self.counter = itertools.count(1)
+        self.states = form_choices(VenueForm.states)[:sizes["states"]]
+        self.genres = form_choices(VenueForm.genres)[:sizes["genres"]]
+
+    def _id(self, kind):
+        return self.rng.randint(1, self.sizes[kind])
+
+    def _entity_form(self, name):
+        return {
+            "name": name,
+            "city": f"City {self.rng.randint(1, self.sizes['cities'])}",
+            "states": self.rng.choice(self.states),
+            "phone": "555-0000",
+            "genres": self.rng.sample(self.genres, min(2, len(self.genres))),
+            "facebook_link": "https://www.facebook.com/bench",
+            "image_link": "https://img.example.com/bench.jpg",
+            "website_link": "https://bench.example.com",
+            "address": "1 Bench St",
+        }
+
+    def _term(self):
+        return self.rng.choice(["venue 0001", "artist", "city 1", "jazz", "rock", "zzz"])
+
+    def _disposable(self, model):
+        # Deletes get a fresh row of their own so the seeded data set is left intact.
+        row = {"name": f"Disposable {next(self.counter)}", "city_id": 1}
+        from extensions import db
+
+        with self.app.app_context():
+            result = db.session.execute(model.__table__.insert().values(**row))
+            db.session.commit()
+            return result.inserted_primary_key[0]
+
+    def request(self, route):
+        from models import Artist, Venue
+
+        i = next(self.counter)
+        return {
+            "index": lambda: ("GET", "/", None),
+            "venues": lambda: ("GET", "/venues", None),
+            "artists": lambda: ("GET", "/artists", None),
+            "shows": lambda: ("GET", "/shows", None),
+            "calendar": lambda: ("GET", f"/shows/calendar?period=week&city={self.rng.randint(1, self.sizes['cities'])}", None),
+            "show_venue": lambda: ("GET", f"/venues/{self._id('venues')}", None),
+            "show_artist": lambda: ("GET", f"/artists/{self._id('artists')}", None),
+            "search_venues": lambda: ("POST", "/venues/search", {"search_term": self._term()}),
+            "search_artists": lambda: ("POST", "/artists/search", {"search_term": self._term()}),
+            "search_shows": lambda: ("POST", "/shows/search", {"search_term": self._term()}),
+            "create_venue_form": lambda: ("GET", "/venues/create", None),
+            "create_artist_form": lambda: ("GET", "/artists/create", None),
+            "create_shows": lambda: ("GET", "/shows/create", None),
+            "edit_venue": lambda: ("GET", f"/venues/{self._id('venues')}/edit", None),
+            "edit_artist": lambda: ("GET", f"/artists/{self._id('artists')}/edit", None),
+            "create_venue_submission": lambda: ("POST", "/venues/create", self._entity_form(f"Bench Venue {i}")),
+            "create_artist_submission": lambda: ("POST", "/artists/create", self._entity_form(f"Bench Artist {i}")),
+            "edit_venue_submission": lambda: self._edit("venues", "Venue"),
+            "edit_artist_submission": lambda: self._edit("artists", "Artist"),
+            "create_show_submission": lambda: ("POST", "/shows/create", {
+                "artist_id": str(self._id("artists")),
+                "venue_id": str(self._id("venues")),
+                "start_time": (datetime.now() + timedelta(days=self.rng.randint(1, 90))).strftime("%Y-%m-%d %H:%M:%S"),
+            }),
+            "delete_venue": lambda: ("DELETE", f"/venues/{self._disposable(Venue)}", None),
+            "delete_artist": lambda: ("DELETE", f"/artists/{self._disposable(Artist)}", None),
+        }[route]()
+
+    def _edit(self, kind, label):
+        entity_id = self._id(kind)
+        return "POST", f"/{kind}/{entity_id}/edit", self._entity_form(f"{label} {entity_id:06d}")
+
+
+ROUTES = [
+    "index", "venues", "artists", "shows", "calendar", "show_venue", "show_artist",
+    "search_venues", "search_artists", "search_shows",
+    "create_venue_form", "create_artist_form", "create_shows", "edit_venue", "edit_artist",
+    "create_venue_submission", "create_artist_submission", "create_show_submission",
+    "edit_venue_submission", "edit_artist_submission", "delete_venue", "delete_artist",
+]
+
+READ_MIX = {
+    "venues": 10, "artists": 10, "shows": 10, "calendar": 5, "show_venue": 25, "show_artist": 25,
+    "search_venues": 8, "search_artists": 8, "search_shows": 4,
+}
+
+
+def timed(client, method, path, data):
+    started = time.perf_counter()
+    response = client.open(path, method=method, data=data)
+    elapsed = (time.perf_counter() - started) * 1000
+
+    match = STATEMENTS.search(response.headers.get("Server-Timing", ""))
+    return response.status_code, elapsed, int(match.group(1)) if match else None
+
+
+def run_routes(app, scenario, iterations):
+    client = app.test_client()
+    results = {}
+
+    for route in ROUTES:
+        latencies, statements, statuses = [], [], {}
+        for _ in range(iterations):
+            status, elapsed, count = timed(client, *scenario.request(route))
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            if count is not None:
+                statements.append(count)
+
+        results[route] = dict(summarize(latencies, statements), status=statuses)
+
+    return results
+
+
+def run_load(app, scenario, requests, concurrency, mix=READ_MIX):
+    routes = list(mix)
+    weights = [mix[r] for r in routes]
+    plan = [scenario.request(r) for r in scenario.rng.choices(routes, weights, k=requests)]
+
+    lock = threading.Lock()
+    latencies, statements, errors = [], [], [0]
+    cursor = iter(plan)
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                item = next(cursor, None)
+            if item is None:
+                return
+            status, elapsed, count = timed(client, *item)
+            with lock:
+                latencies.append(elapsed)
+                if count is not None:
+                    statements.append(count)
+                if status >= 400:
+                    errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    return dict(summarize(latencies, statements), concurrency=concurrency, errors=errors[0],
+                seconds=round(wall, 3), throughput_rps=round(len(latencies) / wall, 1))
+
+
+def seed_app(app, sizes, rng_seed):
+    """Create the schema and search index in the app's empty database and seed it; returns (sizes, dialect)."""
+
+    from benchmarks.seed import seed
+    from extensions import db
+    from search import search
+
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            search.create_index(connection)
+        sizes = seed(sizes, rng_seed=rng_seed)
+        search.reindex("venue")
+        search.reindex("artist")
+        db.session.commit()
+
+        return sizes, db.engine.dialect.name
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--database-url", help="empty database to seed (default: temporary SQLite file)")
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{name}", type=int, default=default)
+    parser.add_argument("--iterations", type=int, default=20, help="requests per route in the per-route phase")
+    parser.add_argument("--requests", type=int, default=2000, help="requests in the load phase")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--page-cache", default="null", help="PAGE_CACHE_TYPE to benchmark with")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if not args.database_url:
+        fd, tmp = tempfile.mkstemp(suffix=".db", prefix="fyyur-bench-")
+        os.close(fd)
+        args.database_url = f"sqlite:///{tmp}"
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from app import create_app
+    from extensions import page_cache, profiler
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, PAGE_CACHE_TYPE=args.page_cache)
+    page_cache.init_app(app)
+    profiler.slow_ms = None
+
+    try:
+        started = time.perf_counter()
+        sizes, dialect = seed_app(app, {n: getattr(args, n) for n in DEFAULT_SIZES}, args.seed)
+        seeded = time.perf_counter() - started
+
+        scenario = Scenario(app, sizes, random.Random(args.seed))
+        print(f"seeded {sizes} in {seeded:.1f}s", file=sys.stderr)
+
+        results = {
+            "meta": {
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "git_revision": git_revision(),
+                "database": dialect,
+                "python": sys.version.split()[0],
+                "sizes": sizes,
+                "iterations": args.iterations,
+                "page_cache": args.page_cache,
+            },
+            "routes": run_routes(app, scenario, args.iterations),
+            "load": run_load(app, scenario, args.requests, args.concurrency),
+        }
+    finally:
+        if tmp:
+            os.unlink(tmp)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    width = max(len(r) for r in ROUTES)
+    for route, stats in results["routes"].items():
+        print(f"{route:<{width}}  p50 {stats['p50_ms']:8.2f}ms  p95 {stats['p95_ms']:8.2f}ms  "
+              f"p99 {stats['p99_ms']:8.2f}ms  sql {stats.get('statements_mean', '-')}  {stats['status']}")
+    load = results["load"]
+    print(f"load: {load['throughput_rps']} req/s at concurrency {load['concurrency']}, "
+          f"p50 {load['p50_ms']:.2f}ms p95 {load['p95_ms']:.2f}ms p99 {load['p99_ms']:.2f}ms, "
+          f"{load['errors']} errors -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
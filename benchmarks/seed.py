@@ -0,0 +1,109 @@
+import random
+from datetime import datetime, timedelta
+
+from extensions import db
+from forms import VenueForm
+from models import Artist, City, Genre, Show, State, Venue, artist_genre_association, refresh_show_counters, \
+    venue_genre_association
+
+
+DEFAULT_SIZES = {
+    "states": 10,
+    "cities": 100,
+    "genres": 19,
+    "venues": 1000,
+    "artists": 2000,
+    "shows": 20000,
+}
+
+
+def form_choices(field):
+    """Values of a SelectField declared on a form class."""
+
+    return [value for value, _ in field.kwargs["choices"]]
+
+
+def _insert(table, rows, chunk_size=5000):
+    for i in range(0, len(rows), chunk_size):
+        db.session.execute(table.insert(), rows[i:i + chunk_size])
+
+
+def seed(sizes=None, rng_seed=42, now=None):
+    """Fill an empty schema with synthetic reference data, venues, artists and shows.
+
+    State and genre names come from the form choices, so generated entities
+    round-trip through the edit forms. Ids are assigned sequentially from 1.
+    Returns the sizes actually used.
+    """
+
+    sizes = dict(DEFAULT_SIZES, **(sizes or {}))
+    rng = random.Random(rng_seed)
+    now = now or datetime.now()
+
+    state_names = form_choices(VenueForm.states)[:sizes["states"]]
+    genre_names = form_choices(VenueForm.genres)[:sizes["genres"]]
+    sizes["states"], sizes["genres"] = len(state_names), len(genre_names)
+
+    _insert(State.__table__, [{"id": i + 1, "name": n} for i, n in enumerate(state_names)])
+    _insert(Genre.__table__, [{"id": i + 1, "name": n} for i, n in enumerate(genre_names)])
+    _insert(City.__table__, [
+        {"id": i + 1, "name": f"City {i + 1}", "state_id": rng.randint(1, sizes["states"])}
+        for i in range(sizes["cities"])
+    ])
+
+    def entity(i, kind):
+        return {
+            "id": i + 1,
+            "name": f"{kind} {i + 1:06d}",
+            "city_id": rng.randint(1, sizes["cities"]),
+            "phone": f"555-{rng.randint(0, 9999):04d}",
+            "image_link": f"https://img.example.com/{kind.lower()}/{i + 1}.jpg",
+            "facebook_link": f"https://www.facebook.com/{kind.lower()}{i + 1}",
+            "website": f"https://{kind.lower()}{i + 1}.example.com",
+            "seeking_description": "Looking for great people to play with",
+        }
+
+    venues = []
+    for i in range(sizes["venues"]):
+        row = entity(i, "Venue")
+        row.update(address=f"{rng.randint(1, 999)} Main St", seeking_talent=rng.random() < 0.5)
+        venues.append(row)
+    _insert(Venue.__table__, venues)
+
+    artists = []
+    for i in range(sizes["artists"]):
+        row = entity(i, "Artist")
+        row.update(seeking_venue=rng.random() < 0.5)
+        artists.append(row)
+    _insert(Artist.__table__, artists)
+
+    for table, fk, count in ((venue_genre_association, "venue_id", sizes["venues"]),
+                             (artist_genre_association, "artist_id", sizes["artists"])):
+        _insert(table, [
+            {fk: i + 1, "genre_id": g}
+            for i in range(count)
+            for g in rng.sample(range(1, sizes["genres"] + 1), rng.randint(1, min(3, sizes["genres"])))
+        ])
+
+    _insert(Show.__table__, [
+        {
+            "id": i + 1,
+            "artist_id": rng.randint(1, sizes["artists"]),
+            "venue_id": rng.randint(1, sizes["venues"]),
+            "start_time": now + timedelta(minutes=rng.randint(-365 * 24 * 60, 180 * 24 * 60)),
+        }
+        for i in range(sizes["shows"])
+    ])
+
+    refresh_show_counters()
+
+    if db.session.bind.dialect.name == "postgresql":
+        # Explicit ids leave the serial sequences behind; move them past the seeded rows.
+        for model in (State, Genre, City, Venue, Artist, Show):
+            table = model.__tablename__
+            db.session.execute(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                               f"(SELECT max(id) FROM \"{table}\"))")
+
+    db.session.commit()
+
+    return sizes
@@ -0,0 +1,84 @@
+"""Measure cold-start cost: importing app, building it, and serving the first request.
+
+    python -m benchmarks.startup --runs 10 --budget-ms 400
+
+Each run is a fresh interpreter, like a new gunicorn worker. With
+--budget-ms the command exits non-zero when the median time to a built
+application exceeds the budget, so it can gate CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+application = app.create_app()
+t2 = time.perf_counter()
+application.test_client().get("/")
+t3 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "create_app_ms": (t2 - t1) * 1000,
+                  "first_request_ms": (t3 - t2) * 1000, "total_ms": (t3 - t0) * 1000}))
+"""
+
+
+def run_probe(env):
+    output = subprocess.check_output([sys.executable, "-c", PROBE], env=env, stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def slowest_imports(env, limit):
+    """Top cumulative entries from `python -X importtime`."""
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    rows = []
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+
+    return [{"module": name, "cumulative_us": us} for us, name in sorted(rows, reverse=True)[:limit]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, help="fail if median import + create_app exceeds this")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    # Point at a database that does not exist: startup must not need one.
+    env = dict(os.environ, DATABASE_URL=os.environ.get("DATABASE_URL", "sqlite:////nonexistent/fyyur.db"))
+
+    runs = [run_probe(env) for _ in range(args.runs)]
+    report = {
+        metric: {"median": round(statistics.median(r[metric] for r in runs), 2),
+                 "min": round(min(r[metric] for r in runs), 2),
+                 "max": round(max(r[metric] for r in runs), 2)}
+        for metric in ("import_ms", "create_app_ms", "first_request_ms", "total_ms")
+    }
+    report["slowest_imports"] = slowest_imports(env, 10)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    boot = report["import_ms"]["median"] + report["create_app_ms"]["median"]
+    if args.budget_ms is not None and boot > args.budget_ms:
+        print(f"startup {boot:.1f}ms exceeds budget {args.budget_ms:.1f}ms", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from itertools import islice
+
+import dateutil.parser
+from sqlalchemy import func, select, text
+
+from dates import date_formatter
+from extensions import db
+from models import Artist, City, Show, State, Venue, artist_genre_association, genre_names, \
+    refresh_show_counters, venue_genre_association
+from refcache import refs
+
+
+# Venue and artist ids are exported so that a show file, which refers to
+# them by id, still matches after both are imported elsewhere.
+FIELDS = {
+    "venue": ["id", "name", "address", "city", "state", "phone", "image_link", "facebook_link", "website",
+              "seeking_talent", "seeking_description", "genres"],
+    "artist": ["id", "name", "city", "state", "phone", "image_link", "facebook_link", "website",
+               "seeking_venue", "seeking_description", "genres"],
+    "show": ["artist_id", "venue_id", "start_time"],
+}
+
+BOOLEAN_FIELDS = {"seeking_talent", "seeking_venue"}
+
+# Genres are a list in JSON Lines and a ';'-separated string in CSV.
+GENRE_SEPARATOR = ";"
+
+REQUIRED_FIELDS = ("name", "city", "state")
+
+
+class InvalidRow(ValueError):
+    """A row the import skips; the message says why."""
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_rows(stream, fmt):
+    """(line number, row) pairs; the row is None for a JSON line that is not an object."""
+
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            if row.get("genres") is not None:
+                row["genres"] = [g.strip() for g in row["genres"].split(GENRE_SEPARATOR) if g.strip()]
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+
+
+def write_rows(stream, fmt, fields, rows):
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([GENRE_SEPARATOR.join(v) if isinstance(v, list) else v for v in row])
+    else:
+        for row in rows:
+            stream.write(json.dumps(dict(zip(fields, row)), default=_json_default))
+            stream.write("\n")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def _boolean(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "t")
+    return bool(value)
+
+
+def _id(row, field, required=True):
+    value = row.get(field)
+    if value is None or value == "":
+        if required:
+            raise InvalidRow(f"{field} is missing")
+        return None
+    if isinstance(value, bool):
+        raise InvalidRow(f"{field} {value!r} is not an id")
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f"{field} {value!r} is not an id")
+    if value < 1:
+        raise InvalidRow(f"{field} {value!r} is not an id")
+
+    return value
+
+
+def _existing_ids(session, model, ids):
+    # A range rather than IN (...), which would outgrow SQLite's parameter limit on big chunks.
+    if not ids:
+        return set()
+    query = session.query(model.id).filter(model.id.between(min(ids), max(ids)))
+
+    return {id for (id,) in query} & set(ids)
+
+
+class Progress(object):
+
+    def __init__(self, kind, report):
+        self.kind = kind
+        self.report = report
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def add(self, count):
+        self.rows += count
+        elapsed = time.monotonic() - self.started
+        self.report(f"{self.kind}: {self.rows} rows ({self.rows / elapsed if elapsed else 0:.0f} rows/s)")
+
+
+class BulkLoader(object):
+    """Chunked CSV / JSON Lines import and streaming export of venues, artists and shows.
+
+    Each chunk resolves its cities, states and genres through the
+    ReferenceCache in a handful of statements, inserts the entities with
+    bulk_insert_mappings (a multi-row INSERT with ids taken from the
+    sequence for venues and artists, and COPY for shows, on Postgres) and
+    commits.
+    """
+
+    def __init__(self):
+        self.targets = {
+            "venue": (Venue, venue_genre_association, "venue_id"),
+            "artist": (Artist, artist_genre_association, "artist_id"),
+        }
+
+    # -- import ---------------------------------------------------------------
+
+    def load(self, kind, rows, chunk_size=1000, report=print, after_chunk=None):
+        """Import (line number, row) pairs, as read_rows() yields them, a chunk per transaction.
+
+        A row that cannot go in (a missing or malformed field, an id that is
+        taken, a show whose venue or artist does not exist) is reported with
+        its line number and skipped; the rest of its chunk is still loaded.
+        """
+
+        progress = Progress(kind, report)
+        prepare = self._prepare_show if kind == "show" else self._prepare_entity
+        skipped = 0
+
+        for chunk in chunked(rows, chunk_size):
+            prepared = []
+            for number, row in chunk:
+                try:
+                    if row is None:
+                        raise InvalidRow("not a JSON object")
+                    prepared.append((number, prepare(kind, row)))
+                except InvalidRow as e:
+                    report(f"{kind}: line {number} skipped: {e}")
+
+            if kind == "show":
+                values = self._check_shows(prepared, report)
+                self._load_shows(values)
+                ids = None
+            else:
+                values = self._check_entities(kind, prepared, report)
+                ids = self._load_entities(kind, values)
+
+            if after_chunk is not None and ids:
+                after_chunk(kind, ids)
+
+            db.session.commit()
+            skipped += len(chunk) - len(values)
+            progress.add(len(values))
+
+        if skipped:
+            report(f"{kind}: {skipped} rows skipped")
+
+        return progress.rows
+
+    def _prepare_entity(self, kind, row):
+        for field in REQUIRED_FIELDS:
+            if not isinstance(row.get(field), str) or not row[field].strip():
+                raise InvalidRow(f"{field} is missing")
+        genres = row.get("genres") or []
+        if not isinstance(genres, list) or not all(isinstance(g, str) for g in genres):
+            raise InvalidRow("genres must be a list of names")
+
+        mapping = {f: row.get(f) or None for f in FIELDS[kind] if f not in ("id", "city", "state", "genres")}
+        for field in BOOLEAN_FIELDS & set(mapping):
+            mapping[field] = _boolean(row.get(field))
+        id = _id(row, "id", required=False)
+        if id is not None:
+            mapping["id"] = id
+
+        return mapping, (row["city"], row["state"]), genres
+
+    def _check_entities(self, kind, prepared, report):
+        model = self.targets[kind][0]
+        ids = [mapping["id"] for _, (mapping, _, _) in prepared if "id" in mapping]
+        taken = _existing_ids(db.session, model, ids)
+
+        values = []
+        for number, value in prepared:
+            id = value[0].get("id")
+            if id in taken:
+                report(f"{kind}: line {number} skipped: id {id} is taken")
+                continue
+            if id is not None:
+                taken.add(id)
+            values.append(value)
+
+        return values
+
+    def _prepare_show(self, kind, row):
+        start_time = row.get("start_time")
+        if not isinstance(start_time, datetime):
+            try:
+                start_time = dateutil.parser.parse(start_time)
+            except (TypeError, ValueError, OverflowError):
+                raise InvalidRow(f"start_time {start_time!r} is not a datetime")
+
+        return {
+            "artist_id": _id(row, "artist_id"),
+            "venue_id": _id(row, "venue_id"),
+            "start_time": date_formatter.to_stored(start_time),
+        }
+
+    def _check_shows(self, prepared, report):
+        session = db.session
+        artists = _existing_ids(session, Artist, [value["artist_id"] for _, value in prepared])
+        venues = _existing_ids(session, Venue, [value["venue_id"] for _, value in prepared])
+
+        values = []
+        for number, value in prepared:
+            if value["artist_id"] not in artists:
+                report(f"show: line {number} skipped: no artist with id {value['artist_id']}")
+            elif value["venue_id"] not in venues:
+                report(f"show: line {number} skipped: no venue with id {value['venue_id']}")
+            else:
+                values.append(value)
+
+        return values
+
+    def _load_entities(self, kind, values):
+        if not values:
+            return []
+
+        session = db.session
+        model, assoc, fk = self.targets[kind]
+
+        cities = refs.city_ids(session, {place for _, place, _ in values})
+        names = list(dict.fromkeys(g for _, _, row_genres in values for g in row_genres))
+        genres = dict(zip(names, refs.genre_ids(session, names)))
+
+        mappings = []
+        for mapping, place, _ in values:
+            mapping["city_id"] = cities[place]
+            mappings.append(mapping)
+
+        if session.bind.dialect.name == "postgresql":
+            # return_defaults would make it an INSERT per row; draw the ids from the
+            # sequence instead and insert the chunk in one multi-row statement.
+            # Imported ids first move the sequence past them.
+            table = model.__table__
+            sequence = func.pg_get_serial_sequence(f'"{table.name}"', "id")
+            given = [mapping["id"] for mapping in mappings if "id" in mapping]
+            if given:
+                session.execute(text(
+                    "SELECT setval(pg_get_serial_sequence(:table, 'id'), :id) "
+                    "WHERE :id > coalesce(pg_sequence_last_value(pg_get_serial_sequence(:table, 'id')::regclass), 0)"
+                ), {"table": f'"{table.name}"', "id": max(given)})
+            missing = [mapping for mapping in mappings if "id" not in mapping]
+            if missing:
+                ids = session.execute(select([func.nextval(sequence)])
+                                      .select_from(func.generate_series(1, len(missing))))
+                for mapping, (id,) in zip(missing, ids):
+                    mapping["id"] = id
+            session.execute(table.insert().values(mappings))
+        else:
+            session.bulk_insert_mappings(model, mappings, return_defaults=True)
+
+        links = [
+            {fk: mapping["id"], "genre_id": genres[g]}
+            for mapping, (_, _, row_genres) in zip(mappings, values)
+            for g in dict.fromkeys(row_genres)
+        ]
+        if links:
+            session.execute(assoc.insert(), links)
+
+        return [mapping["id"] for mapping in mappings]
+
+    def _load_shows(self, values):
+        if not values:
+            return
+
+        session = db.session
+        if session.bind.dialect.name == "postgresql":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for value in values:
+                writer.writerow([value["artist_id"], value["venue_id"], value["start_time"].isoformat()])
+            buffer.seek(0)
+
+            cursor = session.connection().connection.cursor()
+            cursor.copy_expert('COPY "Show" (artist_id, venue_id, start_time) FROM STDIN WITH CSV', buffer)
+        else:
+            session.bulk_insert_mappings(Show, values)
+
+        # Neither path runs the Show mapper events, so recount the rows touched.
+        refresh_show_counters(venue_ids={v["venue_id"] for v in values},
+                              artist_ids={v["artist_id"] for v in values})
+
+    # -- export ---------------------------------------------------------------
+
+    def rows(self, kind, batch_size=1000):
+        """Stream export rows (tuples ordered like FIELDS[kind]) with yield_per."""
+
+        session = db.session
+
+        if kind == "show":
+            query = session.query(Show.artist_id, Show.venue_id, Show.start_time).order_by(Show.id)
+            for row in query.yield_per(batch_size):
+                yield tuple(row)
+            return
+
+        model, assoc, fk = self.targets[kind]
+        columns = [genre_names(model, assoc, fk, GENRE_SEPARATOR) if f == "genres"
+                   else City.name if f == "city"
+                   else State.name if f == "state"
+                   else getattr(model, f)
+                   for f in FIELDS[kind]]
+
+        query = session.query(*columns) \
+            .select_from(model) \
+            .join(City, model.city_id == City.id) \
+            .join(State, City.state_id == State.id) \
+            .order_by(model.id)
+
+        genres = FIELDS[kind].index("genres")
+        for row in query.yield_per(batch_size):
+            row = list(row)
+            row[genres] = row[genres].split(GENRE_SEPARATOR) if row[genres] else []
+            yield tuple(row)
+
+    def dump(self, kind, stream, fmt, batch_size=1000, report=print):
+        progress = Progress(kind, report)
+
+        def counted():
+            count = 0
+            for row in self.rows(kind, batch_size):
+                yield row
+                count += 1
+                if count % batch_size == 0:
+                    progress.add(batch_size)
+            if count % batch_size:
+                progress.add(count % batch_size)
+
+        write_rows(stream, fmt, FIELDS[kind], counted())
+
+        return progress.rows
+
+
+bulk = BulkLoader()
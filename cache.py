@@ -0,0 +1,351 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, make_response, request, session
+from sqlalchemy import exc, func, select
+
+
+class NullBackend(object):
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, tags, timeout):
+        pass
+
+    def delete_tags(self, tags):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryBackend(object):
+    """Bounded LRU held in this process, with a tag -> keys index."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires, _ = entry
+            if expires and expires < time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags, timeout):
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (value, time.time() + timeout if timeout else None, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def delete_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class FileSystemBackend(object):
+    """Entries pickled under `entries/`, one marker file per (tag, entry) under `tags/`.
+
+    Shared by every worker on the host, so an invalidation in one process
+    is seen by all of them.
+    """
+
+    def __init__(self, directory, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = os.path.join(directory, "entries")
+        self.tags = os.path.join(directory, "tags")
+        os.makedirs(self.entries, exist_ok=True)
+        os.makedirs(self.tags, exist_ok=True)
+
+    @staticmethod
+    def _name(value):
+        return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.entries, self._name(key))
+        try:
+            with open(path, "rb") as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        if expires and expires < time.time():
+            self._unlink(path)
+            return None
+
+        return value
+
+    def set(self, key, value, tags, timeout):
+        name = self._name(key)
+        fd, tmp = tempfile.mkstemp(dir=self.entries)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((time.time() + timeout if timeout else None, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, os.path.join(self.entries, name))
+
+        for tag in tags:
+            directory = os.path.join(self.tags, self._name(tag))
+            os.makedirs(directory, exist_ok=True)
+            open(os.path.join(directory, name), "a").close()
+
+        self._prune()
+
+    def delete_tags(self, tags):
+        for tag in tags:
+            directory = os.path.join(self.tags, self._name(tag))
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                self._unlink(os.path.join(self.entries, name))
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def clear(self):
+        for directory in (self.entries, self.tags):
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory, exist_ok=True)
+
+    def _prune(self):
+        names = os.listdir(self.entries)
+        if len(names) <= self.max_entries:
+            return
+
+        # Drop the oldest quarter so pruning is not paid on every store.
+        paths = sorted((os.path.join(self.entries, n) for n in names), key=self._mtime)
+        for path in paths[:len(paths) - self.max_entries * 3 // 4]:
+            self._unlink(path)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class PageCache(object):
+    """Rendered-page cache keyed by request path, invalidated by tag.
+
+    Views declare tags such as "venues" or "venue:{venue_id}" (formatted
+    with the view arguments); mutating views call `invalidate` with the
+    tags their write affects. Hits answer conditional GETs with 304.
+
+    Invalidations reach every process, the job worker's included: each
+    one is also written to the CacheInvalidation table, and every process
+    reads the new rows at most PAGE_CACHE_SYNC_SECONDS apart, before it
+    serves a cached page, and drops their tags from its own backend.
+    """
+
+    # How far below the newest row seen each sync looks again, for rows whose ids
+    # were taken before that one's but committed after it.
+    sync_overlap = 50
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.timeout = None
+        self.variants = []
+        self.vary_headers = set()
+        self.sync_seconds = None
+        self.sync_keep = 3600
+        self._syncing = threading.Lock()
+        self._seen = None
+        self._handled = set()
+        self._synced_at = None
+        self._sync_failing = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get("PAGE_CACHE_TYPE", "memory")
+        max_entries = app.config.get("PAGE_CACHE_MAX_ENTRIES", 1024)
+        self.timeout = app.config.get("PAGE_CACHE_TIMEOUT")
+        self.sync_seconds = app.config.get("PAGE_CACHE_SYNC_SECONDS")
+        self.sync_keep = app.config.get("PAGE_CACHE_SYNC_KEEP_SECONDS", 3600)
+        self._seen, self._handled, self._synced_at = None, set(), None
+
+        if kind == "memory":
+            self.backend = MemoryBackend(max_entries)
+        elif kind == "filesystem":
+            directory = app.config.get("PAGE_CACHE_DIR") or os.path.join(app.instance_path, "page_cache")
+            self.backend = FileSystemBackend(directory, max_entries)
+        else:
+            self.backend = NullBackend()
+
+    def vary(self, key, *headers):
+        """Also key pages on `key()`, for output that depends on more than the path (such as the locale).
+
+        `headers` are the request headers `key` reads, sent as Vary.
+        """
+
+        if key not in self.variants:
+            self.variants.append(key)
+        self.vary_headers.update(headers)
+
+    def cached(self, *tags, timeout=None):
+        """Cache the view's page under `tags`.
+
+        `timeout` names a config key with a shorter lifetime than
+        PAGE_CACHE_TIMEOUT, for pages showing something no tag tracks.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pages carrying flashed messages are per-user; never store or serve those.
+                if request.method != "GET" or "_flashes" in session:
+                    return view(*args, **kwargs)
+
+                self._sync()
+                key = "|".join([request.full_path] + [variant() for variant in self.variants])
+                entry = self.backend.get(key)
+
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.direct_passthrough:
+                        return response
+
+                    body = response.get_data()
+                    entry = {
+                        "body": body,
+                        "mimetype": response.mimetype,
+                        "etag": hashlib.sha1(body).hexdigest(),
+                        "last_modified": datetime.utcnow().replace(microsecond=0),
+                    }
+                    lifetimes = [self.timeout, current_app.config.get(timeout) if timeout else None]
+                    self.backend.set(key, entry, [t.format(**kwargs) for t in tags],
+                                     min((t for t in lifetimes if t), default=None))
+
+                response = Response(entry["body"], mimetype=entry["mimetype"])
+                response.set_etag(entry["etag"])
+                response.last_modified = entry["last_modified"]
+                response.cache_control.public = True
+                response.cache_control.no_cache = True
+                response.vary.update(self.vary_headers)
+
+                return response.make_conditional(request)
+
+            return wrapper
+
+        return decorator
+
+    def invalidate(self, *tags):
+        self.backend.delete_tags(tags)
+        if tags and self.sync_seconds is not None:
+            self._publish(tags)
+
+    # -- sharing invalidations between processes ---------------------------------
+
+    @staticmethod
+    def _table():
+        # models imports extensions, which builds this object; so not at import time.
+        from models import CacheInvalidation
+
+        return CacheInvalidation.__table__
+
+    def _publish(self, tags):
+        from extensions import db
+
+        table = self._table()
+        now = datetime.now()
+        try:
+            # A transaction of its own: callers invalidate after committing theirs.
+            with db.engine.begin() as connection:
+                result = connection.execute(table.insert().values(tags=json.dumps(list(tags)), created_at=now))
+                connection.execute(table.delete().where(table.c.created_at < now - timedelta(seconds=self.sync_keep)))
+        except exc.SQLAlchemyError:
+            current_app.logger.exception("Could not share the invalidation of %s; other processes keep "
+                                         "those pages until PAGE_CACHE_TIMEOUT", ", ".join(tags))
+            return
+
+        with self._syncing:
+            self._handled.add(result.inserted_primary_key[0])
+
+    def _sync(self):
+        if self.sync_seconds is None:
+            return
+
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < self.sync_seconds:
+            return
+        if not self._syncing.acquire(blocking=False):
+            # Another request of this process is reading them already.
+            return
+
+        from extensions import db
+
+        table = self._table()
+        try:
+            with db.engine.connect() as connection:
+                if self._seen is None or now - self._synced_at > self.sync_keep:
+                    # First sync, or away longer than rows are kept: anything may have changed.
+                    if self._seen is not None:
+                        self.backend.clear()
+                    self._seen = connection.execute(select([func.max(table.c.id)])).scalar() or 0
+                    self._handled = set()
+                else:
+                    floor = self._seen - self.sync_overlap
+                    rows = connection.execute(select([table.c.id, table.c.tags])
+                                              .where(table.c.id > floor).order_by(table.c.id)).fetchall()
+                    for row_id, tags in rows:
+                        if row_id not in self._handled:
+                            self.backend.delete_tags(json.loads(tags))
+                            self._handled.add(row_id)
+                        self._seen = max(self._seen, row_id)
+                    self._handled = {i for i in self._handled if i > self._seen - self.sync_overlap}
+            self._sync_failing = False
+        except exc.SQLAlchemyError:
+            if not self._sync_failing:
+                current_app.logger.exception("Could not read page-cache invalidations from other processes")
+            self._sync_failing = True
+        finally:
+            self._synced_at = now
+            self._syncing.release()
+
+    def clear(self):
+        self.backend.clear()
@@ -0,0 +1,218 @@
+import signal
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from bulk import bulk, read_rows
+from extensions import db
+from models import refresh_show_counters
+from search import search
+
+
+def register_commands(app):
+    app.cli.add_command(init_db)
+    app.cli.add_command(search_reindex)
+    app.cli.add_command(import_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(refresh_counters)
+    app.cli.add_command(check_indexes)
+    app.cli.add_command(ensure_partitions_command)
+    app.cli.add_command(detach_partitions_command)
+    app.cli.add_command(archive_shows_command)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(build_assets)
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db():
+    """Create all tables and the search index for a fresh local database.
+
+    The index is the FTS5 table on SQLite, and the pg_trgm indexes and
+    search_vector columns on PostgreSQL. Deployed databases are managed
+    with `flask db upgrade` instead.
+    """
+
+    db.create_all()
+    with db.engine.begin() as connection:
+        search.create_index(connection)
+    click.echo(f"Initialized {db.engine.url!r}")
+
+
+@click.command("search-reindex")
+@with_appcontext
+def search_reindex():
+    """Rebuild the SQLite FTS5 search index from scratch."""
+
+    search.reindex("venue")
+    search.reindex("artist")
+    db.session.commit()
+
+
+def _bulk_format(path, fmt):
+    return fmt or ("csv" if path.endswith(".csv") else "jsonl")
+
+
+@click.command("import")
+@click.argument("kind", type=click.Choice(["venue", "artist", "show"]))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]))
+@click.option("--chunk-size", default=1000, show_default=True)
+@with_appcontext
+def import_command(kind, path, fmt, chunk_size):
+    """Load venues, artists or shows from a CSV or JSON Lines file."""
+
+    after_chunk = search.reindex if search.indexed else None
+
+    with open(path, newline="", encoding="utf-8") as stream:
+        bulk.load(kind, read_rows(stream, _bulk_format(path, fmt)), chunk_size=chunk_size,
+                  report=click.echo, after_chunk=after_chunk)
+
+
+@click.command("export")
+@click.argument("kind", type=click.Choice(["venue", "artist", "show"]))
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]))
+@click.option("--batch-size", default=1000, show_default=True)
+@with_appcontext
+def export_command(kind, path, fmt, batch_size):
+    """Stream venues, artists or shows to a CSV or JSON Lines file."""
+
+    with open(path, "w", newline="", encoding="utf-8") as stream:
+        bulk.dump(kind, stream, _bulk_format(path, fmt), batch_size=batch_size, report=click.echo)
+
+
+@click.command("refresh-counters")
+@click.option("--since-minutes", type=int,
+              help="only recount venues and artists with a show that started in the last N minutes")
+@with_appcontext
+def refresh_counters(since_minutes):
+    """Recompute the materialized upcoming/past show counters.
+
+    Run it periodically (e.g. every 10 minutes with --since-minutes 15) so
+    shows roll over from upcoming to past; without the option every venue
+    and artist is recounted.
+    """
+
+    since = datetime.now() - timedelta(minutes=since_minutes) if since_minutes else None
+    updated = refresh_show_counters(since=since)
+    db.session.commit()
+    click.echo(f"Refreshed show counters on {updated} rows")
+
+
+@click.command("check-indexes")
+@click.option("--verbose", is_flag=True, help="print every plan, not just the regressions")
+@with_appcontext
+def check_indexes(verbose):
+    """EXPLAIN the hot queries and fail if any of them reads a whole table."""
+
+    from explain import check_plans, hot_queries
+
+    queries = hot_queries()
+    failures = check_plans(queries)
+
+    if verbose:
+        click.echo(f"{len(queries)} queries checked")
+    for name, tables, plan in failures:
+        click.echo(f"FULL SCAN of {', '.join(tables)}: {name}", err=True)
+        for line in plan:
+            click.echo(f"    {line}", err=True)
+
+    if failures:
+        raise SystemExit(1)
+    click.echo("All hot queries use an index")
+
+
+@click.command("ensure-partitions")
+@click.option("--ahead", default=12, show_default=True, help="months of partitions to keep ready")
+@with_appcontext
+def ensure_partitions_command(ahead):
+    """Create the monthly Show partitions for the coming months (Postgres)."""
+
+    from partitions import ensure_partitions, is_partitioned
+
+    if not is_partitioned():
+        click.echo("Show is not partitioned on this database; nothing to do")
+        return
+
+    created = ensure_partitions(ahead)
+    db.session.commit()
+    click.echo(f"Created {len(created)} partitions" + (f": {', '.join(created)}" if created else ""))
+
+
+@click.command("detach-partitions")
+@click.option("--before", type=click.DateTime(["%Y-%m-%d", "%Y-%m"]), required=True,
+              help="detach months that end on or before this date")
+@click.option("--schema", default="archive", show_default=True, help="schema the detached partitions move to")
+@with_appcontext
+def detach_partitions_command(before, schema):
+    """Move old monthly Show partitions out of the live table into an archive schema (Postgres)."""
+
+    from partitions import detach_partitions, is_partitioned
+
+    if not is_partitioned():
+        click.echo("Show is not partitioned on this database; nothing to do")
+        return
+
+    detached = detach_partitions(before.date(), schema)
+    if detached:
+        # Archived shows no longer count as past shows.
+        refresh_show_counters()
+    db.session.commit()
+    click.echo(f"Detached {len(detached)} partitions into {schema}" + (f": {', '.join(detached)}" if detached else ""))
+
+
+@click.command("archive-shows")
+@click.option("--before", type=click.DateTime(["%Y-%m-%d", "%Y-%m-%d %H:%M"]), required=True,
+              help="archive shows that started before this date")
+@click.option("--batch-size", default=1000, show_default=True, help="shows moved per transaction")
+@with_appcontext
+def archive_shows_command(before, batch_size):
+    """Move past shows out of Show into the ShowArchive table, in batches."""
+
+    from archive import archive_shows
+
+    if before > datetime.now():
+        raise click.BadParameter("only shows that have already happened can be archived", param_hint="--before")
+
+    moved = archive_shows(before, batch_size, report=click.echo)
+    click.echo(f"Archived {moved} shows started before {before:%Y-%m-%d %H:%M}")
+
+
+@click.command("worker")
+@click.option("--threads", type=int, help="jobs run at once [default: JOBS_THREADS]")
+@click.option("--poll-interval", type=float, help="seconds between polls when idle [default: JOBS_POLL_INTERVAL]")
+@click.option("--once", is_flag=True, help="exit when no job is due instead of polling forever")
+@with_appcontext
+def worker_command(threads, poll_interval, once):
+    """Run background jobs from the Job table until interrupted."""
+
+    from jobs import Worker, queue
+
+    app = current_app._get_current_object()
+    worker = Worker(app, queue, threads or app.config["JOBS_THREADS"],
+                    poll_interval or app.config["JOBS_POLL_INTERVAL"])
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+
+    click.echo(f"Worker {worker.name} running {worker.threads} threads")
+    worker.run(once)
+    click.echo(f"Worker {worker.name} stopped")
+
+
+@click.command("build-assets")
+@click.option("--clean", is_flag=True, help="delete earlier build output not in the new manifest")
+@with_appcontext
+def build_assets(clean):
+    """Bundle, minify, fingerprint and precompress the static assets into static/dist."""
+
+    from assets import Builder, brotli
+
+    if brotli is None:
+        click.echo("brotli is not installed; only .gz copies will be written", err=True)
+    builder = Builder(current_app.static_folder)
+    for name, built in sorted(builder.build().items()):
+        click.echo(f"{name} -> {built}")
+    if clean:
+        click.echo(f"Removed {builder.clean()} stale files")
@@ -1,5 +1,9 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Must be the same in every process and across restarts: it signs sessions, CSRF tokens and the image
+# proxy URLs, which the page cache and browsers keep. Required unless DEBUG; IMAGE_PROXY_SECRET, if
+# set, signs the image URLs instead.
+SECRET_KEY = os.environ.get('SECRET_KEY')
+IMAGE_PROXY_SECRET = os.environ.get('IMAGE_PROXY_SECRET')
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -7,7 +11,135 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
 
 # Connect to the database
-SQLALCHEMY_DATABASE_URI = 'postgres://tejaspandey@localhost:5432/fyurrapp'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgres://tejaspandey@localhost:5432/fyurrapp')
 
 #Set track modifications to false
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Listing page sizes (keyset pagination)
+VENUES_PER_PAGE = 50
+ARTISTS_PER_PAGE = 50
+SHOWS_PER_PAGE = 30
+MAX_PER_PAGE = 200
+# Past shows on a venue or artist page; older ones, archived included, are paged from its "Older shows" link
+DETAIL_PAST_SHOWS = 12
+
+# JSON API (/api/v1): page sizes, and compression of bodies of at least API_COMPRESS_MIN_SIZE bytes
+# (brotli when the package is installed and the client accepts it, gzip otherwise)
+API_PER_PAGE = 100
+API_MAX_PER_PAGE = 1000
+API_COMPRESS_MIN_SIZE = 500
+API_GZIP_LEVEL = 6
+API_BROTLI_QUALITY = 5
+# Most venues or artists accepted by one /bulk request
+API_BULK_MAX_ITEMS = 500
+# Most ids accepted by one /delete request
+API_DELETE_MAX_IDS = 10000
+
+# Maximum number of ranked results returned by a search
+SEARCH_RESULT_LIMIT = 50
+
+# Typeahead (/api/v1/typeahead?q=<prefix>): results per kind by default and at most, the browser
+# max-age of a response, and how often each process rebuilds its in-memory index to pick up
+# writes made by other processes (its own are applied as they commit)
+TYPEAHEAD_LIMIT = 5
+TYPEAHEAD_MAX_LIMIT = 20
+TYPEAHEAD_MAX_AGE = 30
+TYPEAHEAD_TTL = 300
+
+# Recommendations on venue and artist pages (similar artists, venues and artists that fit each other):
+# how many of each, "jaccard" or "cosine" similarity of the genre sets, the boosts for a match in the
+# same city and for a venue or artist seeking the other side, and how often each process rebuilds
+# its in-memory vectors. Any write can change them, so the pages showing them stay in the page cache
+# for at most RECOMMEND_PAGE_CACHE_TIMEOUT seconds. RECOMMEND_LIMIT = 0 turns them off.
+RECOMMEND_LIMIT = 6
+RECOMMEND_METRIC = 'jaccard'
+RECOMMEND_CITY_BOOST = 0.5
+RECOMMEND_SEEKING_BOOST = 0.25
+RECOMMEND_TTL = 600
+RECOMMEND_PAGE_CACHE_TIMEOUT = 60
+
+# Seconds before the Genre/State/City name -> id cache is dropped (None keeps it until a reference row is deleted)
+REFERENCE_CACHE_TTL = 3600
+
+# Rendered page cache: "memory" (per-process LRU), "filesystem" (shared by workers on a host) or "null"
+PAGE_CACHE_TYPE = 'memory'
+PAGE_CACHE_DIR = os.path.join(basedir, 'instance', 'page_cache')
+PAGE_CACHE_MAX_ENTRIES = 1024
+PAGE_CACHE_TIMEOUT = 300
+# Invalidations are shared through the CacheInvalidation table: each process reads the ones made
+# elsewhere (the job worker's deletes and imports, other web workers' writes) at most this many
+# seconds apart, and rows are kept for PAGE_CACHE_SYNC_KEEP_SECONDS. None turns sharing off, which is
+# only safe with a single process.
+PAGE_CACHE_SYNC_SECONDS = 1.0
+PAGE_CACHE_SYNC_KEEP_SECONDS = 3600
+
+# Request profiling: Server-Timing header, /_metrics percentiles over the last PROFILER_SAMPLES
+# requests per endpoint, and a warning (to PROFILER_SLOW_LOG if set) for requests slower than
+# PROFILER_SLOW_REQUEST_MS. /_metrics is off unless enabled, and with PROFILER_METRICS_TOKEN set it
+# answers only requests sending "Authorization: Bearer <token>"
+PROFILER_SERVER_TIMING = True
+PROFILER_METRICS_ENDPOINT = os.environ.get('PROFILER_METRICS_ENDPOINT', '').lower() in ('1', 'true', 'yes')
+PROFILER_METRICS_TOKEN = os.environ.get('PROFILER_METRICS_TOKEN')
+PROFILER_SAMPLES = 1000
+PROFILER_SLOW_REQUEST_MS = 500
+PROFILER_SLOW_LOG = None
+
+# Connection pool for server databases (SQLite keeps Flask-SQLAlchemy's defaults). Connections are
+# recycled before the server or a firewall drops them, and pre-ping replaces dead ones on checkout.
+# Set DATABASE_PGBOUNCER when connecting through PgBouncer in transaction mode: the app then keeps
+# no pool of its own and PgBouncer does the pooling.
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+DATABASE_POOL_TIMEOUT = 10
+DATABASE_POOL_RECYCLE = 1800
+DATABASE_POOL_PRE_PING = True
+DATABASE_PGBOUNCER = os.environ.get('DATABASE_PGBOUNCER', '').lower() in ('1', 'true', 'yes')
+
+# Listing and search views give their connection back before rendering, and a show search runs its
+# venue and artist matches side by side on READS_THREADS threads. False keeps the plain sync path.
+READS_ASYNC = True
+READS_THREADS = 4
+
+# Background jobs (`flask worker`): thread count, how often an idle worker polls, retries with
+# exponential backoff from JOBS_BACKOFF_SECONDS up to JOBS_BACKOFF_MAX_SECONDS, how long a claimed
+# job may run before another worker may take it over, and how long finished jobs are kept
+JOBS_THREADS = 4
+JOBS_POLL_INTERVAL = 1.0
+JOBS_MAX_ATTEMPTS = 5
+JOBS_BACKOFF_SECONDS = 5
+JOBS_BACKOFF_MAX_SECONDS = 600
+JOBS_LEASE_SECONDS = 300
+JOBS_KEEP_DONE_HOURS = 24
+
+# Deleting venues and artists: ids per delete job, and shows deleted per transaction, so a large
+# cleanup holds its locks for one batch at a time
+DELETE_BATCH_SIZE = 100
+DELETE_SHOWS_BATCH_SIZE = 5000
+
+# Seconds to wait for an image host when checking a submitted image link
+IMAGE_CHECK_TIMEOUT = 10
+
+# Image proxy (/images/<size>/<token>): thumbnails of venue and artist images, rendered once
+# per source image into IMAGE_CACHE_DIR and evicted least-recently-served past IMAGE_CACHE_MAX_BYTES.
+# Needs Pillow; without it templates link the original images.
+IMAGE_CACHE_DIR = os.path.join(basedir, 'instance', 'image_cache')
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+IMAGE_SIZES = {'thumb': 320, 'large': 800}
+IMAGE_QUALITY = 80
+IMAGE_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+IMAGE_FETCH_TIMEOUT = 10
+IMAGE_RETRY_SECONDS = 3600
+IMAGE_MAX_AGE = 30 * 24 * 3600
+
+# Static assets: `flask build-assets` writes fingerprinted bundles to static/dist, served with this
+# max-age and `immutable`. ASSETS_DEBUG links the unbundled source files even when a build exists.
+ASSETS_DEBUG = False
+ASSETS_MAX_AGE = 365 * 24 * 3600
+
+# Show times: stored naive in DATES_TIMEZONE and shown in the request's locale (the "locale" cookie or
+# Accept-Language, among DATES_LOCALES) and timezone (the "tz" cookie). Formatted strings are memoized.
+DATES_LOCALE = 'en_US'
+DATES_LOCALES = ['en_US']
+DATES_TIMEZONE = 'UTC'
+DATES_CACHE_SIZE = 16384
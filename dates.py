@@ -0,0 +1,213 @@
+import re
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+import babel.dates
+from babel import Locale
+from flask import _request_ctx_stack
+
+
+# Patterns behind the names templates pass to the `datetime` filter. "short"
+# and "long" are the locale's own formats; anything else is a Babel pattern.
+PATTERNS = {
+    "full": "EEEE MMMM, d, y 'at' h:mma",
+    "medium": "EE MM, dd, y h:mma",
+}
+
+# Pattern letters that depend only on the date, or only on the time of day.
+DATE_FIELDS = frozenset("GyYuUQqMLlwWdDFgEec")
+TIME_FIELDS = frozenset("abBhHKkmsSA")
+
+FIELD = re.compile(r"%\((\w+)\)s")
+
+
+class CompiledPattern(object):
+    """A parsed Babel pattern bound to a locale, its date and time fields formatted separately.
+
+    Shows on the same day share the date fields and shows at the same hour
+    the time fields, so both halves are memoized and a new timestamp is
+    usually assembled from parts already formatted. Patterns with other
+    fields (timezone names, say) are applied whole.
+    """
+
+    def __init__(self, pattern, locale):
+        self.pattern = pattern
+        self.locale = locale
+        keys = FIELD.findall(pattern.format)
+        self.date_keys = [key for key in keys if key[0] in DATE_FIELDS]
+        self.time_keys = [key for key in keys if key[0] in TIME_FIELDS]
+        self.split = len(self.date_keys) + len(self.time_keys) == len(keys)
+        self._date_fields = lru_cache(maxsize=1024)(self._fields(self.date_keys))
+        self._time_fields = lru_cache(maxsize=1024)(self._fields(self.time_keys))
+
+    def _fields(self, keys):
+        def fields(value):
+            formatted = babel.dates.DateTimeFormat(value, self.locale)
+            return {key: formatted[key] for key in keys}
+
+        return fields
+
+    def apply(self, value):
+        if not self.split:
+            return self.pattern.apply(value, self.locale)
+
+        return self.pattern.format % {**self._date_fields(value.date()), **self._time_fields(value.time())}
+
+
+class DateFormatter(object):
+    """Formats show times for templates, in the locale and timezone of the request.
+
+    Babel's format_datetime parses the locale and pattern again on every
+    call; here each (format, locale) pair is compiled once and the
+    formatted strings are memoized in a bounded LRU (DATES_CACHE_SIZE),
+    since a listing repeats the same few start times many times over.
+
+    Stored times are naive, in DATES_TIMEZONE. The locale is the "locale"
+    cookie or the best Accept-Language match among DATES_LOCALES; the
+    timezone is the "tz" cookie when it names a known zone. Both are
+    resolved once per request.
+    """
+
+    def __init__(self):
+        self.locale = "en_US"
+        self.locales = ["en_US"]
+        self.timezone = "UTC"
+        self._lock = threading.Lock()
+        self._compiled = {}
+        self._zones = {}
+        self._request = threading.local()
+        self._cached = lru_cache(maxsize=16384)(self._format)
+
+    def init_app(self, app):
+        config = app.config
+        self.locale = config["DATES_LOCALE"]
+        self.locales = config["DATES_LOCALES"]
+        self.timezone = config["DATES_TIMEZONE"]
+        self._cached = lru_cache(maxsize=config["DATES_CACHE_SIZE"])(self._format)
+
+    # -- formatting -------------------------------------------------------------
+
+    def format(self, value, format="medium", locale=None, timezone=None):
+        """`value` as text; locale and timezone default to the current request's."""
+
+        if value is None:
+            return ""
+        if locale is None or timezone is None:
+            current_locale, current_timezone = self.current()
+            locale = locale or current_locale
+            timezone = timezone or current_timezone
+
+        return self._cached(value, format, locale, timezone)
+
+    def _format(self, value, format, locale, timezone):
+        if not isinstance(value, datetime):
+            value = datetime.combine(value, datetime.min.time())
+        if value.tzinfo is None:
+            value = self._localize(value, self._zone(self.timezone))
+        value = value.astimezone(self._zone(timezone))
+
+        try:
+            compiled = self._compiled[(format, locale)]
+        except KeyError:
+            compiled = self._compile(format, locale)
+
+        if compiled is None:
+            return babel.dates.format_datetime(value, format, tzinfo=value.tzinfo, locale=Locale.parse(locale))
+
+        return compiled.apply(value)
+
+    def _compile(self, format, locale):
+        if format in PATTERNS:
+            compiled = CompiledPattern(babel.dates.parse_pattern(PATTERNS[format]), Locale.parse(locale))
+        elif format in ("short", "long"):
+            # Composed from the locale's date and time formats; left to Babel.
+            compiled = None
+        else:
+            compiled = CompiledPattern(babel.dates.parse_pattern(format), Locale.parse(locale))
+
+        with self._lock:
+            self._compiled[(format, locale)] = compiled
+
+        return compiled
+
+    def to_stored(self, value):
+        """`value` as stored: naive, in DATES_TIMEZONE. Naive values are taken to be stored times already."""
+
+        if value.tzinfo is None:
+            return value
+
+        return value.astimezone(self._zone(self.timezone)).replace(tzinfo=None)
+
+    @staticmethod
+    def _localize(value, zone):
+        # A pytz zone passed as tzinfo= carries its first (LMT) offset;
+        # localize() picks the one in effect at `value`. zoneinfo zones,
+        # which Babel returns when pytz is absent, do that by themselves.
+        if hasattr(zone, "localize"):
+            return zone.localize(value)
+
+        return value.replace(tzinfo=zone)
+
+    def _zone(self, name):
+        zone = self._zones.get(name)
+        if zone is None:
+            zone = self._zones[name] = babel.dates.get_timezone(name)
+
+        return zone
+
+    # -- per request ------------------------------------------------------------
+
+    def current(self):
+        """(locale, timezone) for the current request, or the defaults outside one."""
+
+        # Looked up on the context stack directly and remembered per thread:
+        # the filter runs once per show, and going through `g` costs more
+        # than a cache hit.
+        ctx = _request_ctx_stack.top
+        if ctx is None:
+            return self.locale, self.timezone
+
+        state = self._request
+        if getattr(state, "ctx", None) is not ctx:
+            state.selected = (self._request_locale(ctx.request), self._request_timezone(ctx.request))
+            state.ctx = ctx
+
+        return state.selected
+
+    def _request_locale(self, request):
+        cookie = request.cookies.get("locale")
+        if cookie in self.locales:
+            return cookie
+        if len(self.locales) == 1:
+            return self.locales[0]
+
+        # Werkzeug treats en-US and en_US alike.
+        return request.accept_languages.best_match(self.locales, default=self.locale)
+
+    def _request_timezone(self, request):
+        name = request.cookies.get("tz")
+        if not name or name == self.timezone:
+            return self.timezone
+
+        try:
+            self._zone(name)
+        except (LookupError, ValueError):
+            return self.timezone
+
+        return name
+
+    def page_key(self):
+        """Suffix for page cache keys, so a page is cached once per locale and timezone."""
+
+        return "{}|{}".format(*self.current())
+
+    # -- reporting --------------------------------------------------------------
+
+    def snapshot(self):
+        info = self._cached.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize,
+                "patterns": len(self._compiled)}
+
+
+date_formatter = DateFormatter()
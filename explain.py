@@ -0,0 +1,131 @@
+import json
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from extensions import db
+from models import Artist, City, Genre, Show, State, Venue, artist_genre_association, show_count, \
+    venue_genre_association
+from pagination import _seek
+
+
+class Explain(Executable, ClauseElement):
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = "EXPLAIN QUERY PLAN" if compiler.dialect.name == "sqlite" else "EXPLAIN (FORMAT JSON)"
+    return f"{prefix} {compiler.process(element.statement, **kw)}"
+
+
+# SQLite reports a full pass over a table as SCAN, whether it walks the
+# table or an index in order; a SEARCH is a keyed lookup or range.
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?')
+
+
+def hot_queries():
+    """(name, statement, tables that must be reached through an index) for the app's hot paths."""
+
+    now = datetime.now()
+    s = db.session
+
+    return [
+        # Lookups, foreign-key joins and counter refreshes.
+        ("venue by name", s.query(Venue.id).filter(Venue.name == "x"), ["Venue"]),
+        ("artist by name", s.query(Artist.id).filter(Artist.name == "x"), ["Artist"]),
+        ("city by name and state", s.query(City.id).filter(City.name == "x", City.state_id == 1), ["City"]),
+        ("state by name", s.query(State.id).filter(State.name == "x"), ["State"]),
+        ("genre by name", s.query(Genre.id).filter(Genre.name == "x"), ["Genre"]),
+        ("venue shows", s.query(Show.id).filter(Show.venue_id == 1).order_by(Show.start_time), ["Show"]),
+        ("artist shows", s.query(Show.id).filter(Show.artist_id == 1).order_by(Show.start_time), ["Show"]),
+        ("venue upcoming count", s.query(show_count(Show.venue_id == 1, Show.start_time > now)), ["Show"]),
+        ("artist upcoming count", s.query(show_count(Show.artist_id == 1, Show.start_time > now)), ["Show"]),
+        ("shows after cursor",
+         s.query(Show.id).filter(_seek([Show.start_time, Show.id], [now, 1], True))
+         .order_by(Show.start_time, Show.id).limit(30), ["Show"]),
+        ("venues after cursor",
+         s.query(Venue.id).filter(_seek([Venue.name, Venue.id], ["x", 1], True))
+         .order_by(Venue.name, Venue.id).limit(50), ["Venue"]),
+        ("calendar week in a city",
+         Show.between(now, now + timedelta(days=7), 1).with_entities(Show.id), ["Show", "Venue"]),
+        ("venues in city", s.query(Venue.id).filter(Venue.city_id == 1), ["Venue"]),
+        ("artists in city", s.query(Artist.id).filter(Artist.city_id == 1), ["Artist"]),
+        ("cities in state", s.query(City.id).filter(City.state_id == 1), ["City"]),
+        ("venues with genre",
+         s.query(venue_genre_association.c.venue_id).filter(venue_genre_association.c.genre_id == 1),
+         ["venue_genres"]),
+        ("artists with genre",
+         s.query(artist_genre_association.c.artist_id).filter(artist_genre_association.c.genre_id == 1),
+         ["artist_genres"]),
+    ]
+
+
+def _postgres_nodes(node):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _postgres_nodes(child)
+
+
+def full_scans(plan, dialect):
+    """Tables the plan reads in full: SQLite SCANs, Postgres seq scans and unconditioned index scans."""
+
+    tables = set()
+    if dialect == "sqlite":
+        for line in plan:
+            match = SQLITE_SCAN.match(line)
+            if match:
+                tables.add(match.group(1))
+        return tables
+
+    for node in _postgres_nodes(plan[0]["Plan"]):
+        kind = node["Node Type"]
+        if kind == "Seq Scan" or (kind in ("Index Scan", "Index Only Scan") and "Index Cond" not in node):
+            tables.add(node["Relation Name"])
+
+    return tables
+
+
+def describe(plan, dialect):
+    if dialect == "sqlite":
+        return plan
+
+    return [
+        f'{node["Node Type"]} on {node.get("Relation Name", "-")}'
+        f'{" using " + node["Index Name"] if "Index Name" in node else ""}'
+        f'{" (" + node["Index Cond"] + ")" if "Index Cond" in node else ""}'
+        for node in _postgres_nodes(plan[0]["Plan"])
+    ]
+
+
+def check_plans(queries=None):
+    """EXPLAIN every hot query; return [(name, fully scanned tables, plan lines)] for those that regressed.
+
+    On Postgres the planner is told to avoid sequential scans for the
+    duration of the check, so the answer is "is there a usable index"
+    rather than "is a scan cheaper on today's (possibly tiny) table".
+    """
+
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        connection.execute("SET LOCAL enable_seqscan = off")
+
+    failures = []
+    for name, query, guarded in queries or hot_queries():
+        rows = connection.execute(Explain(query.statement)).fetchall()
+        if dialect == "sqlite":
+            plan = [row[-1] for row in rows]
+        else:
+            plan = rows[0][0] if not isinstance(rows[0][0], str) else json.loads(rows[0][0])
+        scanned = full_scans(plan, dialect) & set(guarded)
+        if scanned:
+            failures.append((name, sorted(scanned), describe(plan, dialect)))
+
+    db.session.rollback()
+
+    return failures
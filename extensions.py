@@ -0,0 +1,18 @@
+from flask_migrate import Migrate
+from flask_moment import Moment
+from flask_sqlalchemy import SQLAlchemy
+from flask_wtf.csrf import CsrfProtect
+
+from cache import PageCache
+from pool import PoolManager
+from profiling import Profiler
+
+
+# Created unbound; create_app() attaches them to an application.
+db = SQLAlchemy()
+migrate = Migrate()
+moment = Moment()
+csrf = CsrfProtect()
+page_cache = PageCache()
+pool = PoolManager()
+profiler = Profiler()
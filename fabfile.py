@@ -13,6 +13,10 @@ def test():
         abort("Aborted at user request.")
 
 
+def benchmark(output="bench_results.json"):
+    local("python -m benchmarks.run --output {}".format(output))
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
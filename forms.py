@@ -1,7 +1,16 @@
 from datetime import datetime
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, ValidationError
+
+from outbound import is_http_url
+
+
+def http_link(form, field):
+    # The server fetches image links for thumbnails, so only web links are taken.
+    if not is_http_url(field.data):
+        raise ValidationError('Must be an http or https link.')
+
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -86,7 +95,7 @@ class VenueForm(Form):
         'phone'
     )
     image_link = StringField(
-        'image_link'
+        'image_link', validators=[Optional(), URL(), http_link]
     )
     genres = SelectMultipleField(
         # TODO implement enum restriction
@@ -192,7 +201,7 @@ class ArtistForm(Form):
         'phone'
     )
     image_link = StringField(
-        'image_link'
+        'image_link', validators=[Optional(), URL(), http_link]
     )
     genres = SelectMultipleField(
         # TODO implement enum restriction
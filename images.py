@@ -0,0 +1,272 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+from flask import Blueprint, abort, current_app, redirect, request, send_file, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from outbound import is_http_url, open_url
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+
+bp = Blueprint("images", __name__)
+
+# (format, file extension, mimetype), best first.
+FORMATS = [("WEBP", "webp", "image/webp"), ("JPEG", "jpg", "image/jpeg")]
+
+
+class ImageCache(object):
+    """Resized copies of venue and artist images, on disk and addressed by content.
+
+    An image link is fetched once; every size in IMAGE_SIZES is rendered
+    from it as WebP and JPEG under thumbs/<sha256 of the source>-<size>.<ext>,
+    so the same picture behind several links is stored once. urls/ maps
+    each link to its digest (an empty file marks a failed fetch, retried
+    after IMAGE_RETRY_SECONDS). The least recently served thumbnails are
+    evicted once the cache grows past IMAGE_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self._lock = threading.Lock()
+        self._fetching = {}
+        self._counters = dict.fromkeys(("hits", "fetches", "failures", "evictions"), 0)
+
+    def init_app(self, app):
+        config = app.config
+        self.directory = config["IMAGE_CACHE_DIR"]
+        self.sizes = config["IMAGE_SIZES"]
+        self.max_bytes = config["IMAGE_CACHE_MAX_BYTES"]
+        self.max_source_bytes = config["IMAGE_MAX_SOURCE_BYTES"]
+        self.timeout = config["IMAGE_FETCH_TIMEOUT"]
+        self.retry_seconds = config["IMAGE_RETRY_SECONDS"]
+        self.quality = config["IMAGE_QUALITY"]
+
+        self.urls = os.path.join(self.directory, "urls")
+        self.thumbs = os.path.join(self.directory, "thumbs")
+        os.makedirs(self.urls, exist_ok=True)
+        os.makedirs(self.thumbs, exist_ok=True)
+
+        self.formats = [f for f in FORMATS if Image is not None and (f[0] != "WEBP" or features.check("webp"))]
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    # -- lookup -----------------------------------------------------------------
+
+    def path(self, url, size, ext):
+        """Path of the `size` thumbnail of `url` as `ext`, fetching the image on first use; None if unavailable."""
+
+        for _ in range(2):
+            digest = self._digest(url)
+            if digest is None:
+                digest = self.fetch(url)
+            if not digest:
+                return None
+
+            path = os.path.join(self.thumbs, f"{digest}-{size}.{ext}")
+            try:
+                # The mtime doubles as last use for eviction.
+                os.utime(path)
+            except OSError:
+                # Evicted since; fetch it again.
+                self._forget(url)
+                continue
+
+            self._count("hits")
+            return path
+
+        return None
+
+    def _url_file(self, url):
+        return os.path.join(self.urls, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def _digest(self, url):
+        """The source digest for `url`, "" while a failed fetch is remembered, or None if never fetched."""
+
+        path = self._url_file(url)
+        try:
+            with open(path) as f:
+                digest = f.read().strip()
+            if not digest and time.time() - os.path.getmtime(path) > self.retry_seconds:
+                return None
+        except OSError:
+            return None
+
+        return digest
+
+    def _forget(self, url):
+        try:
+            os.unlink(self._url_file(url))
+        except OSError:
+            pass
+
+    # -- filling ----------------------------------------------------------------
+
+    def warm(self, url):
+        """Fetch `url` unless it is already cached (or recently failed)."""
+
+        if self._digest(url) is None:
+            self.fetch(url)
+
+    def fetch(self, url):
+        """Download `url` and render every thumbnail; returns the source digest, or "" if it failed.
+
+        Concurrent requests for the same link wait for one download.
+        """
+
+        with self._lock:
+            event = self._fetching.get(url)
+            owner = event is None
+            if owner:
+                event = self._fetching[url] = threading.Event()
+
+        if not owner:
+            event.wait(self.timeout * 2)
+            return self._digest(url) or ""
+
+        try:
+            digest = self._fetch(url)
+        finally:
+            with self._lock:
+                del self._fetching[url]
+            event.set()
+
+        self._write(self._url_file(url), digest.encode("ascii"))
+        if digest:
+            self._prune()
+
+        return digest
+
+    def _fetch(self, url):
+        try:
+            with open_url(url, self.timeout) as response:
+                if not response.headers.get("Content-Type", "").startswith("image/"):
+                    raise ValueError("not an image")
+                data = response.read(self.max_source_bytes + 1)
+            if len(data) > self.max_source_bytes:
+                raise ValueError("image too large")
+
+            digest = hashlib.sha256(data).hexdigest()
+            if not all(os.path.exists(os.path.join(self.thumbs, f"{digest}-{size}.{ext}"))
+                       for size in self.sizes for _, ext, _ in self.formats):
+                self._render(data, digest)
+        except Exception as e:
+            current_app.logger.info("Could not thumbnail %s: %s", url, e)
+            self._count("failures")
+            return ""
+
+        self._count("fetches")
+        return digest
+
+    def _render(self, data, digest):
+        with Image.open(io.BytesIO(data)) as source:
+            # Lets JPEG decode at a reduced scale instead of full size.
+            source.draft("RGB", (max(self.sizes.values()),) * 2)
+            image = ImageOps.exif_transpose(source).convert("RGB")
+
+        for size, width in self.sizes.items():
+            thumb = image.copy()
+            thumb.thumbnail((width, width), Image.LANCZOS)
+            for fmt, ext, _ in self.formats:
+                out = io.BytesIO()
+                thumb.save(out, fmt, quality=self.quality, **({"optimize": True} if fmt == "JPEG" else {}))
+                self._write(os.path.join(self.thumbs, f"{digest}-{size}.{ext}"), out.getvalue())
+
+    @staticmethod
+    def _write(path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.thumbs):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+
+        # Down to three quarters so eviction is not paid on every fetch.
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            self._count("evictions")
+
+    # -- reporting --------------------------------------------------------------
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"enabled": self.enabled, **self._counters}
+
+
+image_cache = ImageCache()
+
+
+def _serializer():
+    config = current_app.config
+    return URLSafeSerializer(config.get("IMAGE_PROXY_SECRET") or config["SECRET_KEY"], salt="image-proxy")
+
+
+def thumbnail_url(link, size="thumb"):
+    """URL of the cached `size` thumbnail for an image link (signed, so the proxy only fetches our links)."""
+
+    if not link:
+        return ""
+    if not image_cache.enabled:
+        return link
+
+    return url_for("images.thumbnail", size=size, token=_serializer().dumps(link))
+
+
+@bp.route("/images/<size>/<token>")
+def thumbnail(size, token):
+    if size not in image_cache.sizes:
+        abort(404)
+    try:
+        url = _serializer().loads(token)
+    except BadSignature:
+        abort(404)
+
+    # WebP only when the browser names it (image/* does not promise it); JPEG otherwise.
+    named = {mimetype for mimetype, _ in request.accept_mimetypes}
+    chosen = next((f for f in image_cache.formats if f[2] in named), image_cache.formats[-1] if image_cache.formats else None)
+    path = image_cache.path(url, size, chosen[1]) if chosen else None
+    if path is None:
+        # Not an image we can resize; let the browser try the original, if it is a web link.
+        if not is_http_url(url):
+            abort(404)
+        return redirect(url)
+
+    response = send_file(path, mimetype=chosen[2], add_etags=False, cache_timeout=current_app.config["IMAGE_MAX_AGE"])
+    # The file name is content-addressed, unlike the mtime, which serving touches.
+    del response.headers["Last-Modified"]
+    response.set_etag(os.path.basename(path))
+    response.cache_control.public = True
+    response.vary.add("Accept")
+    response.make_conditional(request)
+
+    return response
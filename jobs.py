@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, func, or_, select
+
+from extensions import db
+from models import Job
+from profiling import percentile
+
+
+log = logging.getLogger(__name__)
+
+
+class JobQueue(object):
+    """Background jobs with no broker: the "Job" table is the queue.
+
+    Views enqueue inside their own transaction, so a job exists only if the
+    write that asked for it commits. `flask worker` claims due jobs, runs
+    them on a thread pool and retries failures with exponential backoff and
+    jitter until the job's max_attempts; a job whose worker died is claimed
+    again once its lease (JOBS_LEASE_SECONDS) has run out, so tasks must be
+    safe to run twice. Queue depth and wait/run times are reported under
+    "jobs" in /_metrics.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.samples = 1000
+
+    def init_app(self, app):
+        self.samples = app.config.get("PROFILER_SAMPLES", 1000)
+
+    def task(self, name, max_attempts=None):
+        """Register the decorated function as the job `name`; it is called with the payload as keywords."""
+
+        def decorator(fn):
+            self.tasks[name] = (fn, max_attempts)
+            return fn
+
+        return decorator
+
+    # -- producing --------------------------------------------------------------
+
+    def enqueue(self, name, delay=0, session=None, **payload):
+        self.enqueue_many(name, [payload], delay, session)
+
+    def enqueue_many(self, name, payloads, delay=0, session=None):
+        """Add a `name` job per payload to the current transaction; nothing is committed."""
+
+        if name not in self.tasks:
+            raise KeyError(f"unknown job {name!r}")
+
+        session = session or db.session
+        now = datetime.now()
+        max_attempts = self.tasks[name][1] or current_app.config["JOBS_MAX_ATTEMPTS"]
+        rows = [{
+            "name": name, "payload": json.dumps(payload, sort_keys=True), "status": "queued", "attempts": 0,
+            "max_attempts": max_attempts, "run_at": now + timedelta(seconds=delay), "created_at": now,
+        } for payload in payloads]
+
+        if rows:
+            session.execute(Job.__table__.insert(), rows)
+
+        return len(rows)
+
+    # -- consuming --------------------------------------------------------------
+
+    def claim(self, worker, limit, session=None):
+        """Lock up to `limit` due jobs for `worker` and return them, committed as running.
+
+        Due means queued with run_at passed, or running under an expired
+        lease. Concurrent workers skip each other's rows on Postgres (FOR
+        UPDATE SKIP LOCKED); SQLite serializes the claiming UPDATEs.
+        """
+
+        session = session or db.session
+        now = datetime.now()
+        expired = now - timedelta(seconds=current_app.config["JOBS_LEASE_SECONDS"])
+        token = f"{worker}:{uuid.uuid4().hex[:12]}"
+
+        due = select([Job.id]).where(or_(
+            and_(Job.status == "queued", Job.run_at <= now),
+            and_(Job.status == "running", Job.locked_at < expired),
+        )).order_by(Job.run_at, Job.id).limit(limit).with_for_update(skip_locked=True)
+
+        session.execute(Job.__table__.update().where(Job.id.in_(due)).values(
+            status="running", locked_by=token, locked_at=now, started_at=now, attempts=Job.attempts + 1,
+        ))
+        claimed = session.query(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts, Job.locked_by) \
+            .filter(Job.status == "running", Job.locked_by == token).order_by(Job.run_at, Job.id).all()
+        session.commit()
+
+        return claimed
+
+    def backoff(self, attempts):
+        """Seconds before retry number `attempts`: doubling from JOBS_BACKOFF_SECONDS, capped, with jitter."""
+
+        config = current_app.config
+        delay = min(config["JOBS_BACKOFF_SECONDS"] * 2 ** (attempts - 1), config["JOBS_BACKOFF_MAX_SECONDS"])
+
+        return delay * random.uniform(0.5, 1.0)
+
+    def run(self, job, session=None):
+        """Run one claimed job and record how it went; returns the job's new status."""
+
+        session = session or db.session
+        fn, _ = self.tasks.get(job.name, (None, None))
+        values = {"status": "done", "last_error": None}
+
+        if fn is None:
+            values.update(status="failed", last_error=f"unknown job {job.name!r}")
+        elif job.attempts > job.max_attempts:
+            values.update(status="failed", last_error="lease expired on the last attempt")
+        else:
+            try:
+                fn(**json.loads(job.payload))
+                session.commit()
+            except Exception:
+                session.rollback()
+                values["last_error"] = traceback.format_exc(limit=5)
+                if job.attempts >= job.max_attempts:
+                    values["status"] = "failed"
+                    log.error("Job %s %s failed for good:\n%s", job.id, job.name, values["last_error"])
+                else:
+                    retry_at = datetime.now() + timedelta(seconds=self.backoff(job.attempts))
+                    values.update(status="queued", run_at=retry_at)
+                    log.warning("Job %s %s failed, attempt %s of %s", job.id, job.name, job.attempts, job.max_attempts)
+
+        if values["status"] != "queued":
+            values["finished_at"] = datetime.now()
+
+        # Only if the lease still holds; otherwise another worker owns the job now.
+        session.execute(Job.__table__.update().where(and_(Job.id == job.id, Job.locked_by == job.locked_by))
+                        .values(locked_by=None, locked_at=None, **values))
+        session.commit()
+
+        return values["status"]
+
+    def prune(self, before, session=None):
+        """Delete done jobs that finished before `before`; failed ones are kept for inspection."""
+
+        session = session or db.session
+        deleted = session.query(Job).filter(Job.status == "done", Job.finished_at < before) \
+            .delete(synchronize_session=False)
+        session.commit()
+
+        return deleted
+
+    # -- reporting --------------------------------------------------------------
+
+    def snapshot(self):
+        now = datetime.now()
+        session = db.session
+
+        depth = dict.fromkeys(("queued", "running", "failed"), 0)
+        depth.update(session.query(Job.status, func.count(Job.id)).filter(Job.status != "done").group_by(Job.status))
+        oldest = session.query(func.min(Job.run_at)).filter(Job.status == "queued", Job.run_at <= now).scalar()
+
+        recent = session.query(Job.run_at, Job.started_at, Job.finished_at) \
+            .filter(Job.status == "done").order_by(Job.finished_at.desc()).limit(self.samples).all()
+        waits = sorted(round((started - run_at).total_seconds() * 1000, 3) for run_at, started, _ in recent)
+        runs = sorted(round((finished - started).total_seconds() * 1000, 3) for _, started, finished in recent)
+
+        def summary(values):
+            return {"p50": percentile(values, 0.50), "p95": percentile(values, 0.95),
+                    "max": values[-1] if values else None}
+
+        return {
+            **depth,
+            "oldest_due_s": round((now - oldest).total_seconds(), 3) if oldest else None,
+            "wait_ms": summary(waits),
+            "run_ms": summary(runs),
+        }
+
+
+class Worker(object):
+    """Polls the queue and runs jobs on a thread pool, each inside its own app context."""
+
+    prune_every = timedelta(hours=1)
+
+    def __init__(self, app, queue, threads=4, poll_interval=1.0):
+        self.app = app
+        self.queue = queue
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._pruned_at = None
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, once=False):
+        """Work until stop() (or Ctrl-C); with `once`, return as soon as nothing is due or running."""
+
+        executor = ThreadPoolExecutor(self.threads, thread_name_prefix="job")
+        busy = set()
+        try:
+            while not self._stop.is_set():
+                busy = {future for future in busy if not future.done()}
+                claimed = []
+                if len(busy) < self.threads:
+                    with self.app.app_context():
+                        self._prune()
+                        claimed = self.queue.claim(self.name, self.threads - len(busy))
+                    busy.update(executor.submit(self._run, job) for job in claimed)
+
+                if once and not busy:
+                    break
+                if len(busy) >= self.threads or (once and not claimed):
+                    wait(busy, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                elif not claimed:
+                    self._stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            self.stop()
+        finally:
+            # Let running jobs finish; anything still unclaimed stays queued.
+            executor.shutdown(wait=True)
+
+    def _run(self, job):
+        with self.app.app_context():
+            try:
+                return self.queue.run(job)
+            except Exception:
+                log.exception("Could not record the outcome of job %s", job.id)
+
+    def _prune(self):
+        now = datetime.now()
+        if self._pruned_at is None or now - self._pruned_at >= self.prune_every:
+            self._pruned_at = now
+            self.queue.prune(now - timedelta(hours=self.app.config["JOBS_KEEP_DONE_HOURS"]))
+
+
+queue = JobQueue()
@@ -0,0 +1,64 @@
+"""search indexes
+
+Revision ID: 5d1e0c7a9f42
+Revises: 2bac506c8831
+Create Date: 2026-10-17 09:12:40.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1e0c7a9f42'
+down_revision = '2bac506c8831'
+branch_labels = None
+depends_on = None
+
+
+TRIGRAM_COLUMNS = [('Venue', 'name'), ('Artist', 'name'), ('City', 'name'), ('Genre', 'name')]
+
+# kind, table, genre association table, its foreign key; the same rows
+# SqliteFtsSearch.reindex() writes.
+SEARCH_TARGETS = [('venue', 'Venue', 'venue_genres', 'venue_id'), ('artist', 'Artist', 'artist_genres', 'artist_id')]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+        for table, column in TRIGRAM_COLUMNS:
+            op.execute(f'CREATE INDEX ix_{table}_{column}_trgm ON "{table}" USING gin ({column} gin_trgm_ops)')
+
+        for table in ('Venue', 'Artist'):
+            op.execute(f'ALTER TABLE "{table}" ADD COLUMN search_vector tsvector '
+                       f"GENERATED ALWAYS AS (to_tsvector('simple', coalesce(name, ''))) STORED")
+            op.execute(f'CREATE INDEX ix_{table}_search_vector ON "{table}" USING gin (search_vector)')
+
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+                   "kind UNINDEXED, ref_id UNINDEXED, name, place, genres, "
+                   "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+
+        for kind, table, assoc, fk in SEARCH_TARGETS:
+            op.execute(
+                f"INSERT INTO search_index (kind, ref_id, name, place, genres) "
+                f"SELECT '{kind}', t.id, t.name, c.name || ' ' || s.name, "
+                f"(SELECT group_concat(g.name, ' ') FROM {assoc} a "
+                f"JOIN \"Genre\" g ON g.id = a.genre_id WHERE a.{fk} = t.id) "
+                f"FROM \"{table}\" t JOIN \"City\" c ON c.id = t.city_id "
+                f"JOIN \"State\" s ON s.id = c.state_id"
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in ('Venue', 'Artist'):
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_search_vector')
+            op.drop_column(table, 'search_vector')
+
+        for table, column in TRIGRAM_COLUMNS:
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_{column}_trgm')
+
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS search_index')
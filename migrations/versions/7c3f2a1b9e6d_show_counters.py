@@ -0,0 +1,46 @@
+"""materialized show counters
+
+Revision ID: 7c3f2a1b9e6d
+Revises: 5d1e0c7a9f42
+Create Date: 2026-10-17 14:03:11.204519
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3f2a1b9e6d'
+down_revision = '5d1e0c7a9f42'
+branch_labels = None
+depends_on = None
+
+
+TABLES = [('Venue', 'venue_id'), ('Artist', 'artist_id')]
+
+
+def upgrade():
+    for table, fk in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('num_upcoming_shows', sa.Integer(), nullable=False, server_default='0'))
+            batch_op.add_column(sa.Column('num_past_shows', sa.Integer(), nullable=False, server_default='0'))
+        op.create_index(f'ix_{table}_num_upcoming_shows', table, ['num_upcoming_shows'])
+
+        # Show times are naive local times, so compare against the same rather than CURRENT_TIMESTAMP.
+        op.get_bind().execute(sa.text(
+            f'UPDATE "{table}" SET '
+            f'num_upcoming_shows = (SELECT count(*) FROM "Show" WHERE "Show".{fk} = "{table}".id '
+            f'AND "Show".start_time > :now), '
+            f'num_past_shows = (SELECT count(*) FROM "Show" WHERE "Show".{fk} = "{table}".id '
+            f'AND "Show".start_time <= :now)'
+        ), now=datetime.now())
+
+
+def downgrade():
+    for table, _ in TABLES:
+        op.drop_index(f'ix_{table}_num_upcoming_shows', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('num_past_shows')
+            batch_op.drop_column('num_upcoming_shows')
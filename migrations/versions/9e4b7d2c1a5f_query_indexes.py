@@ -0,0 +1,68 @@
+"""indexes for foreign keys, show time ranges and name lookups
+
+Revision ID: 9e4b7d2c1a5f
+Revises: 7c3f2a1b9e6d
+Create Date: 2026-10-17 16:41:52.930166
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7d2c1a5f'
+down_revision = '7c3f2a1b9e6d'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns, unique)
+INDEXES = [
+    ('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], False),
+    ('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], False),
+    ('ix_Show_start_time_id', 'Show', ['start_time', 'id'], False),
+    ('ix_Venue_name_id', 'Venue', ['name', 'id'], False),
+    ('ix_Venue_city_id', 'Venue', ['city_id'], False),
+    ('ix_Artist_name_id', 'Artist', ['name', 'id'], False),
+    ('ix_Artist_city_id', 'Artist', ['city_id'], False),
+    ('ix_City_state_id', 'City', ['state_id'], False),
+    ('ix_venue_genres_genre_id', 'venue_genres', ['genre_id'], False),
+    ('ix_artist_genres_genre_id', 'artist_genres', ['genre_id'], False),
+    ('uq_State_name', 'State', ['name'], True),
+    ('uq_City_name_state_id', 'City', ['name', 'state_id'], True),
+]
+
+
+def merge_duplicates(table, key, referencing):
+    """Point rows in `referencing` at the lowest id of each `key` group, then drop the other duplicates."""
+
+    keep = f'SELECT min(id) FROM "{table}" GROUP BY {", ".join(key)}'
+    same = ' AND '.join(f'd.{c} = k.{c}' for c in key)
+
+    for ref_table, fk in referencing:
+        op.execute(
+            f'UPDATE "{ref_table}" SET {fk} = ('
+            f'SELECT min(k.id) FROM "{table}" d JOIN "{table}" k ON {same} WHERE d.id = "{ref_table}".{fk}'
+            f') WHERE {fk} NOT IN ({keep})'
+        )
+    op.execute(f'DELETE FROM "{table}" WHERE id NOT IN ({keep})')
+
+
+def upgrade():
+    # get_or_create() never enforced uniqueness, so fold existing duplicates
+    # (states first: merging them can make cities collide) before the unique indexes.
+    merge_duplicates('State', ['name'], [('City', 'state_id')])
+    merge_duplicates('City', ['name', 'state_id'], [('Venue', 'city_id'), ('Artist', 'city_id')])
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # Build without blocking writes; CONCURRENTLY cannot run inside the migration transaction.
+        with op.get_context().autocommit_block():
+            for name, table, columns, unique in INDEXES:
+                op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
+    else:
+        for name, table, columns, unique in INDEXES:
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
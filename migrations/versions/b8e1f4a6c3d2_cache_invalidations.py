@@ -0,0 +1,32 @@
+"""page-cache invalidations shared between processes
+
+Revision ID: b8e1f4a6c3d2
+Revises: a7d3e5c9f2b6
+Create Date: 2026-10-18 09:14:27.306518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e1f4a6c3d2'
+down_revision = 'a7d3e5c9f2b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'CacheInvalidation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tags', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_CacheInvalidation_created_at', 'CacheInvalidation', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_CacheInvalidation_created_at', table_name='CacheInvalidation')
+    op.drop_table('CacheInvalidation')
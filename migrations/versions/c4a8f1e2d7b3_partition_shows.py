@@ -0,0 +1,102 @@
+"""partition Show by month on postgres
+
+Revision ID: c4a8f1e2d7b3
+Revises: 9e4b7d2c1a5f
+Create Date: 2026-10-17 19:22:07.615342
+
+"""
+from datetime import date, timedelta
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a8f1e2d7b3'
+down_revision = '9e4b7d2c1a5f'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_Show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', ['artist_id', 'start_time']),
+    ('ix_Show_start_time_id', ['start_time', 'id']),
+]
+
+COLUMNS = 'id, start_time, artist_id, venue_id'
+
+# Partitions are created up to this many months ahead; `flask ensure-partitions` keeps extending them.
+MONTHS_AHEAD = 12
+
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # SQLite keeps a single table; the (start_time, id) index serves the calendar ranges.
+        return
+
+    for name, _ in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS "{name}"')
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_unpartitioned"')
+    op.execute('ALTER TABLE "Show_unpartitioned" RENAME CONSTRAINT "Show_pkey" TO "Show_unpartitioned_pkey"')
+
+    # The partition key has to be part of the primary key.
+    op.execute(
+        'CREATE TABLE "Show" ('
+        'id integer NOT NULL DEFAULT nextval(\'"Show_id_seq"\'::regclass), '
+        'start_time timestamp without time zone NOT NULL, '
+        'artist_id integer NOT NULL REFERENCES "Artist" (id), '
+        'venue_id integer NOT NULL REFERENCES "Venue" (id), '
+        'PRIMARY KEY (id, start_time)'
+        ') PARTITION BY RANGE (start_time)'
+    )
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+    first = bind.execute('SELECT min(start_time) FROM "Show_unpartitioned"').scalar()
+    month = (first.date() if first else date.today()).replace(day=1)
+    last = date.today().replace(day=1)
+    for _ in range(MONTHS_AHEAD):
+        last = next_month(last)
+
+    while month <= last:
+        upper = next_month(month)
+        op.execute(f'CREATE TABLE "Show_{month:%Y_%m}" PARTITION OF "Show" '
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')")
+        month = upper
+
+    for name, columns in INDEXES:
+        op.create_index(name, 'Show', columns)
+
+    op.execute(f'INSERT INTO "Show" ({COLUMNS}) SELECT {COLUMNS} FROM "Show_unpartitioned"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute('DROP TABLE "Show_unpartitioned"')
+    op.execute('ANALYZE "Show"')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # Only rows in attached partitions come back; detached archive partitions are left alone.
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_partitioned"')
+    for name, _ in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+    op.execute(
+        'CREATE TABLE "Show" ('
+        'id integer NOT NULL DEFAULT nextval(\'"Show_id_seq"\'::regclass) PRIMARY KEY, '
+        'start_time timestamp without time zone NOT NULL, '
+        'artist_id integer NOT NULL REFERENCES "Artist" (id), '
+        'venue_id integer NOT NULL REFERENCES "Venue" (id)'
+        ')'
+    )
+    op.execute(f'INSERT INTO "Show" ({COLUMNS}) SELECT {COLUMNS} FROM "Show_partitioned"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute('DROP TABLE "Show_partitioned" CASCADE')
+
+    for name, columns in INDEXES:
+        op.create_index(name, 'Show', columns)
@@ -0,0 +1,44 @@
+"""background job queue
+
+Revision ID: e2b6d9a4f1c8
+Revises: c4a8f1e2d7b3
+Create Date: 2026-10-17 19:12:40.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b6d9a4f1c8'
+down_revision = 'c4a8f1e2d7b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'Job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_by', sa.String(length=64), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_Job_status_run_at', 'Job', ['status', 'run_at'])
+    op.create_index('ix_Job_status_finished_at', 'Job', ['status', 'finished_at'])
+
+
+def downgrade():
+    op.drop_index('ix_Job_status_finished_at', table_name='Job')
+    op.drop_index('ix_Job_status_run_at', table_name='Job')
+    op.drop_table('Job')
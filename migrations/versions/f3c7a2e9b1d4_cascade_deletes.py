@@ -0,0 +1,46 @@
+"""cascade venue and artist deletes to shows and genre links
+
+Revision ID: f3c7a2e9b1d4
+Revises: e2b6d9a4f1c8
+Create Date: 2026-10-17 20:41:13.207584
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c7a2e9b1d4'
+down_revision = 'e2b6d9a4f1c8'
+branch_labels = None
+depends_on = None
+
+
+# (table, column, referenced table), under PostgreSQL's default constraint names.
+FOREIGN_KEYS = [
+    ('Show', 'venue_id', 'Venue'),
+    ('Show', 'artist_id', 'Artist'),
+    ('venue_genres', 'venue_id', 'Venue'),
+    ('artist_genres', 'artist_id', 'Artist'),
+]
+
+
+def _recreate(ondelete):
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite only changes a foreign key by copying the table, and only
+        # enforces one with PRAGMA foreign_keys; the app deletes shows and
+        # genre links itself in any case.
+        return
+
+    # On the partitioned Show table the parent's constraint covers every partition.
+    for table, column, referenced in FOREIGN_KEYS:
+        name = f'{table}_{column}_fkey'
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referenced, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _recreate('CASCADE')
+
+
+def downgrade():
+    _recreate(None)
@@ -0,0 +1,511 @@
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import and_, event, func, inspect, select
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.exc import NoResultFound
+
+from extensions import db
+from pagination import keyset_paginate
+
+
+artist_genre_association = db.Table('artist_genres',
+                                    db.Column('artist_id', db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+                                    db.Column('genre_id', db.ForeignKey('Genre.id'), primary_key=True),
+                                    db.Index('ix_artist_genres_genre_id', 'genre_id')
+                                    )
+
+venue_genre_association = db.Table('venue_genres',
+                                   db.Column('venue_id', db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+                                   db.Column('genre_id', db.ForeignKey('Genre.id'), primary_key=True),
+                                   db.Index('ix_venue_genres_genre_id', 'genre_id')
+                                   )
+
+
+def recent_shows(query, fk, entity_id, past_limit=None, now=None):
+    """Upcoming shows of `query` and its `past_limit` most recent past ones, against one `now`.
+
+    `query` is the venue's or artist's shows (`fk` == `entity_id`), with
+    whatever eager loads the page needs. The past count covers every past
+    show still in Show, and `has_older` says whether there is more history
+    to page through, live or archived; see archive.past_shows.
+    """
+
+    now = now or datetime.now()
+    upcoming = query.filter(Show.start_time > now).order_by(Show.start_time).all()
+    past = query.filter(Show.start_time <= now).order_by(Show.start_time.desc(), Show.id.desc()) \
+        .limit(past_limit).all()
+    past.reverse()
+
+    past_count = len(past)
+    if past_limit is not None and past_count == past_limit:
+        past_count = db.session.query(func.count(Show.id)).filter(fk == entity_id, Show.start_time <= now).scalar()
+
+    archived = getattr(ArchivedShow, fk.key)
+    has_older = past_count > len(past) or \
+        db.session.query(db.session.query(ArchivedShow.id).filter(archived == entity_id).exists()).scalar()
+
+    return {
+        "past_shows": past,
+        "upcoming_shows": upcoming,
+        "past_shows_count": past_count,
+        "upcoming_shows_count": len(upcoming),
+        "has_older": has_older,
+    }
+
+
+def show_count(*criteria):
+    """Correlated scalar subquery counting the shows matching `criteria`."""
+
+    return select([func.count(Show.id)]).where(and_(*criteria)).as_scalar()
+
+
+def genre_names(model, assoc, fk, separator=";"):
+    """Correlated scalar subquery: the entity's genre names joined by `separator`."""
+
+    if db.session.bind.dialect.name == "postgresql":
+        names = func.string_agg(Genre.name, separator)
+    else:
+        names = func.group_concat(Genre.name, separator)
+
+    return db.session.query(names) \
+        .select_from(assoc).join(Genre, Genre.id == assoc.c.genre_id) \
+        .filter(assoc.c[fk] == model.id).correlate(model).as_scalar()
+
+
+class Venue(db.Model):
+    __tablename__ = "Venue"
+    __table_args__ = (
+        db.Index('ix_Venue_name_id', 'name', 'id'),
+        db.Index('ix_Venue_city_id', 'city_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    address = db.Column(db.String(120))
+    city_id = db.Column(db.Integer, db.ForeignKey('City.id'), nullable=False)
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String)
+    seeking_talent = db.Column(db.Boolean)
+    seeking_description = db.Column(db.String)
+    # Materialized show counters; see refresh_show_counters().
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    shows = db.relationship('Show', backref="Venue", lazy='dynamic')
+    genres = db.relationship('Genre', secondary=venue_genre_association ,backref=db.backref("Venue", lazy=True))
+
+    city = db.relationship('City', backref="City", lazy=True)
+
+    @classmethod
+    def get_or_create(cls, session, **kwargs):
+
+        try:
+            return session.query(cls).filter_by(**kwargs).one()
+        except NoResultFound:
+            r = cls(**kwargs)
+            session.add(r)
+
+            return r
+
+    @classmethod
+    def directory(cls, per_page, after=None, before=None):
+        """One keyset page of venues grouped by (state, city), in one query.
+
+        The keyset runs over state, city and venue name, so a page picks up
+        exactly where the last one stopped, mid-city if need be.
+        """
+
+        query = db.session.query(State.name, City.id, City.name, cls.id, cls.name, cls.num_upcoming_shows) \
+            .join(City, cls.city_id == City.id) \
+            .join(State, City.state_id == State.id)
+
+        page = keyset_paginate(query, [State.name, City.name, City.id, cls.name, cls.id], per_page,
+                               after=after, before=before, key=lambda row: [row[0], row[2], row[1], row[4], row[3]])
+
+        rows = page.items
+        page.items = [
+            {
+                "state": state,
+                "city": city,
+                "venues": [
+                    {"id": row[3], "name": row[4], "num_upcoming_shows": row[5]}
+                    for row in venues
+                ],
+            }
+            for (state, _, city), venues in groupby(rows, key=lambda row: row[:3])
+        ]
+
+        return page
+
+    @classmethod
+    def get_with_shows(cls, venue_id, past_limit=None):
+        """Load a venue, its upcoming shows and its `past_limit` latest past ones (artist eager-joined).
+
+        A fixed number of queries however long the venue's history is.
+        """
+
+        venue = cls.query.options(
+            joinedload(cls.city).joinedload(City.state),
+            selectinload(cls.genres),
+        ).filter(cls.id == venue_id).one()
+
+        shows = Show.query.options(joinedload(Show.Artist)).filter(Show.venue_id == venue_id)
+
+        return venue, recent_shows(shows, Show.venue_id, venue_id, past_limit)
+
+    @hybrid_property
+    def upcoming_shows(self):
+
+        today = datetime.now()
+
+        return self.shows.filter(Show.start_time > today).all()
+
+    @hybrid_property
+    def past_shows(self):
+
+        today = datetime.now()
+
+        return self.shows.filter(Show.start_time < today).all()
+
+    @hybrid_property
+    def upcoming_shows_count(self):
+
+        return self.shows.filter(Show.start_time > datetime.now()).count()
+
+    @upcoming_shows_count.expression
+    def upcoming_shows_count(cls):
+
+        return show_count(Show.venue_id == cls.id, Show.start_time > datetime.now())
+
+    @hybrid_property
+    def past_shows_count(self):
+
+        return self.shows.filter(Show.start_time <= datetime.now()).count()
+
+    @past_shows_count.expression
+    def past_shows_count(cls):
+
+        return show_count(Show.venue_id == cls.id, Show.start_time <= datetime.now())
+
+
+
+class Genre(db.Model):
+
+    __tablename__ = "Genre"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, unique=True, nullable=False)
+
+    @classmethod
+    def get_or_create(cls, session, **kwargs):
+
+        try:
+            return session.query(cls).filter_by(**kwargs).one()
+        except NoResultFound:
+            r = cls(**kwargs)
+            session.add(r)
+
+            return r
+
+
+
+class Artist(db.Model):
+    __tablename__ = "Artist"
+    __table_args__ = (
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        db.Index('ix_Artist_city_id', 'city_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    city_id = db.Column(db.Integer, db.ForeignKey('City.id'), nullable=False)
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String)
+    seeking_venue = db.Column(db.Boolean)
+    seeking_description = db.Column(db.String)
+    # Materialized show counters; see refresh_show_counters().
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    shows = db.relationship('Show', backref='Artist', lazy='dynamic')
+    genres = db.relationship('Genre', secondary=artist_genre_association, backref=db.backref('Genre', lazy=True))
+
+    city = db.relationship('City', backref="Artist", lazy=True)
+
+    @classmethod
+    def get_or_create(cls, session, **kwargs):
+
+        try:
+            return session.query(cls).filter_by(**kwargs).one()
+        except NoResultFound:
+            r = cls(**kwargs)
+            session.add(r)
+
+            return r
+
+    @classmethod
+    def get_with_shows(cls, artist_id, past_limit=None):
+        """Load an artist, its upcoming shows and its `past_limit` latest past ones (venue eager-joined).
+
+        A fixed number of queries however long the artist's history is.
+        """
+
+        artist = cls.query.options(
+            joinedload(cls.city).joinedload(City.state),
+            selectinload(cls.genres),
+        ).filter(cls.id == artist_id).one()
+
+        shows = Show.query.options(joinedload(Show.Venue)).filter(Show.artist_id == artist_id)
+
+        return artist, recent_shows(shows, Show.artist_id, artist_id, past_limit)
+
+    @hybrid_property
+    def upcoming_shows(self):
+
+        today = datetime.now()
+
+        return self.shows.filter(Show.start_time > today).all()
+
+    @hybrid_property
+    def past_shows(self):
+
+        today = datetime.now()
+
+        return self.shows.filter(Show.start_time < today).all()
+
+    @hybrid_property
+    def upcoming_shows_count(self):
+
+        return self.shows.filter(Show.start_time > datetime.now()).count()
+
+    @upcoming_shows_count.expression
+    def upcoming_shows_count(cls):
+
+        return show_count(Show.artist_id == cls.id, Show.start_time > datetime.now())
+
+    @hybrid_property
+    def past_shows_count(self):
+
+        return self.shows.filter(Show.start_time <= datetime.now()).count()
+
+    @past_shows_count.expression
+    def past_shows_count(cls):
+
+        return show_count(Show.artist_id == cls.id, Show.start_time <= datetime.now())
+
+class Show(db.Model):
+    __tablename__ = "Show"
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # active_history: the counter events below need the previous value even when it was never loaded.
+    start_time = db.column_property(db.Column(db.DateTime, nullable=False), active_history=True)
+    artist_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False), active_history=True)
+    venue_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False), active_history=True)
+
+    @classmethod
+    def get_or_create(cls, session, **kwargs):
+
+        try:
+            return session.query(cls).filter_by(**kwargs).one()
+        except NoResultFound:
+            r = cls(**kwargs)
+            session.add(r)
+
+            return r
+
+    @classmethod
+    def between(cls, start, end, city_id=None):
+        """Shows starting in [start, end), optionally only at venues in one city.
+
+        A plain range on start_time, so on a partitioned Show table only the
+        months that overlap the range are read.
+        """
+
+        query = cls.query.filter(cls.start_time >= start, cls.start_time < end)
+        if city_id is not None:
+            query = query.filter(cls.venue_id.in_(db.session.query(Venue.id).filter(Venue.city_id == city_id)))
+
+        return query
+
+    @classmethod
+    def cities_between(cls, start, end, limit=20):
+        """(city id, city, state, show count) for the busiest cities in [start, end)."""
+
+        return db.session.query(City.id, City.name, State.name, func.count(cls.id)) \
+            .select_from(cls) \
+            .join(Venue, cls.venue_id == Venue.id) \
+            .join(City, Venue.city_id == City.id) \
+            .join(State, City.state_id == State.id) \
+            .filter(cls.start_time >= start, cls.start_time < end) \
+            .group_by(City.id, City.name, State.name) \
+            .order_by(func.count(cls.id).desc(), City.name) \
+            .limit(limit).all()
+
+
+class ArchivedShow(db.Model):
+    """A past show moved out of Show by `flask archive-shows`; see archive.py.
+
+    It keeps its id and no longer counts towards the show counters.
+    """
+
+    __tablename__ = "ShowArchive"
+    __table_args__ = (
+        db.Index('ix_ShowArchive_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_ShowArchive_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+
+def _bump_counters(connection, venue_id, artist_id, start_time, delta):
+    column = "num_upcoming_shows" if start_time > datetime.now() else "num_past_shows"
+
+    for table, entity_id in ((Venue.__table__, venue_id), (Artist.__table__, artist_id)):
+        connection.execute(table.update().where(table.c.id == entity_id)
+                           .values({column: table.c[column] + delta}))
+
+
+@event.listens_for(Show, "after_insert")
+def _show_inserted(mapper, connection, show):
+    _bump_counters(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+
+@event.listens_for(Show, "after_delete")
+def _show_deleted(mapper, connection, show):
+    _bump_counters(connection, show.venue_id, show.artist_id, show.start_time, -1)
+
+
+@event.listens_for(Show, "after_update")
+def _show_updated(mapper, connection, show):
+    state = inspect(show)
+    old = {}
+    for attr in ("venue_id", "artist_id", "start_time"):
+        history = state.attrs[attr].history
+        old[attr] = history.deleted[0] if history.deleted else getattr(show, attr)
+
+    if old != {attr: getattr(show, attr) for attr in old}:
+        _bump_counters(connection, old["venue_id"], old["artist_id"], old["start_time"], -1)
+        _bump_counters(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+
+def refresh_show_counters(venue_ids=None, artist_ids=None, since=None, now=None):
+    """Recompute the materialized num_upcoming_shows / num_past_shows counters.
+
+    ORM writes to Show keep the counters current through the mapper events
+    above; bulk and Core inserts call this for the ids they touched, and a
+    periodic run rolls shows that have started over from upcoming to past.
+    With `since`, only venues and artists with a show starting in
+    (since, now] are recomputed. Returns the number of rows updated.
+    """
+
+    now = now or datetime.now()
+    updated = 0
+
+    for model, fk, ids in ((Venue, Show.venue_id, venue_ids), (Artist, Show.artist_id, artist_ids)):
+        table = model.__table__
+        statement = table.update().values(
+            num_upcoming_shows=show_count(fk == table.c.id, Show.start_time > now),
+            num_past_shows=show_count(fk == table.c.id, Show.start_time <= now),
+        )
+
+        if since is not None:
+            statement = statement.where(table.c.id.in_(
+                select([fk]).where(and_(Show.start_time > since, Show.start_time <= now))))
+        if ids is not None:
+            if not ids:
+                continue
+            statement = statement.where(table.c.id.in_(list(ids)))
+
+        updated += db.session.execute(statement).rowcount
+
+    return updated
+
+
+class City(db.Model):
+
+    __tablename__ = "City"
+    __table_args__ = (
+        db.Index('uq_City_name_state_id', 'name', 'state_id', unique=True),
+        db.Index('ix_City_state_id', 'state_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    state_id = db.Column(db.Integer, db.ForeignKey('State.id'), nullable=False)
+    state = db.relationship('State', back_populates="cities")
+
+    venues = db.relationship('Venue', backref='City', lazy=True)
+    artists = db.relationship('Artist', backref='City', lazy=True)
+
+    @classmethod
+    def get_or_create(cls, session, **kwargs):
+
+        try:
+            return session.query(cls).filter_by(**kwargs).one()
+        except NoResultFound:
+            return cls(**kwargs)
+
+
+class State(db.Model):
+    __tablename__ = "State"
+    __table_args__ = (
+        db.Index('uq_State_name', 'name', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+
+    cities = db.relationship('City', back_populates="state")
+
+    @classmethod
+    def get_or_create(cls, session, **kwargs):
+
+        try:
+            return session.query(cls).filter_by(**kwargs).one()
+        except NoResultFound:
+            return cls(**kwargs)
+
+
+class Job(db.Model):
+    """A unit of background work; the table is the queue (see jobs.py)."""
+
+    __tablename__ = "Job"
+    __table_args__ = (
+        db.Index('ix_Job_status_run_at', 'status', 'run_at'),
+        db.Index('ix_Job_status_finished_at', 'status', 'finished_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # queued -> running -> done, or back to queued for a retry, or failed
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    locked_by = db.Column(db.String(64))
+    locked_at = db.Column(db.DateTime)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+
+class CacheInvalidation(db.Model):
+    """Page-cache tags some process invalidated; every process drops them too (see cache.PageCache)."""
+
+    __tablename__ = "CacheInvalidation"
+    id = db.Column(db.Integer, primary_key=True)
+    tags = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
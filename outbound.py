@@ -0,0 +1,110 @@
+import http.client
+import ipaddress
+import socket
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+# Requests the server makes to links users typed in (image links, for the
+# thumbnail proxy and the link checker) go through open_url(). It only
+# speaks http and https and only talks to public addresses, so a link
+# cannot reach the server's own network: the host is resolved and checked
+# before connecting, every redirect is checked again, and the connected
+# peer is checked once more in case the name resolved differently the
+# second time. Proxies from the environment are not used; through one,
+# the peer is the proxy and the target's address is never seen.
+
+SCHEMES = ("http", "https")
+
+
+class UnsafeURL(ValueError):
+    """A link the server will not fetch: not http(s), or leading to a non-public address."""
+
+
+def is_http_url(url):
+    """Whether `url` is an absolute http or https link with a host."""
+
+    try:
+        parts = urllib.parse.urlsplit(url)
+    except ValueError:
+        return False
+
+    return parts.scheme.lower() in SCHEMES and bool(parts.hostname)
+
+
+def _check_address(address):
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    if not ip.is_global or ip.is_multicast:
+        raise UnsafeURL(f"{address} is not a public address")
+
+
+def check_url(url):
+    """Raise UnsafeURL unless `url` is http(s) and every address its host resolves to is public."""
+
+    if not is_http_url(url):
+        raise UnsafeURL(f"{url!r} is not an http or https link")
+
+    parts = urllib.parse.urlsplit(url)
+    try:
+        port = parts.port or (443 if parts.scheme.lower() == "https" else 80)
+    except ValueError as e:
+        raise UnsafeURL(str(e))
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except OSError as e:
+        # Possibly transient, like any other connection error.
+        raise urllib.error.URLError(e)
+
+    for _, _, _, _, sockaddr in addresses:
+        _check_address(sockaddr[0])
+
+
+class _CheckedHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        super().connect()
+        _check_address(self.sock.getpeername()[0])
+
+
+class _CheckedHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        super().connect()
+        _check_address(self.sock.getpeername()[0])
+
+
+class _HTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_CheckedHTTPConnection, req)
+
+
+class _HTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_CheckedHTTPSConnection, req, context=self._context)
+
+
+class _RedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def _opener():
+    # Built by hand: build_opener() would add the file, ftp, data and proxy handlers.
+    opener = urllib.request.OpenerDirector()
+    for handler in (_HTTPHandler(), _HTTPSHandler(), _RedirectHandler(), urllib.request.HTTPDefaultErrorHandler(),
+                    urllib.request.HTTPErrorProcessor(), urllib.request.UnknownHandler()):
+        opener.add_handler(handler)
+
+    return opener
+
+
+_OPENER = _opener()
+
+
+def open_url(url, timeout, method=None, headers=None):
+    """urlopen() for user-supplied links; raises UnsafeURL for the ones the server must not fetch."""
+
+    check_url(url)
+    return _OPENER.open(urllib.request.Request(url, method=method, headers=headers or {}), timeout=timeout)
@@ -0,0 +1,140 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import current_app, request, url_for
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage(object):
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, columns):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(token)
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise InvalidCursor(token)
+
+    decoded = []
+    for column, value in zip(columns, values):
+        expected = column.type.python_type
+        if expected is datetime:
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise InvalidCursor(token)
+            # Cursors carry stored (naive) times; an offset means a forged one.
+            if value.tzinfo is not None:
+                raise InvalidCursor(token)
+        elif expected is float and type(value) is int:
+            value = float(value)
+        elif type(value) is not expected:
+            # Forged or stale: a null, a list or a string where a number
+            # belongs would otherwise reach the query as a bad parameter.
+            raise InvalidCursor(token)
+        decoded.append(value)
+
+    return decoded
+
+
+def _seek(columns, values, forward):
+    # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y), spelled out so it
+    # works on backends without row-value comparison. The redundant a >= x
+    # gives the planner a range to start the index scan from; without it
+    # the OR is not sargable and every page scans from the first row.
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        step = column > values[i] if forward else column < values[i]
+        clauses.append(and_(*(equal + [step])))
+
+    start = columns[0] >= values[0] if forward else columns[0] <= values[0]
+
+    return and_(start, or_(*clauses))
+
+
+def keyset_paginate(query, columns, per_page, after=None, before=None, key=None):
+    """Return one page of `query` ordered by `columns` (the last one must be unique).
+
+    `after`/`before` are opaque cursors produced by a previous page. `key`
+    extracts the cursor values from a result row; by default the column
+    attributes are read off the entity.
+    """
+
+    if key is None:
+        key = lambda item: [getattr(item, c.key) for c in columns]
+
+    forward = before is None
+    cursor = after if forward else before
+
+    if cursor:
+        query = query.filter(_seek(columns, decode_cursor(cursor, columns), forward))
+
+    order = columns if forward else [c.desc() for c in columns]
+    items = query.order_by(*order).limit(per_page + 1).all()
+
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if forward:
+        has_next, has_prev = has_more, bool(after)
+    else:
+        items.reverse()
+        has_next, has_prev = True, has_more
+
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(key(items[-1])) if items and has_next else None,
+        prev_cursor=encode_cursor(key(items[0])) if items and has_prev else None,
+    )
+
+
+def page_args(config_key, max_key="MAX_PER_PAGE"):
+    """Page size and cursors from the query string, clamped to `max_key`."""
+
+    per_page = request.args.get("per_page", current_app.config[config_key], type=int)
+    per_page = max(1, min(per_page, current_app.config[max_key]))
+
+    return {
+        "per_page": per_page,
+        "after": request.args.get("after"),
+        "before": request.args.get("before"),
+    }
+
+
+def page_url(_external=False, **cursor):
+    """The current view's URL with `cursor` (after=... or before=...) replacing any cursor, other arguments kept."""
+
+    args = request.args.to_dict()
+    args.pop("after", None)
+    args.pop("before", None)
+    args.update(cursor)
+
+    return url_for(request.endpoint, _external=_external, **dict(request.view_args, **args))
@@ -0,0 +1,126 @@
+from datetime import date, timedelta
+
+from extensions import db
+
+
+# Monthly range partitions of "Show" on Postgres. Partitions are named
+# Show_YYYY_MM; rows outside every month land in Show_default.
+PARENT = "Show"
+DEFAULT = "Show_default"
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(month):
+    return f"{PARENT}_{month:%Y_%m}"
+
+
+def months(first, last):
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = next_month(month)
+
+
+def is_partitioned(session=None):
+    session = session or db.session
+    if session.bind.dialect.name != "postgresql":
+        return False
+
+    return session.execute(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:parent)", {"parent": f'"{PARENT}"'}
+    ).scalar() is not None
+
+
+def attached(session=None):
+    """Names of the partitions currently attached to Show."""
+
+    session = session or db.session
+    rows = session.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:parent) ORDER BY c.relname",
+        {"parent": f'"{PARENT}"'},
+    )
+
+    return [name for name, in rows]
+
+
+def create_partition(session, month):
+    """Create the partition for `month`, first moving any of its rows out of the default partition.
+
+    Postgres refuses to add a partition while the default one holds rows
+    that belong to it, so those are detached, moved and re-attached in the
+    same transaction.
+    """
+
+    name, upper = partition_name(month), next_month(month)
+    bounds = {"lower": month, "upper": upper}
+
+    stray = session.execute(
+        f'SELECT 1 FROM "{DEFAULT}" WHERE start_time >= :lower AND start_time < :upper LIMIT 1', bounds
+    ).scalar() is not None
+
+    if stray:
+        session.execute(f'ALTER TABLE "{PARENT}" DETACH PARTITION "{DEFAULT}"')
+
+    session.execute(
+        f'CREATE TABLE "{name}" PARTITION OF "{PARENT}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+    )
+
+    if stray:
+        session.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT}" WHERE start_time >= :lower AND start_time < :upper '
+            f'RETURNING *) INSERT INTO "{PARENT}" SELECT * FROM moved', bounds
+        )
+        session.execute(f'ALTER TABLE "{PARENT}" ATTACH PARTITION "{DEFAULT}" DEFAULT')
+
+    return name
+
+
+def ensure_partitions(ahead=12, today=None, session=None):
+    """Create any missing monthly partition from this month to `ahead` months out; returns their names."""
+
+    session = session or db.session
+    today = today or date.today()
+    existing = set(attached(session))
+
+    last = month_start(today)
+    for _ in range(ahead):
+        last = next_month(last)
+
+    return [create_partition(session, month) for month in months(today, last)
+            if partition_name(month) not in existing]
+
+
+def detach_partitions(before, schema="archive", session=None):
+    """Detach every monthly partition that ends on or before `before` and move it into `schema`.
+
+    The detached tables keep their rows, so history stays queryable as
+    archive."Show_YYYY_MM" while the live calendar no longer pays for it.
+    Returns the names of the detached partitions.
+    """
+
+    session = session or db.session
+    before = month_start(before)
+    session.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+
+    detached = []
+    for name in attached(session):
+        if name == DEFAULT:
+            continue
+        year, month = (int(part) for part in name[len(PARENT) + 1:].split("_"))
+        if next_month(date(year, month, 1)) > before:
+            continue
+
+        session.execute(f'ALTER TABLE "{PARENT}" DETACH PARTITION "{name}"')
+        session.execute(f'ALTER TABLE "{name}" SET SCHEMA "{schema}"')
+        detached.append(name)
+
+    return detached
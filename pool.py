@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+from profiling import percentile
+
+
+def _timed(pool_class, manager):
+    """Subclass `pool_class` so every checkout reports how long it took.
+
+    The time covers waiting for a free slot and, when the pool has to grow,
+    opening the new connection. Pools rebuilt by `recreate()` (after a
+    dispose or a detected disconnect) keep the subclass and so keep
+    reporting.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return pool_class._do_get(self)
+        except exc.TimeoutError:
+            manager._count("timeouts")()
+            raise
+        finally:
+            manager._waited((time.perf_counter() - started) * 1000)
+
+    return type(f"Timed{pool_class.__name__}", (pool_class,), {"_do_get": _do_get})
+
+
+class PoolManager(object):
+    """Engine pool configuration, session teardown and pool statistics.
+
+    Pool settings come from the DATABASE_POOL_* keys. With DATABASE_PGBOUNCER
+    the engine keeps no pool of its own (NullPool): PgBouncer, in transaction
+    mode, does the pooling and every request gets a fresh server-side
+    connection from it. SQLite keeps Flask-SQLAlchemy's defaults.
+
+    Checkouts, overflow and wait times are reported under "pool" in /_metrics.
+    """
+
+    def __init__(self, app=None, db=None):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self._counters = dict.fromkeys(("connects", "checkouts", "checkins", "invalidations", "timeouts"), 0)
+        self._engines = set()
+        self.engine = None
+        self.mode = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """Must run before anything asks `db` for its engine."""
+
+        self._waits = deque(maxlen=app.config.get("PROFILER_SAMPLES", 1000))
+
+        options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+        options.update(self.engine_options(app.config))
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+        app.teardown_appcontext(self._teardown)
+
+        self.watch_engine(db.get_engine(app))
+
+    def engine_options(self, config):
+        url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+
+        if url.drivername.startswith("sqlite"):
+            self.mode = "sqlite"
+            return {}
+
+        if config.get("DATABASE_PGBOUNCER"):
+            self.mode = "pgbouncer"
+            return {"poolclass": _timed(NullPool, self)}
+
+        self.mode = "queue"
+        return {
+            "poolclass": _timed(QueuePool, self),
+            "pool_size": config.get("DATABASE_POOL_SIZE", 5),
+            "max_overflow": config.get("DATABASE_MAX_OVERFLOW", 10),
+            "pool_timeout": config.get("DATABASE_POOL_TIMEOUT", 30),
+            "pool_recycle": config.get("DATABASE_POOL_RECYCLE", -1),
+            "pool_pre_ping": config.get("DATABASE_POOL_PRE_PING", False),
+        }
+
+    def watch_engine(self, engine):
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+        self.engine = engine
+
+        event.listen(engine, "connect", self._count("connects"))
+        event.listen(engine, "checkout", self._count("checkouts"))
+        event.listen(engine, "checkin", self._count("checkins"))
+        event.listen(engine, "invalidate", self._count("invalidations"))
+
+    def _teardown(self, error):
+        # Return the connection at the end of every request or CLI command,
+        # whether or not the view committed; a failed request is rolled back
+        # first so nothing half-done is left on the connection.
+        from extensions import db  # extensions builds the PoolManager, so not at import time
+
+        if error is not None:
+            db.session.rollback()
+        db.session.remove()
+
+    # -- collectors -------------------------------------------------------------
+
+    def _count(self, counter):
+        def listener(*args):
+            with self._lock:
+                self._counters[counter] += 1
+
+        return listener
+
+    def _waited(self, ms):
+        with self._lock:
+            self._waits.append(ms)
+
+    # -- reporting --------------------------------------------------------------
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            waits = sorted(self._waits)
+
+        report = {"mode": self.mode, **counters}
+
+        pool = self.engine.pool if self.engine is not None else None
+        if isinstance(pool, QueuePool):
+            report.update(size=pool.size(), checked_out=pool.checkedout(),
+                          checked_in=pool.checkedin(), overflow=max(0, pool.overflow()))
+
+        report["wait_ms"] = {
+            "mean": round(sum(waits) / len(waits), 3) if waits else None,
+            "p50": percentile(waits, 0.50),
+            "p95": percentile(waits, 0.95),
+            "p99": percentile(waits, 0.99),
+            "max": waits[-1] if waits else None,
+        }
+
+        return report
@@ -0,0 +1,183 @@
+import hmac
+import math
+import threading
+import time
+from collections import deque
+
+from flask import abort, g, has_app_context, jsonify, request
+from flask.signals import before_render_template, signals_available, template_rendered
+from sqlalchemy import event
+
+
+METRICS = ("statements", "db_ms", "render_ms", "total_ms")
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Profiler(object):
+    """Per-request SQL statement count, DB time, template time and total time.
+
+    Figures are attached to each response as a Server-Timing header, kept in
+    a bounded per-endpoint sample window served as JSON from /_metrics, and
+    requests slower than PROFILER_SLOW_REQUEST_MS are logged.
+    """
+
+    def __init__(self, app=None, db=None):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._engines = set()
+        self.sections = {}
+        self.window = 1000
+        self.slow_ms = None
+        self.server_timing = True
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.window = app.config.get("PROFILER_SAMPLES", 1000)
+        self.slow_ms = app.config.get("PROFILER_SLOW_REQUEST_MS")
+        self.server_timing = app.config.get("PROFILER_SERVER_TIMING", True)
+        self.metrics_token = app.config.get("PROFILER_METRICS_TOKEN")
+
+        self.watch_engine(db.get_engine(app))
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+        if signals_available:
+            before_render_template.connect(self._before_render, app)
+            template_rendered.connect(self._after_render, app)
+
+        if app.config.get("PROFILER_METRICS_ENDPOINT", False):
+            app.add_url_rule("/_metrics", "metrics", self.metrics_view)
+
+    def watch_engine(self, engine):
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        event.listen(engine, "handle_error", self._failed_execute)
+
+    # -- collectors -------------------------------------------------------------
+
+    @staticmethod
+    def _current():
+        # Read-pool threads carry their request's profile in their own app context.
+        return g.get("_profile") if has_app_context() else None
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["profile_started"].pop()
+        profile = self._current()
+        if profile is not None:
+            profile["statements"] += 1
+            profile["db_ms"] += (time.perf_counter() - started) * 1000
+
+    def _failed_execute(self, context):
+        if context.connection is not None and context.connection.info.get("profile_started"):
+            context.connection.info["profile_started"].pop()
+
+    def _before_render(self, sender, template, context, **extra):
+        profile = self._current()
+        if profile is not None:
+            profile["rendering"].append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        profile = self._current()
+        if profile is not None and profile["rendering"]:
+            started = profile["rendering"].pop()
+            # Only the outermost render counts; nested ones are inside it.
+            if not profile["rendering"]:
+                profile["render_ms"] += (time.perf_counter() - started) * 1000
+
+    def _before_request(self):
+        g._profile = {"started": time.perf_counter(), "statements": 0, "db_ms": 0.0,
+                      "render_ms": 0.0, "rendering": []}
+
+    def _after_request(self, response):
+        profile = g.pop("_profile", None)
+        if profile is None:
+            return response
+
+        profile["total_ms"] = (time.perf_counter() - profile["started"]) * 1000
+        endpoint = request.endpoint or "<unmatched>"
+
+        if self.server_timing:
+            response.headers.add("Server-Timing", ", ".join([
+                f'db;dur={profile["db_ms"]:.2f};desc="{profile["statements"]} statements"',
+                f'render;dur={profile["render_ms"]:.2f}',
+                f'total;dur={profile["total_ms"]:.2f}',
+            ]))
+
+        if endpoint != "metrics":
+            self.record(endpoint, profile)
+
+        if self.slow_ms is not None and profile["total_ms"] >= self.slow_ms:
+            self.app.logger.warning(
+                "slow request %s %s [%s]: %.1fms total, %.1fms db in %d statements, %.1fms render",
+                request.method, request.full_path, endpoint, profile["total_ms"], profile["db_ms"],
+                profile["statements"], profile["render_ms"])
+
+        return response
+
+    # -- reporting --------------------------------------------------------------
+
+    def record(self, endpoint, profile):
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = {"count": 0, "window": deque(maxlen=self.window)}
+            samples["count"] += 1
+            samples["window"].append(tuple(profile[m] for m in METRICS))
+
+    def snapshot(self):
+        with self._lock:
+            samples = {e: (s["count"], list(s["window"])) for e, s in self._samples.items()}
+
+        report = {}
+        for endpoint, (count, window) in sorted(samples.items()):
+            stats = {"count": count, "window": len(window)}
+            for i, metric in enumerate(METRICS):
+                ordered = sorted(sample[i] for sample in window)
+                stats[metric] = {
+                    "mean": round(sum(ordered) / len(ordered), 3) if ordered else None,
+                    "p50": percentile(ordered, 0.50),
+                    "p95": percentile(ordered, 0.95),
+                    "p99": percentile(ordered, 0.99),
+                    "max": ordered[-1] if ordered else None,
+                }
+            report[endpoint] = stats
+
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def add_section(self, name, snapshot):
+        """Serve `snapshot()` under `name` in /_metrics next to the endpoint figures."""
+
+        self.sections[name] = snapshot
+
+    def metrics_view(self):
+        if self.metrics_token:
+            supplied = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(supplied.encode(), f"Bearer {self.metrics_token}".encode()):
+                abort(404)
+
+        report = {"endpoints": self.snapshot()}
+        for name, snapshot in self.sections.items():
+            report[name] = snapshot()
+
+        return jsonify(report)
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g
+
+from extensions import db
+
+
+class ReadPool(object):
+    """The read path of the listing and search views.
+
+    Two things keep a read from holding a pooled connection longer than
+    its queries take. `release` hands the request's connection back as soon
+    as the rows are loaded, so it is free while the template renders; views
+    call it only once everything the template touches is loaded. `gather`
+    runs independent queries (the venue and artist matches of a show search)
+    side by side on READS_THREADS threads, each in its own app context and
+    so with its own session and connection.
+
+    Flask 1.1 views are synchronous and SQLAlchemy 1.3 has no asyncio
+    engine, so the concurrency comes from threads, the same way the job
+    worker gets it. READS_ASYNC = False restores the plain synchronous path.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.threads = 0
+        self.executor = None
+
+    def init_app(self, app):
+        self.enabled = app.config["READS_ASYNC"]
+
+        # An in-memory SQLite database exists once per connection; other
+        # threads would each see an empty one.
+        url = db.get_engine(app).url
+        threads = app.config["READS_THREADS"] if url.database not in (None, "", ":memory:") else 0
+        if threads != self.threads:
+            self.threads = threads
+            self.executor = ThreadPoolExecutor(threads, thread_name_prefix="read") if threads else None
+
+    def gather(self, *calls):
+        """Run each (function, *args) call and return the results in order.
+
+        All of them run on the pool. The request's own connection is
+        released first: a request holding one connection while its calls
+        wait for more could, with every pooled connection held that way,
+        stall until the pool timeout.
+        """
+
+        if not self.enabled or self.executor is None or len(calls) < 2:
+            return [fn(*args) for fn, *args in calls]
+
+        self.release()
+        app = current_app._get_current_object()
+        profile = g.get("_profile")
+        futures = [self.executor.submit(self._run, app, profile, fn, args) for fn, *args in calls]
+
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def _run(app, profile, fn, args):
+        # The app context's teardown removes this thread's session.
+        with app.app_context():
+            # Statements run here count towards the request that asked for them.
+            g._profile = profile
+            return fn(*args)
+
+    def release(self):
+        """Return the request's connection to the pool; loaded objects stay readable."""
+
+        if self.enabled:
+            db.session.close()
+
+
+read_pool = ReadPool()
@@ -0,0 +1,381 @@
+import heapq
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import event
+
+from extensions import db
+from models import Artist, Venue, artist_genre_association, venue_genre_association
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# What the recommender knows of one venue or artist.
+Profile = namedtuple("Profile", "name genre_ids city_id seeking")
+
+# Whether a venue or artist is looking for the other side, which makes it a better fit.
+SEEKING = {"venue": "seeking_talent", "artist": "seeking_venue"}
+
+SOURCES = {
+    "venue": (Venue, venue_genre_association.c.venue_id, venue_genre_association.c.genre_id),
+    "artist": (Artist, artist_genre_association.c.artist_id, artist_genre_association.c.genre_id),
+}
+
+popcount = getattr(int, "bit_count", None) or (lambda bits: bin(bits).count("1"))
+
+
+class GenreVectors(object):
+    """The genres, city and seeking flag of every venue or every artist, one row each.
+
+    A row's genres are a bitset, bit i standing for the i-th genre in
+    `columns`. With NumPy the bits are mirrored in a 0/1 float32 matrix,
+    so one matrix-vector product gives a query's genre overlap with every
+    row at once; without it the bitsets are scanned in Python. Changes
+    rewrite a single row, and the matrix grows by doubling. A deleted row
+    is emptied rather than removed, and an empty row never matches. Not
+    thread-safe; Recommender holds the lock.
+    """
+
+    def __init__(self, columns):
+        # genre id -> bit, shared by the venue and artist vectors so their rows compare.
+        self.columns = columns
+        self.ids = []
+        self.names = []
+        self.bits = []
+        self.cities = []
+        self.seeking = []
+        self.position = {}
+        self._arrays = None
+
+    def encode(self, genre_ids):
+        bits = 0
+        for genre_id in genre_ids:
+            bit = self.columns.setdefault(genre_id, len(self.columns))
+            bits |= 1 << bit
+
+        return bits
+
+    def set(self, entity_id, profile):
+        bits = self.encode(profile.genre_ids)
+        i = self.position.get(entity_id)
+        if i is None:
+            i = self.position[entity_id] = len(self.ids)
+            for values in (self.ids, self.names, self.bits, self.cities, self.seeking):
+                values.append(None)
+
+        self.ids[i] = entity_id
+        self.names[i] = profile.name
+        self.bits[i] = bits
+        self.cities[i] = profile.city_id
+        self.seeking[i] = bool(profile.seeking)
+        self._write_row(i)
+
+    def remove(self, entity_id):
+        i = self.position.pop(entity_id, None)
+        if i is not None:
+            self.names[i], self.bits[i], self.cities[i], self.seeking[i] = None, 0, None, False
+            self._write_row(i)
+
+    def get(self, entity_id):
+        i = self.position.get(entity_id)
+        return None if i is None else (self.bits[i], self.cities[i])
+
+    # -- NumPy mirror -------------------------------------------------------------
+
+    def _write_row(self, i):
+        arrays = self._arrays
+        if arrays is None:
+            return
+
+        matrix, sizes, cities, seeking = arrays
+        if i >= len(sizes) or len(self.columns) > matrix.shape[1]:
+            # Out of rows or out of genre columns; rebuilt at twice the size when next used.
+            self._arrays = None
+            return
+
+        matrix[i] = self._unpack([self.bits[i]], matrix.shape[1])[0]
+        sizes[i] = popcount(self.bits[i])
+        cities[i] = self.cities[i] if self.cities[i] is not None else -1
+        seeking[i] = self.seeking[i]
+
+    def arrays(self):
+        if self._arrays is None:
+            rows = max(64, 2 * len(self.ids))
+            width = max(64, 2 * len(self.columns))
+            matrix = numpy.zeros((rows, width), dtype=numpy.float32)
+            matrix[:len(self.bits)] = self._unpack(self.bits, width)
+            sizes = numpy.zeros(rows, dtype=numpy.float32)
+            sizes[:len(self.bits)] = [popcount(bits) for bits in self.bits]
+            cities = numpy.full(rows, -1, dtype=numpy.int64)
+            cities[:len(self.cities)] = [-1 if city is None else city for city in self.cities]
+            seeking = numpy.zeros(rows, dtype=bool)
+            seeking[:len(self.seeking)] = self.seeking
+            self._arrays = (matrix, sizes, cities, seeking)
+
+        n = len(self.ids)
+        return tuple(array[:n] for array in self._arrays)
+
+    @staticmethod
+    def _unpack(bits, width):
+        """A 0/1 row of `width` columns per bitset, unpacked 62 bits at a time."""
+
+        matrix = numpy.zeros((len(bits), width), dtype=numpy.float32)
+        for start in range(0, width, 62):
+            span = min(62, width - start)
+            words = numpy.array([(b >> start) & ((1 << span) - 1) for b in bits], dtype=numpy.int64)
+            matrix[:, start:start + span] = (words[:, None] >> numpy.arange(span)) & 1
+
+        return matrix
+
+    # -- scoring ------------------------------------------------------------------
+
+    def top(self, bits, city_id, limit, metric, city_boost, seeking_boost, exclude=None):
+        """Up to `limit` (id, name, score) rows sharing a genre with `bits`, best first.
+
+        The score is the Jaccard or cosine similarity of the genre sets,
+        times 1 + `city_boost` for a row in `city_id` and 1 + `seeking_boost`
+        for a row that is seeking.
+        """
+
+        size = popcount(bits)
+        if not size or not self.ids:
+            return []
+
+        if numpy is not None:
+            scored = self._top_numpy(bits, size, city_id, limit, metric, city_boost, seeking_boost, exclude)
+        else:
+            scored = self._top_python(bits, size, city_id, limit, metric, city_boost, seeking_boost, exclude)
+
+        return [(self.ids[i], self.names[i], round(score, 4)) for score, i in scored]
+
+    def _top_numpy(self, bits, size, city_id, limit, metric, city_boost, seeking_boost, exclude):
+        matrix, sizes, cities, seeking = self.arrays()
+        query = self._unpack([bits], matrix.shape[1])[0]
+
+        # Counts are exact in float32; the scores are float64, as in Python, so ties compare alike.
+        overlap = (matrix @ query).astype(numpy.float64)
+        if metric == "cosine":
+            similarity = overlap / numpy.sqrt(numpy.maximum(sizes, 1) * size)
+        else:
+            similarity = overlap / (sizes + size - overlap)
+        score = similarity * (1 + city_boost * (cities == city_id)) * (1 + seeking_boost * seeking)
+        if exclude is not None and exclude in self.position:
+            score[self.position[exclude]] = 0
+
+        # Everything scoring at least the k-th best, so ties are cut by position as in Python.
+        k = min(limit, len(score))
+        threshold = max(numpy.partition(score, len(score) - k)[len(score) - k], numpy.finfo(score.dtype).tiny)
+        best = numpy.flatnonzero(score >= threshold)
+        best = best[numpy.lexsort((best, -score[best]))][:limit]
+
+        return [(float(score[i]), int(i)) for i in best]
+
+    def _top_python(self, bits, size, city_id, limit, metric, city_boost, seeking_boost, exclude):
+        skip = self.position.get(exclude)
+
+        def scored():
+            for i, row in enumerate(self.bits):
+                overlap = popcount(row & bits)
+                if not overlap or i == skip:
+                    continue
+                if metric == "cosine":
+                    similarity = overlap / (popcount(row) * size) ** 0.5
+                else:
+                    similarity = overlap / popcount(row | bits)
+                if self.cities[i] == city_id:
+                    similarity *= 1 + city_boost
+                if self.seeking[i]:
+                    similarity *= 1 + seeking_boost
+                yield similarity, i
+
+        return heapq.nsmallest(limit, scored(), key=lambda s: (-s[0], s[1]))
+
+
+class Recommender(object):
+    """Similar artists, and venues and artists that fit each other, by shared genres.
+
+    Every venue and artist is a genre vector (see GenreVectors), kept in
+    memory per process and built from the database on first use. Matches
+    are ranked by RECOMMEND_METRIC ("jaccard" or "cosine"). A match in the
+    same city is boosted by RECOMMEND_CITY_BOOST. Across kinds, a venue
+    seeking talent or an artist seeking venues is boosted by
+    RECOMMEND_SEEKING_BOOST.
+
+    The write paths `stage` the profiles they save or delete, and those
+    rows are rewritten when the transaction commits, as with the typeahead
+    index. Other processes' writes arrive with the rebuild every
+    RECOMMEND_TTL seconds. One load runs at a time: the first one has the
+    callers wait for it, and later rebuilds run on a background thread
+    while the old vectors keep answering. Commits that land during a load
+    are replayed onto the new vectors before they are swapped in. NumPy is
+    optional: with it a query over 100k rows is a few milliseconds; without
+    it rows are scanned in Python.
+    """
+
+    def __init__(self):
+        self.limit = 6
+        self.metric = "jaccard"
+        self.city_boost = 0.5
+        self.seeking_boost = 0.25
+        self.ttl = None
+        self.background = False
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()
+        self._vectors = None
+        self._loaded_at = None
+        self._replay = None
+
+    def init_app(self, app):
+        config = app.config
+        self.limit = config["RECOMMEND_LIMIT"]
+        self.metric = config["RECOMMEND_METRIC"]
+        self.city_boost = config["RECOMMEND_CITY_BOOST"]
+        self.seeking_boost = config["RECOMMEND_SEEKING_BOOST"]
+        self.ttl = config.get("RECOMMEND_TTL")
+        # A thread of its own would see an empty in-memory SQLite database.
+        self.background = db.get_engine(app).url.database not in (None, "", ":memory:")
+
+        for name, listener in (("after_commit", self._after_commit),
+                               ("after_transaction_end", self._after_transaction_end)):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+
+    # -- loading ----------------------------------------------------------------
+
+    def _load(self):
+        session = db.session
+        columns = {}
+        vectors = {}
+
+        for kind, (model, fk, genre_id) in SOURCES.items():
+            genres = {}
+            for entity_id, genre in session.query(fk, genre_id):
+                genres.setdefault(entity_id, []).append(genre)
+
+            vectors[kind] = GenreVectors(columns)
+            seeking = getattr(model, SEEKING[kind])
+            for entity_id, name, city_id, seeks in session.query(model.id, model.name, model.city_id, seeking):
+                vectors[kind].set(entity_id, Profile(name, genres.get(entity_id, ()), city_id, seeks))
+
+        return vectors
+
+    def _rebuild(self):
+        """Load fresh vectors and swap them in. Callers hold `_loading`."""
+
+        with self._lock:
+            self._replay = []
+        try:
+            vectors = self._load()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            # Commits applied to the old vectors while loading may be missing from the snapshot.
+            for pending in self._replay:
+                self._apply(vectors, pending)
+            self._vectors, self._loaded_at, self._replay = vectors, time.monotonic(), None
+
+    def _rebuild_in_background(self, app):
+        try:
+            with app.app_context():
+                try:
+                    self._rebuild()
+                except Exception:
+                    app.logger.exception("Could not rebuild the recommendation vectors")
+                    with self._lock:
+                        # Keep the old vectors for another RECOMMEND_TTL rather than retry every request.
+                        self._loaded_at = time.monotonic()
+        finally:
+            self._loading.release()
+
+    def _current(self):
+        vectors = self._vectors
+        if vectors is None:
+            # Nothing to answer with yet: one caller loads, the others wait for it.
+            with self._loading:
+                if self._vectors is None:
+                    self._rebuild()
+            return self._vectors
+
+        if self.ttl and time.monotonic() - self._loaded_at > self.ttl and self._loading.acquire(blocking=False):
+            if self.background:
+                app = current_app._get_current_object()
+                threading.Thread(target=self._rebuild_in_background, args=(app,),
+                                 name="recommend-rebuild", daemon=True).start()
+            else:
+                try:
+                    self._rebuild()
+                finally:
+                    self._loading.release()
+                vectors = self._vectors
+
+        return vectors
+
+    def invalidate(self):
+        with self._lock:
+            self._vectors = None
+
+    # -- keeping current --------------------------------------------------------
+
+    @staticmethod
+    def profile(kind, entity, genre_ids):
+        return Profile(entity.name, genre_ids, entity.city_id, getattr(entity, SEEKING[kind]))
+
+    def stage(self, session, kind, profiles):
+        """Apply `profiles`, {id: Profile, or None for a deleted row}, to the `kind` vectors once `session` commits."""
+
+        session.info.setdefault("recommend_pending", {}).setdefault(kind, {}).update(profiles)
+
+    @staticmethod
+    def _apply(vectors, pending):
+        for kind, profiles in pending.items():
+            for entity_id, profile in profiles.items():
+                if profile is None:
+                    vectors[kind].remove(entity_id)
+                else:
+                    vectors[kind].set(entity_id, profile)
+
+    def _after_commit(self, session):
+        pending = session.info.pop("recommend_pending", None)
+        if not pending:
+            return
+
+        with self._lock:
+            if self._vectors is not None:
+                self._apply(self._vectors, pending)
+            if self._replay is not None:
+                self._replay.append(pending)
+
+    def _after_transaction_end(self, session, transaction):
+        if transaction.parent is None:
+            session.info.pop("recommend_pending", None)
+
+    # -- querying ---------------------------------------------------------------
+
+    def recommend(self, kind, entity_id, target, limit=None):
+        """[(id, name, score), ...] of the `target` kind that best match the `kind` row `entity_id`."""
+
+        limit = self.limit if limit is None else limit
+        if not limit:
+            return []
+
+        vectors = self._current()
+        with self._lock:
+            source = vectors[kind].get(entity_id)
+            if source is None:
+                return []
+
+            bits, city_id = source
+            seeking_boost = self.seeking_boost if target != kind else 0
+            return vectors[target].top(bits, city_id, limit, self.metric, self.city_boost, seeking_boost,
+                                       exclude=entity_id if target == kind else None)
+
+
+recommender = Recommender()
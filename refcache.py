@@ -0,0 +1,229 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import make_transient_to_detached
+
+from extensions import db
+from models import City, Genre, State
+
+
+class ReferenceCache(object):
+    """Process-local name -> id cache for the Genre, State and City tables.
+
+    Ids resolved or inserted inside a transaction are kept on the session
+    and only published to the shared maps once that transaction commits,
+    so a rollback can never leave a dangling id behind. Deleting a
+    reference row, or REFERENCE_CACHE_TTL elapsing, drops the cache.
+    """
+
+    def __init__(self):
+        self.ttl = None
+        self._lock = threading.Lock()
+        self._maps = {"genre": {}, "state": {}, "city": {}}
+        self._loaded_at = time.monotonic()
+
+    def init_app(self, app):
+        self.ttl = app.config.get("REFERENCE_CACHE_TTL")
+
+        for name, listener in (("after_flush", self._after_flush),
+                               ("after_commit", self._after_commit),
+                               ("after_transaction_end", self._after_transaction_end)):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+
+    def invalidate(self):
+        with self._lock:
+            self._maps = {"genre": {}, "state": {}, "city": {}}
+            self._loaded_at = time.monotonic()
+
+    # -- session bookkeeping --------------------------------------------------
+
+    def _pending(self, session):
+        return session.info.setdefault("refcache_pending", {"genre": {}, "state": {}, "city": {}})
+
+    def _after_flush(self, session, flush_context):
+        if any(isinstance(obj, (Genre, State, City)) for obj in session.deleted):
+            session.info["refcache_invalidate"] = True
+
+    def _after_commit(self, session):
+        pending = session.info.pop("refcache_pending", None)
+
+        if session.info.pop("refcache_invalidate", False):
+            self.invalidate()
+        elif pending:
+            with self._lock:
+                for kind, entries in pending.items():
+                    self._maps[kind].update(entries)
+
+    def _after_transaction_end(self, session, transaction):
+        if transaction.parent is not None:
+            return
+
+        # Whatever was not published by after_commit belongs to a transaction
+        # that rolled back or was closed.
+        session.info.pop("refcache_pending", None)
+        session.info.pop("refcache_invalidate", None)
+
+    def _lookup(self, session, kind, key):
+        if self.ttl and time.monotonic() - self._loaded_at > self.ttl:
+            self.invalidate()
+
+        found = self._maps[kind].get(key)
+        if found is None:
+            found = self._pending(session)[kind].get(key)
+
+        return found
+
+    def _remember(self, session, kind, key, value):
+        self._pending(session)[kind][key] = value
+
+    # -- resolution -----------------------------------------------------------
+
+    def genre_ids(self, session, names):
+        """Ids for `names` (order kept, duplicates dropped), creating missing genres.
+
+        Costs no statement when every name is cached, otherwise one SELECT
+        and at most one INSERT for the whole list.
+        """
+
+        names = list(dict.fromkeys(n for n in names if n))
+        ids = {n: self._lookup(session, "genre", n) for n in names}
+        missing = [n for n in names if ids[n] is None]
+        table = Genre.__table__
+
+        if missing:
+            rows = session.query(Genre.id, Genre.name).filter(Genre.name.in_(missing))
+            ids.update({name: id for id, name in rows})
+            missing = [n for n in missing if ids[n] is None]
+
+        if missing:
+            if session.bind.dialect.name == "postgresql":
+                insert = postgresql.insert(table).values([{"name": n} for n in missing]) \
+                    .on_conflict_do_nothing(index_elements=["name"]) \
+                    .returning(table.c.id, table.c.name)
+                ids.update({name: id for id, name in session.execute(insert)})
+                missing = [n for n in missing if ids[n] is None]
+                if missing:
+                    # Lost the race to a concurrent insert; those rows exist now.
+                    rows = session.query(Genre.id, Genre.name).filter(Genre.name.in_(missing))
+                    ids.update({name: id for id, name in rows})
+            else:
+                self._insert_missing(session, table, ["name"], [{"name": n} for n in missing])
+                rows = session.query(Genre.id, Genre.name).filter(Genre.name.in_(missing))
+                ids.update({name: id for id, name in rows})
+
+        for name in names:
+            self._remember(session, "genre", name, ids[name])
+
+        return [ids[n] for n in names]
+
+    def genres(self, session, names):
+        """Genre instances for `names`, attached to `session` without a SELECT when cached."""
+
+        names = list(dict.fromkeys(n for n in names if n))
+
+        result = []
+        for name, id in zip(names, self.genre_ids(session, names)):
+            genre = Genre(id=id, name=name)
+            make_transient_to_detached(genre)
+            result.append(session.merge(genre, load=False))
+
+        return result
+
+    @staticmethod
+    def _insert_missing(session, table, columns, rows):
+        """INSERT `rows`, skipping those a concurrent transaction got in first.
+
+        `columns` are the unique index the rows would collide on: ON
+        CONFLICT DO NOTHING on PostgreSQL, INSERT OR IGNORE on SQLite.
+        """
+
+        dialect = session.bind.dialect.name
+        if dialect == "postgresql":
+            insert = postgresql.insert(table).on_conflict_do_nothing(index_elements=columns)
+        elif dialect == "sqlite":
+            insert = table.insert().prefix_with("OR IGNORE")
+        else:
+            insert = table.insert()
+        session.execute(insert, rows)
+
+    def _select_or_insert(self, session, model, columns, keys):
+        """Map each key tuple of `columns` values to an id, inserting the missing ones.
+
+        One SELECT, plus one executemany INSERT and a second SELECT when
+        something is missing. Rows another save inserted in the meantime
+        are skipped by the INSERT and picked up by the second SELECT.
+        """
+
+        wanted = set(keys)
+        found = {}
+
+        def select(keys):
+            criteria = [getattr(model, c).in_({k[i] for k in keys}) for i, c in enumerate(columns)]
+            for row in session.query(model.id, *[getattr(model, c) for c in columns]).filter(*criteria):
+                if tuple(row[1:]) in wanted:
+                    found[tuple(row[1:])] = row[0]
+
+        select(wanted)
+        missing = [k for k in wanted if k not in found]
+        if missing:
+            self._insert_missing(session, model.__table__, columns, [dict(zip(columns, k)) for k in missing])
+            select(missing)
+
+        return found
+
+    def state_ids(self, session, names):
+        """Bulk variant of state_id; returns {name: id}."""
+
+        ids = {n: self._lookup(session, "state", n) for n in set(names)}
+        missing = [(n,) for n, id in ids.items() if id is None]
+        if missing:
+            for (name,), id in self._select_or_insert(session, State, ["name"], missing).items():
+                ids[name] = id
+                self._remember(session, "state", name, id)
+
+        return ids
+
+    def city_ids(self, session, pairs):
+        """Bulk variant of city_id for (city, state) pairs; returns {(city, state): id}."""
+
+        pairs = set(pairs)
+        states = self.state_ids(session, [state for _, state in pairs])
+        keys = {(city, state): (city, states[state]) for city, state in pairs}
+
+        ids = {pair: self._lookup(session, "city", key) for pair, key in keys.items()}
+        missing = [keys[pair] for pair, id in ids.items() if id is None]
+        if missing:
+            found = self._select_or_insert(session, City, ["name", "state_id"], missing)
+            for pair, key in keys.items():
+                if ids[pair] is None:
+                    ids[pair] = found[key]
+                    self._remember(session, "city", key, found[key])
+
+        return ids
+
+    def _get_or_insert(self, session, model, **values):
+        key = tuple(values.values())
+        return self._select_or_insert(session, model, list(values), [key])[key]
+
+    def state_id(self, session, name):
+        found = self._lookup(session, "state", name)
+        if found is None:
+            found = self._get_or_insert(session, State, name=name)
+            self._remember(session, "state", name, found)
+
+        return found
+
+    def city_id(self, session, name, state_name):
+        state_id = self.state_id(session, state_name)
+        found = self._lookup(session, "city", (name, state_id))
+        if found is None:
+            found = self._get_or_insert(session, City, name=name, state_id=state_id)
+            self._remember(session, "city", (name, state_id), found)
+
+        return found
+
+
+refs = ReferenceCache()
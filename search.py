@@ -0,0 +1,297 @@
+import re
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import and_, case, event, exists, func, literal_column, or_, text
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models import Artist, City, Genre, Show, State, Venue, artist_genre_association, venue_genre_association
+from reads import read_pool
+
+
+def _like_escape(term):
+    """`term` with LIKE wildcards escaped, for patterns passed with escape="\\"."""
+
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class LikeSearch(object):
+    """Portable fallback: ranked ILIKE over name, city, state and genre.
+
+    Subclasses swap in index-backed predicates; the shape of every query
+    (ids only, ranked, limited) stays the same.
+    """
+
+    def __init__(self):
+        self.targets = {
+            "venue": (Venue, venue_genre_association, "venue_id"),
+            "artist": (Artist, artist_genre_association, "artist_id"),
+        }
+        self.limit = 50
+
+    def init_app(self, app):
+        self.limit = app.config.get("SEARCH_RESULT_LIMIT", 50)
+
+    def create_index(self, connection):
+        """Create whatever the backend searches beyond the model tables; nothing here."""
+
+    def _genre_match(self, model, assoc, fk, predicate):
+        return exists().where(and_(assoc.c[fk] == model.id,
+                                   assoc.c.genre_id == Genre.id,
+                                   predicate(Genre.name)))
+
+    def _match(self, model, assoc, fk, term):
+        escaped = _like_escape(term)
+        pattern = f"%{escaped}%"
+        criteria = or_(
+            model.name.ilike(pattern, escape="\\"),
+            City.name.ilike(pattern, escape="\\"),
+            State.name.ilike(escaped, escape="\\"),
+            self._genre_match(model, assoc, fk, lambda name: name.ilike(pattern, escape="\\")),
+        )
+        rank = case([(model.name.ilike(f"{escaped}%", escape="\\"), 0),
+                     (model.name.ilike(pattern, escape="\\"), 1)], else_=2)
+
+        return criteria, rank.asc()
+
+    def match_ids(self, kind, term, limit=None):
+        term = term.strip()
+        if not term:
+            return []
+
+        model, assoc, fk = self.targets[kind]
+        criteria, rank = self._match(model, assoc, fk, term)
+
+        rows = db.session.query(model.id) \
+            .join(City, model.city_id == City.id) \
+            .join(State, City.state_id == State.id) \
+            .filter(criteria) \
+            .order_by(rank, model.name, model.id) \
+            .limit(limit or self.limit).all()
+
+        return [row[0] for row in rows]
+
+    def _named(self, kind, term):
+        model = self.targets[kind][0]
+        ids = self.match_ids(kind, term)
+        if not ids:
+            return []
+
+        names = dict(db.session.query(model.id, model.name).filter(model.id.in_(ids)))
+
+        return [{"id": i, "name": names[i]} for i in ids if i in names]
+
+    def venues(self, term):
+        return self._named("venue", term)
+
+    def artists(self, term):
+        return self._named("artist", term)
+
+    def shows(self, term):
+        # Independent lookups, so they run side by side.
+        venue_ids, artist_ids = read_pool.gather((self.match_ids, "venue", term), (self.match_ids, "artist", term))
+        if not venue_ids and not artist_ids:
+            return []
+
+        return Show.query.options(joinedload(Show.Artist), joinedload(Show.Venue)) \
+            .filter(or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids))) \
+            .order_by(Show.start_time.desc(), Show.id.desc()) \
+            .limit(self.limit).all()
+
+
+class PostgresSearch(LikeSearch):
+    """pg_trgm similarity plus a generated `search_vector` tsvector column.
+
+    Both are created by the search_indexes migration, or by `flask init-db`
+    through create_index(); ILIKE '%term%' is served by the same GIN
+    trigram indexes. A database that has neither (db.create_all() alone)
+    is searched with the plain ILIKE of LikeSearch.
+    """
+
+    create_sql = [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    ] + [
+        f'CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm ON "{table}" USING gin ({column} gin_trgm_ops)'
+        for table, column in (("Venue", "name"), ("Artist", "name"), ("City", "name"), ("Genre", "name"))
+    ] + [
+        statement
+        for table in ("Venue", "Artist")
+        for statement in (
+            f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS search_vector tsvector '
+            f"GENERATED ALWAYS AS (to_tsvector('simple', coalesce(name, ''))) STORED",
+            f'CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON "{table}" USING gin (search_vector)',
+        )
+    ]
+
+    ready_sql = ("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') "
+                 "AND (SELECT count(*) FROM information_schema.columns "
+                 "WHERE table_name IN ('Venue', 'Artist') AND column_name = 'search_vector') = 2")
+
+    def __init__(self):
+        super(PostgresSearch, self).__init__()
+        self._ready = None
+
+    def create_index(self, connection):
+        for statement in self.create_sql:
+            connection.execute(text(statement))
+        self._ready = None
+
+    def ready(self):
+        """Whether pg_trgm and the search_vector columns exist; checked once per process."""
+
+        if self._ready is None:
+            self._ready = bool(db.session.execute(text(self.ready_sql)).scalar())
+            if not self._ready:
+                current_app.logger.warning("pg_trgm or search_vector missing; searching with ILIKE. "
+                                           "Run `flask db upgrade` or `flask init-db`.")
+
+        return self._ready
+
+    def _match(self, model, assoc, fk, term):
+        if not self.ready():
+            return super(PostgresSearch, self)._match(model, assoc, fk, term)
+
+        escaped = _like_escape(term)
+        pattern = f"%{escaped}%"
+        query = func.plainto_tsquery("simple", term)
+        vector = literal_column(f'"{model.__tablename__}".search_vector')
+
+        criteria = or_(
+            model.name.op("%")(term),
+            model.name.ilike(pattern, escape="\\"),
+            vector.op("@@")(query),
+            City.name.op("%")(term),
+            State.name.ilike(escaped, escape="\\"),
+            self._genre_match(model, assoc, fk, lambda name: name.op("%")(term)),
+        )
+        rank = func.greatest(
+            func.similarity(model.name, term),
+            func.ts_rank(vector, query),
+            func.similarity(City.name, term) * 0.5,
+        )
+
+        return criteria, rank.desc()
+
+
+class SqliteFtsSearch(LikeSearch):
+    """FTS5 fallback for local SQLite runs.
+
+    `search_index` holds one row per venue/artist with its name, place and
+    genres; rows are rewritten inside the same transaction whenever a venue
+    or artist is flushed.
+    """
+
+    create_sql = ("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+                  "kind UNINDEXED, ref_id UNINDEXED, name, place, genres, "
+                  "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+
+    def init_app(self, app):
+        super(SqliteFtsSearch, self).init_app(app)
+        if not event.contains(db.session, "after_flush", self._after_flush):
+            event.listen(db.session, "after_flush", self._after_flush)
+
+    def _after_flush(self, session, flush_context):
+        deferred = session.info.get("search_deferred", ())
+        changed = {}
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            for kind, (model, _, _) in self.targets.items():
+                if kind not in deferred and isinstance(obj, model) and obj.id is not None:
+                    changed.setdefault(kind, set()).add(obj.id)
+
+        for kind, ids in changed.items():
+            self.reindex(kind, ids, connection=session.connection())
+
+    def create_index(self, connection):
+        connection.execute(text(self.create_sql))
+
+    def reindex(self, kind, ids=None, connection=None):
+        if ids is not None and not ids:
+            return
+
+        model, assoc, fk = self.targets[kind]
+        table = model.__tablename__
+        connection = connection or db.session.connection()
+        id_list = ",".join(str(int(i)) for i in ids) if ids is not None else None
+
+        connection.execute(text("DELETE FROM search_index WHERE kind = :kind"
+                                + (f" AND ref_id IN ({id_list})" if id_list else "")), kind=kind)
+        connection.execute(text(
+            f'INSERT INTO search_index (kind, ref_id, name, place, genres) '
+            f'SELECT :kind, t.id, t.name, c.name || \' \' || s.name, '
+            f'(SELECT group_concat(g.name, \' \') FROM {assoc.name} a '
+            f'JOIN "Genre" g ON g.id = a.genre_id WHERE a.{fk} = t.id) '
+            f'FROM "{table}" t JOIN "City" c ON c.id = t.city_id '
+            f'JOIN "State" s ON s.id = c.state_id'
+            + (f" WHERE t.id IN ({id_list})" if id_list else "")
+        ), kind=kind)
+
+    def match_ids(self, kind, term, limit=None):
+        tokens = re.findall(r"\w+", term)
+        if not tokens:
+            return []
+
+        rows = db.session.execute(text(
+            "SELECT ref_id FROM search_index WHERE search_index MATCH :query AND kind = :kind "
+            "ORDER BY bm25(search_index, 0.0, 0.0, 10.0, 3.0, 2.0) LIMIT :limit"
+        ), {"query": " ".join(f'"{t}"*' for t in tokens), "kind": kind, "limit": limit or self.limit})
+
+        return [row[0] for row in rows]
+
+
+BACKENDS = {
+    "postgresql": PostgresSearch,
+    "sqlite": SqliteFtsSearch,
+}
+
+
+class Search(object):
+    """Facade over the backend matching the configured database dialect."""
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        backend = BACKENDS.get(db.get_engine(app).dialect.name, LikeSearch)
+        if type(self.backend) is not backend:
+            self.backend = backend()
+        self.backend.init_app(app)
+
+    @property
+    def indexed(self):
+        """True when the backend keeps its own index table (SQLite FTS5)."""
+
+        return isinstance(self.backend, SqliteFtsSearch)
+
+    def create_index(self, connection):
+        self.backend.create_index(connection)
+
+    def reindex(self, kind, ids=None):
+        if self.indexed:
+            self.backend.reindex(kind, ids)
+
+    @contextmanager
+    def deferred(self, session, kind):
+        """Skip the per-flush reindex of `kind` inside the block; the caller reindexes once afterwards."""
+
+        deferred = session.info.setdefault("search_deferred", set())
+        deferred.add(kind)
+        try:
+            yield
+        finally:
+            deferred.discard(kind)
+
+    def venues(self, term):
+        return self.backend.venues(term)
+
+    def artists(self, term):
+        return self.backend.artists(term)
+
+    def shows(self, term):
+        return self.backend.shows(term)
+
+    def match_ids(self, kind, term, limit=None):
+        return self.backend.match_ids(kind, term, limit)
+
+
+search = Search()
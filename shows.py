@@ -0,0 +1,133 @@
+from datetime import date, datetime, time, timedelta
+from itertools import groupby
+
+from flask import Blueprint, abort, flash, redirect, render_template, request, url_for
+from sqlalchemy.orm import joinedload
+
+from extensions import csrf, db, page_cache
+from models import Artist, City, Show, Venue
+from pagination import keyset_paginate, page_args
+from reads import read_pool
+from search import search
+
+
+bp = Blueprint("shows", __name__)
+
+
+@bp.route("/shows")
+@page_cache.cached("shows")
+def shows():
+
+    query = Show.query.options(joinedload(Show.Artist), joinedload(Show.Venue))
+    page = keyset_paginate(query, [Show.start_time, Show.id], **page_args("SHOWS_PER_PAGE"))
+    read_pool.release()
+
+    return render_template("pages/shows.html", shows=page.items, page=page)
+
+
+PERIODS = ("day", "week", "month")
+
+
+def calendar_range(period, day):
+    """[start, end) datetimes of the day, Monday-based week or month containing `day`."""
+
+    if period == "day":
+        start = day
+        end = start + timedelta(days=1)
+    elif period == "week":
+        start = day - timedelta(days=day.weekday())
+        end = start + timedelta(days=7)
+    else:
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+
+    return datetime.combine(start, time()), datetime.combine(end, time())
+
+
+@bp.route("/shows/calendar")
+@page_cache.cached("shows")
+def calendar():
+
+    period = request.args.get("period", "week")
+    if period not in PERIODS:
+        abort(400)
+    try:
+        day = date.fromisoformat(request.args["date"]) if request.args.get("date") else date.today()
+    except ValueError:
+        abort(400)
+    city_id = request.args.get("city", type=int)
+
+    start, end = calendar_range(period, day)
+
+    query = Show.between(start, end, city_id).options(joinedload(Show.Artist), joinedload(Show.Venue))
+    page = keyset_paginate(query, [Show.start_time, Show.id], **page_args("SHOWS_PER_PAGE"))
+
+    return render_template(
+        "pages/calendar.html",
+        days=[(d, list(shows)) for d, shows in groupby(page.items, key=lambda show: show.start_time.date())],
+        page=page,
+        period=period,
+        start=start,
+        end=end,
+        previous=(start - timedelta(days=1)).date(),
+        next=end.date(),
+        city=City.query.options(joinedload(City.state)).get(city_id) if city_id else None,
+        cities=Show.cities_between(start, end),
+    )
+
+
+@bp.route("/shows/create")
+def create_shows():
+    from forms import ShowForm
+
+    # renders form. do not touch.
+    form = ShowForm()
+    return render_template("forms/new_show.html", form=form)
+
+
+@csrf.exempt
+@bp.route("/shows/search", methods=["POST"])
+def search_shows():
+
+    results = search.shows(request.form.get("search_term", ""))
+    read_pool.release()
+
+    response = {
+        "count": len(results),
+        "data": results,
+    }
+
+    return render_template(
+        "pages/show.html",
+        results=response,
+        search_term=request.form.get("search_term", ""),
+    )
+
+
+@bp.route("/shows/create", methods=["POST"])
+def create_show_submission():
+    from forms import ShowForm
+
+    with db.session.no_autoflush:
+
+        form = ShowForm(request.form)
+
+        if request.method == "POST" and form.validate():
+            try:
+                artist = Artist.query.filter_by(id=form.artist_id.data).one()
+                venue = Venue.query.filter_by(id=form.venue_id.data).one()
+
+                show = Show(Artist=artist, Venue=venue, start_time=form.start_time.data)
+
+                db.session.add(show)
+
+                db.session.commit()
+
+                page_cache.invalidate("shows", "venues", f"venue:{venue.id}", f"artist:{artist.id}")
+            except Exception as e:
+                print(e)
+                flash('An error occurred. Show could not be added.')
+                db.session.rollback()
+                return redirect(url_for('shows.create_shows'))
+
+        return redirect(url_for('shows.shows'))
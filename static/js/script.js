@@ -2,3 +2,38 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Suggest names from /api/v1/typeahead in the navbar search boxes as the user types.
+document.querySelectorAll('input[data-typeahead]').forEach(function (input, n) {
+  var kinds = input.dataset.typeahead.split(' ');
+  var list = document.createElement('datalist');
+  var latest = 0;
+
+  list.id = 'typeahead-' + n;
+  input.setAttribute('list', list.id);
+  input.setAttribute('autocomplete', 'off');
+  input.parentNode.appendChild(list);
+
+  input.addEventListener('input', function () {
+    var q = input.value.trim();
+    var request = ++latest;
+    if (!q) {
+      list.innerHTML = '';
+      return;
+    }
+    fetch('/api/v1/typeahead?q=' + encodeURIComponent(q))
+      .then(function (response) { return response.json(); })
+      .then(function (found) {
+        // A slower answer to an earlier keystroke must not replace a newer one.
+        if (request !== latest) return;
+        list.innerHTML = '';
+        kinds.forEach(function (kind) {
+          found[kind].forEach(function (item) {
+            var option = document.createElement('option');
+            option.value = item.name;
+            list.appendChild(option);
+          });
+        });
+      });
+  });
+});
@@ -0,0 +1,106 @@
+import urllib.error
+
+from flask import current_app
+
+from artists import artist_cache_tags
+from extensions import db, page_cache
+from images import image_cache
+from jobs import queue
+from models import Artist, Venue
+from outbound import open_url
+from venues import venue_cache_tags
+from writes import artist_writer, venue_writer
+
+
+# Background jobs run by `flask worker`. Each one may run again if a worker
+# dies before recording the result, so they are written to be repeatable.
+
+ENTITIES = {
+    "venue": (Venue, venue_cache_tags, venue_writer),
+    "artist": (Artist, artist_cache_tags, artist_writer),
+}
+
+
+def _content_type(url, timeout):
+    """Content-Type served at `url`, asking with HEAD first and falling back to a one-byte GET."""
+
+    try:
+        with open_url(url, timeout, method="HEAD") as response:
+            return response.headers.get("Content-Type", "")
+    except urllib.error.HTTPError as e:
+        if e.code not in (403, 405, 501):
+            raise
+
+    with open_url(url, timeout, headers={"Range": "bytes=0-0"}) as response:
+        return response.headers.get("Content-Type", "")
+
+
+@queue.task("check_image_link")
+def check_image_link(kind, entity_id, url):
+    """Clear an image link that does not lead to an image, or render its thumbnails if it does.
+
+    Definite answers (4xx, something other than an image, or a link
+    open_url() refuses to fetch) clear the link if it is still the stored
+    one; timeouts, 5xx and 429 are raised so the job is retried.
+    """
+
+    model, cache_tags, _ = ENTITIES[kind]
+
+    try:
+        broken = not _content_type(url, current_app.config["IMAGE_CHECK_TIMEOUT"]).startswith("image/")
+    except urllib.error.HTTPError as e:
+        if e.code == 429 or e.code >= 500:
+            raise
+        broken = True
+    except ValueError:
+        broken = True
+
+    if not broken:
+        # Have the thumbnails ready before the first page shows them.
+        if image_cache.enabled:
+            image_cache.warm(url)
+        return
+
+    cleared = db.session.query(model).filter(model.id == entity_id, model.image_link == url) \
+        .update({"image_link": None}, synchronize_session=False)
+    db.session.commit()
+
+    if cleared:
+        page_cache.invalidate(*cache_tags(entity_id))
+
+
+def _delete(kind, ids):
+    """Delete the `kind` rows in `ids` that still exist, their shows first, DELETE_SHOWS_BATCH_SIZE per commit."""
+
+    model, cache_tags, writer = ENTITIES[kind]
+    ids = [entity_id for entity_id, in db.session.query(model.id).filter(model.id.in_(ids))]
+    if not ids:
+        return
+
+    tags = cache_tags(*ids)
+    while writer.delete_shows(ids, current_app.config["DELETE_SHOWS_BATCH_SIZE"]):
+        db.session.commit()
+    writer.delete(ids)
+    db.session.commit()
+
+    page_cache.invalidate(*tags)
+
+
+@queue.task("delete_venue")
+def delete_venue(venue_id):
+    _delete("venue", [venue_id])
+
+
+@queue.task("delete_artist")
+def delete_artist(artist_id):
+    _delete("artist", [artist_id])
+
+
+@queue.task("delete_venues")
+def delete_venues(ids):
+    _delete("venue", ids)
+
+
+@queue.task("delete_artists")
+def delete_artists(ids):
+    _delete("artist", ids)
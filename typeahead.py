@@ -0,0 +1,203 @@
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from sqlalchemy import event
+
+from extensions import db
+from models import Artist, City, Genre, State, Venue
+
+
+def normalize(text):
+    """Lower-cased, accents dropped and whitespace collapsed, so "Café  Du" matches "cafe d"."""
+
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+
+    return " ".join(stripped.casefold().split())
+
+
+class PrefixIndex(object):
+    """Names of one kind, searchable by prefix with bisect over sorted keys.
+
+    Each name is filed under its whole normalized form and under the rest
+    of it from every later word on, so "bl" finds "Blue Moon" first and
+    "The Blue Note" after it. Not thread-safe; Typeahead holds the lock.
+    """
+
+    def __init__(self, names=None):
+        self.names = dict(names or {})
+        self.starts = sorted((normalize(name), i) for i, name in self.names.items())
+        self.words = sorted((key, i) for i, name in self.names.items() for key in self._words(name))
+
+    @staticmethod
+    def _words(name):
+        key = normalize(name)
+        return [key[m.start():] for m in re.finditer(r"(?<= )\S", key)]
+
+    def add(self, entity_id, name):
+        if self.names.get(entity_id) == name:
+            return
+
+        self.remove(entity_id)
+        self.names[entity_id] = name
+        insort(self.starts, (normalize(name), entity_id))
+        for key in self._words(name):
+            insort(self.words, (key, entity_id))
+
+    def remove(self, entity_id):
+        name = self.names.pop(entity_id, None)
+        if name is None:
+            return
+
+        self._delete(self.starts, (normalize(name), entity_id))
+        for key in self._words(name):
+            self._delete(self.words, (key, entity_id))
+
+    @staticmethod
+    def _delete(keys, entry):
+        i = bisect_left(keys, entry)
+        if i < len(keys) and keys[i] == entry:
+            del keys[i]
+
+    def search(self, prefix, limit):
+        """Up to `limit` (id, name) pairs: names starting with `prefix`, then names with a word that does."""
+
+        found = []
+        for keys in (self.starts, self.words):
+            i = bisect_left(keys, (prefix,))
+            while i < len(keys) and len(found) < limit and keys[i][0].startswith(prefix):
+                entity_id = keys[i][1]
+                if entity_id not in found:
+                    found.append(entity_id)
+                i += 1
+
+        return [(entity_id, self.names[entity_id]) for entity_id in found]
+
+
+class Typeahead(object):
+    """In-memory prefix indexes of venue, artist, city and genre names for search-as-you-type.
+
+    Built from the database on first use, then kept current by the write
+    paths: they `stage` the names they write or delete on their session,
+    and the change reaches the index when that transaction commits (a
+    rollback drops it). Other processes' writes show up when the index is
+    rebuilt, every TYPEAHEAD_TTL seconds. One rebuild runs at a time, and
+    commits that land while it reads are replayed onto the new index
+    before it is swapped in.
+    """
+
+    kinds = ("venue", "artist", "city", "genre")
+
+    def __init__(self):
+        self.ttl = None
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()
+        self._indexes = None
+        self._loaded_at = None
+        self._replay = None
+
+    def init_app(self, app):
+        self.ttl = app.config.get("TYPEAHEAD_TTL")
+
+        for name, listener in (("after_commit", self._after_commit),
+                               ("after_transaction_end", self._after_transaction_end)):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+
+    # -- loading ----------------------------------------------------------------
+
+    def _load(self):
+        session = db.session
+        cities = session.query(City.id, City.name, State.name).join(State, City.state_id == State.id)
+
+        return {
+            "venue": PrefixIndex(session.query(Venue.id, Venue.name)),
+            "artist": PrefixIndex(session.query(Artist.id, Artist.name)),
+            "city": PrefixIndex((i, f"{city}, {state}") for i, city, state in cities),
+            "genre": PrefixIndex(session.query(Genre.id, Genre.name)),
+        }
+
+    def _stale(self):
+        return self._indexes is None or (self.ttl and time.monotonic() - self._loaded_at > self.ttl)
+
+    def _current(self):
+        if self._stale():
+            # With an index to answer from, a rebuild already under way is not waited for.
+            if self._loading.acquire(blocking=self._indexes is None):
+                try:
+                    if self._stale():
+                        self._rebuild()
+                finally:
+                    self._loading.release()
+
+        return self._indexes
+
+    def _rebuild(self):
+        with self._lock:
+            self._replay = []
+        try:
+            indexes = self._load()
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            # Commits applied to the old index while loading may be missing from the snapshot.
+            for pending in self._replay:
+                self._apply(indexes, pending)
+            self._indexes, self._loaded_at, self._replay = indexes, time.monotonic(), None
+
+    def invalidate(self):
+        with self._lock:
+            self._indexes = None
+
+    # -- keeping current --------------------------------------------------------
+
+    def stage(self, session, kind, names):
+        """Apply `names`, {id: name, or None for a deleted row}, to the `kind` index once `session` commits."""
+
+        session.info.setdefault("typeahead_pending", {}).setdefault(kind, {}).update(names)
+
+    @staticmethod
+    def _apply(indexes, pending):
+        for kind, names in pending.items():
+            for entity_id, name in names.items():
+                if name is None:
+                    indexes[kind].remove(entity_id)
+                else:
+                    indexes[kind].add(entity_id, name)
+
+    def _after_commit(self, session):
+        pending = session.info.pop("typeahead_pending", None)
+        if not pending:
+            return
+
+        with self._lock:
+            if self._indexes is not None:
+                self._apply(self._indexes, pending)
+            if self._replay is not None:
+                self._replay.append(pending)
+
+    def _after_transaction_end(self, session, transaction):
+        if transaction.parent is None:
+            session.info.pop("typeahead_pending", None)
+
+    # -- searching --------------------------------------------------------------
+
+    def search(self, prefix, limit):
+        """{kind: [(id, name), ...]} for each kind, at most `limit` apiece."""
+
+        prefix = normalize(prefix)
+        if not prefix:
+            return {kind: [] for kind in self.kinds}
+
+        indexes = self._current()
+        with self._lock:
+            return {kind: indexes[kind].search(prefix, limit) for kind in self.kinds}
+
+
+typeahead = Typeahead()
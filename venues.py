@@ -0,0 +1,191 @@
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, url_for
+from sqlalchemy.orm.exc import NoResultFound
+
+from archive import older_cursor, past_shows
+from extensions import csrf, db, page_cache
+from jobs import queue
+from models import Show, Venue
+from pagination import page_args
+from reads import read_pool
+from recommend import recommender
+from search import search
+from writes import venue_writer
+
+
+bp = Blueprint("venues", __name__)
+
+
+def venue_cache_tags(*venue_ids):
+    """Page-cache tags touched by a change to these venues, including artists who played there."""
+
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id.in_(venue_ids)).distinct()
+
+    return ["venues", "shows"] + [f"venue:{i}" for i in venue_ids] + [f"artist:{a}" for a, in artist_ids]
+
+
+@bp.route("/venues")
+@page_cache.cached("venues")
+def venues():
+
+    page = Venue.directory(**page_args("VENUES_PER_PAGE"))
+    read_pool.release()
+
+    return render_template("pages/venues.html", areas=page.items, page=page)
+
+
+@bp.route("/venues/search", methods=["POST"])
+def search_venues():
+
+    results = search.venues(request.form.get("search_term", ""))
+    read_pool.release()
+
+    response = {
+        "count": len(results),
+        "data": results,
+    }
+
+    return render_template(
+        "pages/search_venues.html",
+        results=response,
+        search_term=request.form.get("search_term", ""),
+    )
+
+
+@bp.route("/venues/<int:venue_id>", methods=["GET"])
+@page_cache.cached("venue:{venue_id}", timeout="RECOMMEND_PAGE_CACHE_TIMEOUT")
+def show_venue(venue_id):
+
+    try:
+        venue, shows = Venue.get_with_shows(venue_id, current_app.config["DETAIL_PAST_SHOWS"])
+    except NoResultFound:
+        abort(404)
+
+    older = older_cursor(shows["past_shows"]) if shows["has_older"] else None
+
+    recommended = [
+        ("Artists that fit", "artists", recommender.recommend("venue", venue_id, "artist")),
+        ("Similar venues", "venues", recommender.recommend("venue", venue_id, "venue")),
+    ]
+
+    return render_template("pages/show_venue.html", venue=venue, older=older, recommended=recommended, **shows)
+
+
+@bp.route("/venues/<int:venue_id>/shows/past")
+@page_cache.cached("venue:{venue_id}")
+def venue_past_shows(venue_id):
+
+    venue = Venue.query.get_or_404(venue_id)
+    page = past_shows("venue_id", venue_id, **page_args("SHOWS_PER_PAGE"))
+    read_pool.release()
+
+    return render_template("pages/past_shows.html", name=venue.name, kind="venue", page=page,
+                           back=url_for("venues.show_venue", venue_id=venue_id))
+
+
+@bp.route("/venues/create", methods=["GET"])
+@csrf.exempt
+def create_venue_form():
+    from forms import VenueForm
+
+    form = VenueForm()
+    return render_template("forms/new_venue.html", form=form)
+
+
+@bp.route("/venues/create", methods=["POST"])
+def create_venue_submission():
+    from forms import VenueForm
+
+    with db.session.no_autoflush:
+
+        form = VenueForm(request.form)
+
+        if request.method == "POST" and form.validate():
+            try:
+                venue_id, _ = venue_writer.save([(None, form)])[0]
+                db.session.commit()
+
+                page_cache.invalidate(*venue_cache_tags(venue_id))
+            except:
+                flash('An error occurred. Venue '+ form.name.data + ' could not be listed.')
+                db.session.rollback()
+                return redirect(url_for('venues.create_venue_submission'))
+
+        return redirect(url_for('venues.venues'))
+
+
+@csrf.exempt
+@bp.route("/venues/<int:venue_id>", methods=['DELETE'])
+def delete_venue(venue_id):
+
+    if db.session.query(Venue.id).filter(Venue.id == venue_id).scalar() is None:
+        abort(404)
+
+    # The shows go with it, which can be slow; the worker does the delete. The
+    # caches and indexes of this process are cleared now, the worker only reaches its own.
+    try:
+        queue.enqueue("delete_venue", venue_id=venue_id)
+        venue_writer.unlist([venue_id])
+        tags = venue_cache_tags(venue_id)
+        db.session.commit()
+    except Exception as e:
+        print(f'Error ==> {e}')
+        flash('An error occurred. Venue could not be deleted.')
+        db.session.rollback()
+        abort(400)
+
+    page_cache.invalidate(*tags)
+    return "Accepted", 202
+
+
+@bp.route("/venues/<int:venue_id>/edit", methods=["GET"])
+def edit_venue(venue_id):
+    from forms import VenueForm
+
+    with db.session.no_autoflush:
+
+        try:
+
+            venue = Venue.query.filter_by(id=venue_id).one()
+            v = {
+                "id": venue.id,
+                "name": venue.name,
+                "city": venue.city.name,
+                "states": venue.city.state.name,
+                "genres": [g.name for g in venue.genres],
+                "phone": venue.phone,
+                "address": venue.address,
+                "facebook_link": venue.facebook_link,
+                "image_link": venue.image_link,
+                "seeking_talent": venue.seeking_talent,
+                "seeking_talent_description":  venue.seeking_description
+            }
+            form = VenueForm(data=v)
+            return render_template("forms/edit_venue.html", form=form, venue=v)
+        except:
+            flash('No Venue Found')
+            return redirect(url_for('venues.venues'))
+
+
+@bp.route("/venues/<int:venue_id>/edit", methods=["POST"])
+def edit_venue_submission(venue_id):
+    from forms import VenueForm
+
+    with db.session.no_autoflush:
+
+        form = VenueForm(request.form)
+
+        if request.method == "POST" and form.validate():
+            try:
+                venue_writer.save([(venue_id, form)])
+                db.session.commit()
+
+                page_cache.invalidate(*venue_cache_tags(venue_id))
+            except NoResultFound:
+                db.session.rollback()
+                abort(404)
+            except:
+                flash('An error occurred. Venue '+ form.name.data + ' could not be listed.')
+                db.session.rollback()
+                return redirect(url_for('venues.create_venue_submission'))
+
+        return redirect(url_for("venues.show_venue", venue_id=venue_id))
@@ -0,0 +1,200 @@
+from collections import namedtuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm.exc import NoResultFound
+
+from extensions import db
+from jobs import queue
+from models import (ArchivedShow, Artist, Show, Venue, artist_genre_association, refresh_show_counters,
+                    venue_genre_association)
+from recommend import recommender
+from refcache import refs
+from search import search
+from typeahead import typeahead
+
+
+Saved = namedtuple("Saved", "id created")
+
+
+class EntityWriter(object):
+    """Creates and updates venues or artists from validated forms.
+
+    A batch costs the same handful of statements whether it holds one form
+    or a thousand: the city and genre references are resolved in
+    bulk through the reference cache, the target rows are loaded with one
+    SELECT, the rows are written in a single flush, and the genre links are
+    diffed against what is stored so only the links that were added or
+    removed are written. New or changed image links get a check_image_link
+    job, and the names and genres written reach the typeahead index and
+    the recommender on commit. Deletes are set-based the same way. Nothing
+    is committed; the caller owns the transaction.
+    """
+
+    def __init__(self, kind, model, assoc, fk, columns):
+        self.kind = kind
+        self.model = model
+        self.assoc = assoc
+        self.fk = assoc.c[fk]
+        self.genre_id = assoc.c.genre_id
+        shows = Show.__table__.c
+        self.show_fk = shows[fk]
+        # The show's other side, whose counters a delete changes.
+        self.show_other = shows.artist_id if fk == "venue_id" else shows.venue_id
+        # model attribute -> form field, besides name, city/state and genres
+        self.columns = columns
+
+    def save(self, items, session=None):
+        """Write `items`, a list of (entity id or None, validated form); return a Saved per item, in order.
+
+        An id updates that row and raises NoResultFound when it does not
+        exist. Without an id the form's name is looked up first, so
+        resubmitting a name updates the existing row instead of adding a
+        duplicate.
+        """
+
+        session = session or db.session
+        model = self.model
+
+        with session.no_autoflush:
+            cities = refs.city_ids(session, {(form.city.data, form.states.data) for _, form in items})
+            names = list(dict.fromkeys(n for _, form in items for n in form.genres.data if n))
+            genre_ids = dict(zip(names, refs.genre_ids(session, names)))
+
+            ids = {entity_id for entity_id, _ in items if entity_id is not None}
+            by_name = {form.name.data for entity_id, form in items if entity_id is None}
+            criteria = ([model.id.in_(ids)] if ids else []) + ([model.name.in_(by_name)] if by_name else [])
+            existing = session.query(model).filter(or_(*criteria)).all() if criteria else []
+
+            found = {entity.id: entity for entity in existing}
+            named = {entity.name: entity for entity in existing if entity.name in by_name}
+            missing = sorted(ids - set(found))
+            if missing:
+                raise NoResultFound(f"{model.__tablename__} {', '.join(map(str, missing))} not found")
+
+            saved = []
+            for entity_id, form in items:
+                entity = found[entity_id] if entity_id is not None else named.get(form.name.data)
+                if entity is None:
+                    entity = named[form.name.data] = model()
+                    session.add(entity)
+
+                saved.append((entity, entity.id is None, form, entity.image_link))
+                entity.name = form.name.data
+                entity.city_id = cities[(form.city.data, form.states.data)]
+                for column, field in self.columns.items():
+                    setattr(entity, column, getattr(form, field).data)
+
+            with search.deferred(session, self.kind):
+                session.flush()
+
+            wanted = {entity.id: {genre_ids[n] for n in form.genres.data if n} for entity, _, form, _ in saved}
+            self._link_genres(session, wanted, {entity.id: entity for entity in existing})
+            search.reindex(self.kind, list(wanted))
+
+            typeahead.stage(session, self.kind, {entity.id: entity.name for entity, _, _, _ in saved})
+            recommender.stage(session, self.kind, {
+                entity.id: recommender.profile(self.kind, entity, wanted[entity.id]) for entity, _, _, _ in saved
+            })
+            typeahead.stage(session, "city", {i: f"{city}, {state}" for (city, state), i in cities.items()})
+            typeahead.stage(session, "genre", {i: name for name, i in genre_ids.items()})
+
+            # New or changed image links are checked in the background.
+            queue.enqueue_many("check_image_link", [
+                {"kind": self.kind, "entity_id": entity.id, "url": entity.image_link}
+                for entity, _, _, previous in saved if entity.image_link and entity.image_link != previous
+            ], session=session)
+
+        return [Saved(entity.id, created) for entity, created, _, _ in saved]
+
+    def delete_shows(self, ids, limit, session=None):
+        """Delete up to `limit` shows of the rows in `ids`; return how many went.
+
+        Called until it returns 0 with a commit after each call, a large
+        delete holds its row locks one batch at a time. The batch is the
+        lowest show ids, so the DELETE takes the id range rather than a
+        parameter per show. The show counters of both sides are recomputed
+        for the rows touched.
+        """
+
+        session = session or db.session
+        shows = session.query(Show.id, self.show_other).filter(self.show_fk.in_(ids)) \
+            .order_by(Show.id).limit(limit).all()
+        if not shows:
+            return 0
+
+        session.execute(Show.__table__.delete().where(and_(self.show_fk.in_(ids), Show.id <= shows[-1][0])))
+        refresh_show_counters(**{f"{self.show_fk.name}s": ids,
+                                 f"{self.show_other.name}s": {other for _, other in shows}})
+
+        return len(shows)
+
+    def delete(self, ids, session=None):
+        """Delete the rows in `ids` with any shows left, archived shows and genre links, a statement per table.
+
+        The database would cascade to the shows and links on PostgreSQL,
+        but the counters of the other side need the show ids, and SQLite
+        only enforces foreign keys when asked to; both are deleted here.
+        """
+
+        session = session or db.session
+        table = self.model.__table__
+        ids = list(ids)
+
+        self.delete_shows(ids, None, session)
+        archived = ArchivedShow.__table__
+        session.execute(archived.delete().where(archived.c[self.show_fk.name].in_(ids)))
+        session.execute(self.assoc.delete().where(self.fk.in_(ids)))
+        session.execute(table.delete().where(table.c.id.in_(ids)))
+
+        # No flush events for Core deletes; reindexing ids that are gone drops their entries.
+        search.reindex(self.kind, ids)
+        self.unlist(ids, session)
+
+    def unlist(self, ids, session=None):
+        """Drop `ids` from the typeahead and recommender indexes when `session` commits.
+
+        The indexes are per process. delete() runs in the worker, so the
+        web request that queues a delete calls this too, and the process
+        that took the request stops suggesting the rows straight away.
+        """
+
+        session = session or db.session
+        typeahead.stage(session, self.kind, dict.fromkeys(ids))
+        recommender.stage(session, self.kind, dict.fromkeys(ids))
+
+    def _link_genres(self, session, wanted, stored):
+        """Bring the genre links of the saved rows to `wanted`, touching only the links that changed.
+
+        `stored` maps the ids of rows that existed before this write to
+        their instances; new rows have no links to compare against.
+        """
+
+        current = {entity_id: set() for entity_id in wanted}
+        if stored:
+            for entity_id, genre_id in session.query(self.fk, self.genre_id).filter(self.fk.in_(stored)):
+                current[entity_id].add(genre_id)
+
+        removed = {i: current[i] - wanted[i] for i in wanted if current[i] - wanted[i]}
+        added = [{self.fk.name: i, "genre_id": g} for i in wanted for g in sorted(wanted[i] - current[i])]
+
+        if removed:
+            session.execute(self.assoc.delete().where(or_(*[
+                and_(self.fk == entity_id, self.genre_id.in_(genres)) for entity_id, genres in removed.items()
+            ])))
+        if added:
+            session.execute(self.assoc.insert(), added)
+
+        # The links were written behind the ORM's back.
+        for entity_id in (set(removed) | {row[self.fk.name] for row in added}) & set(stored):
+            session.expire(stored[entity_id], ["genres"])
+
+
+venue_writer = EntityWriter("venue", Venue, venue_genre_association, "venue_id", {
+    "address": "address", "phone": "phone", "image_link": "image_link", "facebook_link": "facebook_link",
+    "seeking_talent": "seeking_talent", "seeking_description": "seeking_talent_description",
+})
+
+artist_writer = EntityWriter("artist", Artist, artist_genre_association, "artist_id", {
+    "phone": "phone", "website": "website_link", "image_link": "image_link", "facebook_link": "facebook_link",
+    "seeking_venue": "seeking_venue", "seeking_description": "seeking_description",
+})